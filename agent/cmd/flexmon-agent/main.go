@@ -2,8 +2,11 @@ package main
 
 import (
 	"bytes"
+	"compress/gzip"
 	"context"
+	"crypto/rand"
 	"crypto/tls"
+	"encoding/hex"
 	"encoding/json"
 	"fmt"
 	"log"
@@ -12,6 +15,7 @@ import (
 	"net/http"
 	"os"
 	"runtime"
+	"strconv"
 	"strings"
 	"time"
 
@@ -619,15 +623,21 @@ func sendMetricsWithBackoff(config Config, metrics []map[string]interface{}) err
 		log.Printf("XMPP send failed: %v, falling back to HTTP\n", err)
 	}
 
-	// HTTP fallback with exponential backoff
+	// HTTP fallback with exponential backoff; every attempt carries the same
+	// batch ID so the API acknowledges a retried batch without storing it twice
+	batchID := newBatchID()
 	for attempt := 0; attempt < 3; attempt++ {
-		err = sendMetricsHTTP(config, metrics)
+		err = sendMetricsHTTP(config, metrics, batchID)
 		if err == nil {
 			return nil
 		}
 
 		if attempt < 2 {
 			waitSec := int(math.Min(float64(backoffSec), MaxBackoff))
+			// Honour the API's backpressure hint when it sheds load
+			if throttled, ok := err.(*throttledError); ok && throttled.retryAfter > waitSec {
+				waitSec = int(math.Min(float64(throttled.retryAfter), MaxBackoff))
+			}
 			log.Printf("Send failed (attempt %d/3), retrying in %ds: %v\n", attempt+1, waitSec, err)
 			time.Sleep(time.Duration(waitSec) * time.Second)
 			backoffSec *= 2
@@ -659,24 +669,38 @@ func sendMetricsViaXMPP(config Config, metrics []map[string]interface{}) error {
 	return xmppClient.Send(&message)
 }
 
-func sendMetricsHTTP(config Config, metrics []map[string]interface{}) error {
-	// Convert to NDJSON
+func newBatchID() string {
+	b := make([]byte, 16)
+	if _, err := rand.Read(b); err != nil {
+		return fmt.Sprintf("%d", time.Now().UnixNano())
+	}
+	return hex.EncodeToString(b)
+}
+
+func sendMetricsHTTP(config Config, metrics []map[string]interface{}, batchID string) error {
+	// Convert to gzip-compressed NDJSON
 	var buf bytes.Buffer
+	gz := gzip.NewWriter(&buf)
 	for _, metric := range metrics {
 		b, _ := json.Marshal(metric)
-		buf.Write(b)
-		buf.WriteString("\n")
+		gz.Write(b)
+		gz.Write([]byte("\n"))
+	}
+	if err := gz.Close(); err != nil {
+		return err
 	}
 
-	// Send to API
+	// Send to API; partial=true keeps one malformed record from failing (and re-sending) the whole batch
 	req, err := http.NewRequest("POST",
-		config.APIEndpoint+"/v1/ingest/metrics/batch",
+		config.APIEndpoint+"/v1/ingest/metrics/batch?partial=true",
 		&buf)
 	if err != nil {
 		return err
 	}
 
 	req.Header.Set("Content-Type", "application/x-ndjson")
+	req.Header.Set("Content-Encoding", "gzip")
+	req.Header.Set("Idempotency-Key", batchID)
 	if config.AgentToken != "" {
 		req.Header.Set("Authorization", "Bearer "+config.AgentToken)
 	}
@@ -688,13 +712,38 @@ func sendMetricsHTTP(config Config, metrics []map[string]interface{}) error {
 	}
 	defer resp.Body.Close()
 
+	if resp.StatusCode == http.StatusTooManyRequests {
+		retryAfter, _ := strconv.Atoi(resp.Header.Get("Retry-After"))
+		return &throttledError{retryAfter: retryAfter}
+	}
+
 	if resp.StatusCode != http.StatusOK {
 		return fmt.Errorf("API returned status %d", resp.StatusCode)
 	}
 
+	// Rejected records are not retried; report them so the collector can be fixed
+	var result struct {
+		Errors *struct {
+			Rejected int            `json:"rejected"`
+			Reasons  map[string]int `json:"reasons"`
+		} `json:"errors"`
+	}
+	if err := json.NewDecoder(resp.Body).Decode(&result); err == nil && result.Errors != nil && result.Errors.Rejected > 0 {
+		log.Printf("Warning: API rejected %d of %d records: %v\n", result.Errors.Rejected, len(metrics), result.Errors.Reasons)
+	}
+
 	return nil
 }
 
+// throttledError is returned when the API sheds ingest load (429 + Retry-After)
+type throttledError struct {
+	retryAfter int
+}
+
+func (e *throttledError) Error() string {
+	return fmt.Sprintf("API overloaded, retry after %ds", e.retryAfter)
+}
+
 func sendAgentLogs(config Config) {
 	// Create sample agent log entry
 	logEntry := LogEntry{
@@ -0,0 +1,110 @@
+"""
+Micro-benchmark: NDJSON metric record decoding
+Compares the previous json.loads + dict.get row building against the precompiled
+msgspec schemas in services/metrics_codec.py, using infra/seed/demo/demo_metrics.ndjson
+
+Usage (from backend/api):
+    python benchmarks/bench_decode.py [--records 3000] [--rounds 20]
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+API_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(API_ROOT))
+
+from src.services import metrics_codec  # noqa: E402
+
+DEMO_METRICS = API_ROOT.parents[1] / "infra" / "seed" / "demo" / "demo_metrics.ndjson"
+
+
+def _legacy_timestamp(value):
+    if value is None:
+        return datetime.utcnow()
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+# Field lists of the dict-based row builders this benchmark compares against
+_LEGACY_FIELDS = {
+    "cpu": ("cpu_percent", "cpu_user", "cpu_system", "cpu_idle", "cpu_iowait"),
+    "memory": ("memory_total", "memory_used", "memory_free", "memory_percent",
+               "swap_total", "swap_used", "swap_free", "swap_percent"),
+    "disk": ("device", "mountpoint", "total", "used", "free", "percent"),
+    "network": ("interface", "bytes_sent", "bytes_recv", "packets_sent", "packets_recv",
+                "errors_in", "errors_out", "drops_in", "drops_out"),
+    "process": ("pid", "name", "cpu_percent", "memory_percent", "status", "username"),
+}
+
+
+def decode_legacy(lines):
+    """json.loads into dicts, then m.get(...) per column"""
+    rows = []
+    for line in lines:
+        m = json.loads(line)
+        fields = _LEGACY_FIELDS.get(m.get("metric_type"))
+        if fields is None:
+            continue
+        rows.append(
+            (_legacy_timestamp(m.get("timestamp")), m["tenant_id"], m["host"])
+            + tuple(m.get(f) for f in fields)
+        )
+    return rows
+
+
+def decode_typed(lines):
+    """Typed structs and precompiled row extractors"""
+    rows = []
+    for line in lines:
+        schema, record = metrics_codec.decode_record(line)
+        if schema is not None:
+            rows.append(schema.to_row(record))
+    return rows
+
+
+def load_batch(records: int):
+    """Build a batch of the requested size by cycling the demo records over many hosts"""
+    seed = [line for line in DEMO_METRICS.read_bytes().splitlines() if line.strip()]
+    batch = []
+    for i in range(records):
+        record = json.loads(seed[i % len(seed)])
+        record["host"] = f"server-{i % 500:03d}"
+        batch.append(json.dumps(record, separators=(",", ":")).encode())
+    return batch
+
+
+def bench(fn, lines, rounds: int) -> float:
+    """Best-of-N records/sec"""
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn(lines)
+        best = min(best, time.perf_counter() - started)
+    return len(lines) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=3000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    lines = load_batch(args.records)
+    assert decode_legacy(lines) == decode_typed(lines)
+
+    before = bench(decode_legacy, lines, args.rounds)
+    after = bench(decode_typed, lines, args.rounds)
+
+    print(f"records per batch: {len(lines)}")
+    print(f"before (json + dict.get): {before:12,.0f} records/sec")
+    print(f"after  (msgspec schemas): {after:12,.0f} records/sec")
+    print(f"speedup:                  {after / before:12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
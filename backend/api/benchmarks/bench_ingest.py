@@ -0,0 +1,385 @@
+"""
+End-to-end benchmark: /v1/ingest/metrics/batch throughput
+Drives a running API backed by a local TimescaleDB (e.g. `make up` in infra/, or just the
+timescaledb and api services) with payloads generated from
+infra/seed/demo/demo_metrics.ndjson, over a matrix of batch size, metric-type mix, host
+count and concurrency. Reports records/sec, p50/p99 request latency and DB CPU (read from
+the database container's cgroup) per scenario, and saves the results as JSON.
+
+With the write-behind buffer enabled, records/sec measures accepted (buffered) rows; run
+the API with INGEST_BUFFER_ENABLED=false to measure rows committed to the database.
+
+Usage (from backend/api):
+    python benchmarks/bench_ingest.py --token $TOKEN --tenant demo
+    python benchmarks/bench_ingest.py --mint-token --tenant demo \\
+        --batch-sizes 500,3000 --mixes host,processes --hosts 10,1000 --concurrency 1,8
+    python benchmarks/bench_ingest.py --compare results/ingest-before.json results/ingest-after.json
+
+--mint-token signs a token with this machine's API_SECRET_KEY, which must match the API's.
+"""
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+API_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(API_ROOT))
+
+from src.version import VERSION_INFO  # noqa: E402
+
+DEMO_METRICS = API_ROOT.parents[1] / "infra" / "seed" / "demo" / "demo_metrics.ndjson"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+INGEST_PATH = "/v1/ingest/metrics/batch"
+
+# Records per host per collection cycle, by metric type
+MIXES: Dict[str, Dict[str, int]] = {
+    "host": {"cpu": 1, "memory": 1, "disk": 2, "network": 2},
+    "processes": {"cpu": 1, "memory": 1, "disk": 2, "network": 2, "process": 30},
+    "cpu": {"cpu": 1},
+    "network": {"network": 4},
+}
+
+# The demo seed has no process records; shaped like the agent's
+_PROCESS_TEMPLATE = {
+    "metric_type": "process", "pid": 1, "name": "postgres", "cpu_percent": 1.5,
+    "memory_percent": 0.8, "status": "sleeping", "username": "postgres",
+}
+
+
+def _load_templates() -> Dict[str, dict]:
+    """First demo record of each metric type, stripped of its identity fields"""
+    templates = {"process": dict(_PROCESS_TEMPLATE)}
+    for line in DEMO_METRICS.read_bytes().splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        templates.setdefault(record["metric_type"], record)
+    for record in templates.values():
+        for key in ("timestamp", "tenant_id", "host"):
+            record.pop(key, None)
+    return templates
+
+
+def generate_records(
+    tenant_id: str,
+    hosts: int,
+    mix: Dict[str, int],
+    start: datetime,
+    interval_sec: int = 10
+) -> Iterator[dict]:
+    """
+    Endless stream of agent-like records: every collection cycle each host reports the
+    mix (e.g. 2 disks, 30 processes), with jittered gauges and growing network counters
+    """
+    templates = _load_templates()
+    rng = random.Random(42)
+    for cycle in itertools.count():
+        timestamp = (start + timedelta(seconds=cycle * interval_sec)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for host_index in range(hosts):
+            host = f"bench-{host_index:05d}"
+            for metric_type, count in mix.items():
+                for n in range(count):
+                    record = dict(templates[metric_type])
+                    record.update(metric_type=metric_type, timestamp=timestamp, tenant_id=tenant_id, host=host)
+                    _vary(record, metric_type, n, cycle, rng)
+                    yield record
+
+
+def _vary(record: dict, metric_type: str, n: int, cycle: int, rng: random.Random):
+    if metric_type == "cpu":
+        record["cpu_percent"] = round(rng.uniform(1, 99), 1)
+    elif metric_type == "memory":
+        record["memory_percent"] = round(rng.uniform(20, 90), 1)
+    elif metric_type == "disk":
+        record["device"] = f"/dev/sd{chr(ord('a') + n)}1"
+        record["mountpoint"] = "/" if n == 0 else f"/data{n}"
+        record["percent"] = round(rng.uniform(10, 95), 1)
+    elif metric_type == "network":
+        record["interface"] = f"eth{n}"
+        for counter in ("bytes_sent", "bytes_recv", "packets_sent", "packets_recv"):
+            record[counter] = record[counter] + cycle * rng.randint(1000, 100000)
+    elif metric_type == "process":
+        record["pid"] = 1000 + n
+        record["name"] = f"proc-{n:03d}"
+        record["cpu_percent"] = round(rng.uniform(0, 25), 2)
+        record["memory_percent"] = round(rng.uniform(0, 5), 2)
+
+
+def build_payloads(records: Iterator[dict], batch_size: int, batches: int, compress: bool) -> List[bytes]:
+    """Serialize `batches` NDJSON bodies ahead of time, so the client doesn't compete with the API"""
+    payloads = []
+    for _ in range(batches):
+        lines = [json.dumps(record, separators=(",", ":")) for record in itertools.islice(records, batch_size)]
+        body = ("\n".join(lines) + "\n").encode()
+        payloads.append(gzip.compress(body, compresslevel=1) if compress else body)
+    return payloads
+
+
+class DbCpu:
+    """Cumulative CPU time of the database container, read from its cgroup"""
+
+    def __init__(self, container: Optional[str]):
+        self.container = container
+
+    def read(self) -> Optional[float]:
+        """CPU seconds used so far, or None when unavailable"""
+        if not self.container:
+            return None
+        # cgroup v2 cpu.stat (usage_usec), then cgroup v1 cpuacct.usage (ns)
+        for path, parse in (
+            ("/sys/fs/cgroup/cpu.stat", _parse_cpu_stat),
+            ("/sys/fs/cgroup/cpuacct/cpuacct.usage", lambda text: int(text) / 1e9),
+        ):
+            try:
+                output = subprocess.run(
+                    ["docker", "exec", self.container, "cat", path],
+                    capture_output=True, text=True, timeout=10
+                )
+            except (OSError, subprocess.TimeoutExpired):
+                return None
+            if output.returncode == 0:
+                return parse(output.stdout)
+        return None
+
+
+def _parse_cpu_stat(text: str) -> float:
+    for line in text.splitlines():
+        key, _, value = line.partition(" ")
+        if key == "usage_usec":
+            return int(value) / 1e6
+    raise ValueError("usage_usec missing from cpu.stat")
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def _send_all(client: httpx.AsyncClient, payloads: List[bytes], concurrency: int, headers: dict) -> dict:
+    """POST payloads with `concurrency` in-flight requests; latencies in ms"""
+    queue = iter(payloads)
+    latencies = []
+    counts = {"records": 0, "buffered": 0, "errors": 0, "status": {}}
+
+    async def worker():
+        for payload in queue:
+            started = time.perf_counter()
+            try:
+                response = await client.post(INGEST_PATH, content=payload, headers=headers)
+            except httpx.HTTPError as e:
+                counts["errors"] += 1
+                counts["status"][type(e).__name__] = counts["status"].get(type(e).__name__, 0) + 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            code = str(response.status_code)
+            counts["status"][code] = counts["status"].get(code, 0) + 1
+            if response.status_code == 200:
+                result = response.json()
+                counts["records"] += result["count"]
+                counts["buffered"] += bool(result.get("buffered"))
+            else:
+                counts["errors"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"latencies": latencies, **counts}
+
+
+async def run_scenario(args, client: httpx.AsyncClient, db_cpu: DbCpu, batch_size: int, mix_name: str,
+                       hosts: int, concurrency: int) -> dict:
+    # Timestamps end at "now" so rows land in uncompressed chunks, as live agent data does
+    cycles = (args.warmup + args.batches) * batch_size // (hosts * sum(MIXES[mix_name].values())) + 1
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(seconds=cycles * 10)
+    records = generate_records(args.tenant, hosts, MIXES[mix_name], start)
+    warmup = build_payloads(records, batch_size, args.warmup, args.gzip)
+    payloads = build_payloads(records, batch_size, args.batches, args.gzip)
+
+    headers = {"Content-Type": "application/x-ndjson"}
+    if args.gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    await _send_all(client, warmup, concurrency, headers)
+
+    cpu_before = db_cpu.read()
+    started = time.perf_counter()
+    sent = await _send_all(client, payloads, concurrency, headers)
+    elapsed = time.perf_counter() - started
+    cpu_after = db_cpu.read()
+
+    latencies = sorted(sent["latencies"])
+    db_cpu_sec = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return {
+        "batch_size": batch_size,
+        "mix": mix_name,
+        "hosts": hosts,
+        "concurrency": concurrency,
+        "batches": len(payloads),
+        "records": sent["records"],
+        "elapsed_sec": round(elapsed, 3),
+        "records_per_sec": round(sent["records"] / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": _round(percentile(latencies, 50)),
+            "p99": _round(percentile(latencies, 99)),
+            "max": _round(latencies[-1] if latencies else None),
+        },
+        "db_cpu_sec": _round(db_cpu_sec),
+        "db_cpu_cores": _round(db_cpu_sec / elapsed if db_cpu_sec is not None and elapsed else None),
+        "db_cpu_us_per_record": _round(db_cpu_sec * 1e6 / sent["records"] if db_cpu_sec is not None and sent["records"] else None),
+        "buffered_batches": sent["buffered"],
+        "errors": sent["errors"],
+        "status": sent["status"],
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=API_ROOT)
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def _token(args) -> str:
+    if args.token:
+        return args.token
+    if args.mint_token:
+        from src.deps.security import create_access_token
+        return create_access_token({
+            "user_id": 0, "username": "bench-ingest", "tenant_id": args.tenant, "roles": ["tenant_admin"]
+        })
+    sys.exit("--token (or FLEXMON_TOKEN) or --mint-token is required")
+
+
+async def run(args) -> dict:
+    started_at = datetime.now(timezone.utc).isoformat()
+    db_cpu = DbCpu(None if args.no_db_cpu else args.db_container)
+    if db_cpu.read() is None and db_cpu.container:
+        print(f"DB CPU unavailable (docker exec {db_cpu.container} failed); reporting null", file=sys.stderr)
+        db_cpu = DbCpu(None)
+
+    scenarios = []
+    async with httpx.AsyncClient(
+        base_url=args.url,
+        headers={"Authorization": f"Bearer {_token(args)}"},
+        timeout=args.timeout,
+        verify=not args.insecure,
+        limits=httpx.Limits(max_connections=max(args.concurrency))
+    ) as client:
+        for batch_size, mix_name, hosts, concurrency in itertools.product(
+            args.batch_sizes, args.mixes, args.hosts, args.concurrency
+        ):
+            result = await run_scenario(args, client, db_cpu, batch_size, mix_name, hosts, concurrency)
+            scenarios.append(result)
+            print(
+                f"batch={batch_size:<5} mix={mix_name:<9} hosts={hosts:<6} concurrency={concurrency:<3} "
+                f"{result['records_per_sec'] or 0:>12,.0f} rec/s  "
+                f"p50={result['latency_ms']['p50']}ms p99={result['latency_ms']['p99']}ms  "
+                f"db_cpu={result['db_cpu_cores']} cores  errors={result['errors']}"
+            )
+
+    return {
+        "benchmark": "ingest",
+        "started_at": started_at,
+        "version": VERSION_INFO["version"],
+        "commit": _git_commit(),
+        "api_url": args.url,
+        "settings": {
+            "gzip": args.gzip, "batches": args.batches, "warmup": args.warmup,
+            "mixes": {name: MIXES[name] for name in args.mixes},
+        },
+        "scenarios": scenarios,
+    }
+
+
+def compare(before_path: Path, after_path: Path):
+    """Print per-scenario throughput and latency changes between two result files"""
+    before = json.loads(before_path.read_text())
+    after = json.loads(after_path.read_text())
+    key = lambda s: (s["batch_size"], s["mix"], s["hosts"], s["concurrency"])  # noqa: E731
+    baseline = {key(s): s for s in before["scenarios"]}
+
+    print(f"{before.get('version')} ({before.get('commit')}) -> {after.get('version')} ({after.get('commit')})")
+    for scenario in after["scenarios"]:
+        old = baseline.get(key(scenario))
+        if old is None:
+            continue
+        print(
+            "batch={:<5} mix={:<9} hosts={:<6} concurrency={:<3} rec/s {}  p99 {}  db_cpu/rec {}".format(
+                *key(scenario),
+                _change(old["records_per_sec"], scenario["records_per_sec"]),
+                _change(old["latency_ms"]["p99"], scenario["latency_ms"]["p99"]),
+                _change(old["db_cpu_us_per_record"], scenario["db_cpu_us_per_record"]),
+            )
+        )
+
+
+def _change(old: Optional[float], new: Optional[float]) -> str:
+    if not old or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def _ints(value: str) -> List[int]:
+    return [int(part) for part in value.split(",")]
+
+
+def _mixes(value: str) -> List[str]:
+    names = value.split(",")
+    unknown = [name for name in names if name not in MIXES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown mix {unknown}; choose from {sorted(MIXES)}")
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default=os.environ.get("FLEXMON_URL", "http://localhost:8000"))
+    parser.add_argument("--token", default=os.environ.get("FLEXMON_TOKEN"))
+    parser.add_argument("--mint-token", action="store_true", help="sign a token with API_SECRET_KEY")
+    parser.add_argument("--tenant", default="demo")
+    parser.add_argument("--batch-sizes", type=_ints, default=[500, 3000])
+    parser.add_argument("--mixes", type=_mixes, default=["host", "processes"])
+    parser.add_argument("--hosts", type=_ints, default=[10, 1000])
+    parser.add_argument("--concurrency", type=_ints, default=[1, 8])
+    parser.add_argument("--batches", type=int, default=200, help="measured batches per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured batches per scenario")
+    parser.add_argument("--gzip", action="store_true", help="send gzip-compressed bodies")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--insecure", action="store_true", help="skip TLS verification")
+    parser.add_argument("--db-container", default="flexmon-timescaledb")
+    parser.add_argument("--no-db-cpu", action="store_true")
+    parser.add_argument("--output", type=Path, help="result file (default: benchmarks/results/ingest-<time>.json)")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("BEFORE", "AFTER"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = asyncio.run(run(args))
+    output = args.output or RESULTS_DIR / f"ingest-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"results: {output}")
+
+
+if __name__ == "__main__":
+    main()
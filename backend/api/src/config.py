@@ -33,6 +33,12 @@ class Settings(BaseSettings):
     db_password: str = Field(default="changeme", validation_alias="POSTGRES_PASSWORD")
     db_name: str = Field(default="flexmon", validation_alias="POSTGRES_DB")
 
+    # Connection pool; db_pool_interactive_reserved connections are kept out of
+    # reach of bulk ingest writes so login/dashboards stay responsive under ingest load
+    db_pool_min_size: int = Field(default=5, validation_alias="DB_POOL_MIN_SIZE")
+    db_pool_max_size: int = Field(default=20, validation_alias="DB_POOL_MAX_SIZE")
+    db_pool_interactive_reserved: int = Field(default=5, validation_alias="DB_POOL_INTERACTIVE_RESERVED")
+
     # Full DATABASE_URL (optional, takes precedence if set)
     database_url: Optional[str] = Field(default=None, validation_alias="DATABASE_URL")
 
@@ -98,6 +104,10 @@ class Settings(BaseSettings):
         default=7,
         validation_alias="LICENSE_GRACE_PERIOD_DAYS"
     )
+    tenant_cache_ttl_sec: int = Field(
+        default=300,
+        validation_alias="TENANT_CACHE_TTL_SEC"
+    )
 
     # AI Service Configuration
     ai_api_url: str = Field(
@@ -151,6 +161,128 @@ class Settings(BaseSettings):
         validation_alias="METRICS_BATCH_MAX_RECORDS"
     )
 
+    # Ingest write-behind buffer
+    ingest_buffer_enabled: bool = Field(
+        default=True,
+        validation_alias="INGEST_BUFFER_ENABLED"
+    )
+    ingest_buffer_max_rows: int = Field(
+        default=100000,
+        validation_alias="INGEST_BUFFER_MAX_ROWS"
+    )
+    ingest_buffer_flush_rows: int = Field(
+        default=5000,
+        validation_alias="INGEST_BUFFER_FLUSH_ROWS"
+    )
+    ingest_buffer_flush_interval_sec: float = Field(
+        default=2.0,
+        validation_alias="INGEST_BUFFER_FLUSH_INTERVAL_SEC"
+    )
+
+    # Ingest idempotency (recent batch keys)
+    ingest_idempotency_max_keys: int = Field(
+        default=100000,
+        validation_alias="INGEST_IDEMPOTENCY_MAX_KEYS"
+    )
+    ingest_idempotency_ttl_sec: int = Field(
+        default=900,
+        validation_alias="INGEST_IDEMPOTENCY_TTL_SEC"
+    )
+
+    # Ingest admission control (429 + Retry-After when over a limit)
+    ingest_max_inflight_batches: int = Field(
+        default=32,
+        validation_alias="INGEST_MAX_INFLIGHT_BATCHES"
+    )
+    ingest_max_acquire_wait_ms: float = Field(
+        default=250.0,
+        validation_alias="INGEST_MAX_ACQUIRE_WAIT_MS"
+    )
+    ingest_buffer_high_watermark: float = Field(
+        default=0.8,
+        validation_alias="INGEST_BUFFER_HIGH_WATERMARK"
+    )
+
+    # Ingest spool (on-disk, for database outages)
+    ingest_spool_enabled: bool = Field(
+        default=True,
+        validation_alias="INGEST_SPOOL_ENABLED"
+    )
+    ingest_spool_dir: str = Field(
+        default="/app/spool",
+        validation_alias="INGEST_SPOOL_DIR"
+    )
+    ingest_spool_max_mb: int = Field(
+        default=2048,
+        validation_alias="INGEST_SPOOL_MAX_MB"
+    )
+    ingest_spool_segment_mb: int = Field(
+        default=64,
+        validation_alias="INGEST_SPOOL_SEGMENT_MB"
+    )
+    ingest_spool_max_age_hours: int = Field(
+        default=24,
+        validation_alias="INGEST_SPOOL_MAX_AGE_HOURS"
+    )
+    ingest_spool_replay_rows_per_sec: int = Field(
+        default=20000,
+        validation_alias="INGEST_SPOOL_REPLAY_ROWS_PER_SEC"
+    )
+
+    # Partial-accept ingest (?partial=true): invalid lines listed in the response
+    ingest_partial_max_reported_lines: int = Field(
+        default=100,
+        validation_alias="INGEST_PARTIAL_MAX_REPORTED_LINES"
+    )
+
+    # Process-pool decoding of large NDJSON batches (keeps the event loop free)
+    ingest_decode_pool_enabled: bool = Field(
+        default=False,
+        validation_alias="INGEST_DECODE_POOL_ENABLED"
+    )
+    ingest_decode_pool_workers: int = Field(
+        default=2,
+        validation_alias="INGEST_DECODE_POOL_WORKERS"
+    )
+    ingest_decode_pool_min_kb: int = Field(
+        default=1024,
+        validation_alias="INGEST_DECODE_POOL_MIN_KB"
+    )
+
+    # Custom metrics series dictionary (in-process series_id cache)
+    series_cache_max_entries: int = Field(
+        default=500000,
+        validation_alias="SERIES_CACHE_MAX_ENTRIES"
+    )
+
+    # Host / process-name dictionaries for the compact metric hypertables (per cache)
+    host_dictionary_cache_max_entries: int = Field(
+        default=200000,
+        validation_alias="HOST_DICTIONARY_CACHE_MAX_ENTRIES"
+    )
+
+    # Per-host cardinality limits (distinct values per metric type, evicted after the window)
+    cardinality_limit_enabled: bool = Field(
+        default=True,
+        validation_alias="CARDINALITY_LIMIT_ENABLED"
+    )
+    cardinality_max_processes_per_host: int = Field(
+        default=500,
+        validation_alias="CARDINALITY_MAX_PROCESSES_PER_HOST"
+    )
+    cardinality_max_interfaces_per_host: int = Field(
+        default=64,
+        validation_alias="CARDINALITY_MAX_INTERFACES_PER_HOST"
+    )
+    cardinality_max_disks_per_host: int = Field(
+        default=128,
+        validation_alias="CARDINALITY_MAX_DISKS_PER_HOST"
+    )
+    cardinality_window_sec: int = Field(
+        default=3600,
+        validation_alias="CARDINALITY_WINDOW_SEC"
+    )
+
     # Alert Configuration
     alert_dedup_minutes: int = Field(
         default=15,
@@ -174,6 +306,10 @@ class Settings(BaseSettings):
         default=300,
         validation_alias="AGENT_MAX_INTERVAL_SEC"
     )
+    heartbeat_flush_interval_sec: float = Field(
+        default=15.0,
+        validation_alias="HEARTBEAT_FLUSH_INTERVAL_SEC"
+    )
 
     # Retention Configuration
     metrics_raw_retention_days: int = Field(
@@ -201,6 +337,53 @@ class Settings(BaseSettings):
         validation_alias="LOGS_TOTAL_RETENTION_DAYS"
     )
 
+    # Query Configuration
+    # Metric queries: resolution planning, hosts per multi-host query
+    query_default_max_points: int = Field(
+        default=1000,
+        validation_alias="QUERY_DEFAULT_MAX_POINTS"
+    )
+    query_max_hosts: int = Field(
+        default=100,
+        validation_alias="QUERY_MAX_HOSTS"
+    )
+
+    # Metric query result cache (in-process LRU; open ranges follow ingest watermarks)
+    query_cache_enabled: bool = Field(
+        default=True,
+        validation_alias="QUERY_CACHE_ENABLED"
+    )
+    query_cache_max_mb: int = Field(
+        default=64,
+        validation_alias="QUERY_CACHE_MAX_MB"
+    )
+    query_cache_bucket_sec: int = Field(
+        default=10,
+        validation_alias="QUERY_CACHE_BUCKET_SEC"
+    )
+    query_cache_settle_sec: float = Field(
+        default=300,
+        validation_alias="QUERY_CACHE_SETTLE_SEC"
+    )
+    query_cache_open_ttl_sec: float = Field(
+        default=60,
+        validation_alias="QUERY_CACHE_OPEN_TTL_SEC"
+    )
+    query_cache_closed_ttl_sec: float = Field(
+        default=900,
+        validation_alias="QUERY_CACHE_CLOSED_TTL_SEC"
+    )
+
+    # Metric export streams (server-side cursors; each holds a pool connection)
+    query_export_max_concurrent: int = Field(
+        default=2,
+        validation_alias="QUERY_EXPORT_MAX_CONCURRENT"
+    )
+    query_export_prefetch_rows: int = Field(
+        default=1000,
+        validation_alias="QUERY_EXPORT_PREFETCH_ROWS"
+    )
+
     # S3 Backup Configuration
     s3_endpoint: Optional[str] = Field(default=None, validation_alias="S3_ENDPOINT")
     s3_bucket: Optional[str] = Field(default=None, validation_alias="S3_BUCKET")
@@ -24,7 +24,7 @@ from .routers import (
     auth,
     ai_explain,
 )
-from .services import timescale, elastic
+from .services import timescale, elastic, ingest_buffer, ingest_spool, decode_pool, heartbeat, query_planner
 
 # Configure logging
 logging.basicConfig(
@@ -62,6 +62,12 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
         except Exception as e:
             logger.warning(f"⚠ Migration check failed: {e}")
 
+        # Pre-migration aggregates still holding history are stitched into tiered queries
+        try:
+            await query_planner.load_legacy_views()
+        except Exception as e:
+            logger.warning(f"⚠ Legacy aggregate check failed: {e}")
+
     except Exception as e:
         logger.error(f"Failed to initialize TimescaleDB: {e}")
         raise
@@ -83,6 +89,20 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
 
     # Start background tasks
     logger.info("Starting background tasks...")
+    if settings.ingest_spool_enabled:
+        try:
+            await ingest_spool.start_ingest_spool()
+            logger.info("✓ Ingest spool started")
+        except OSError as e:
+            logger.warning(f"⚠ Ingest spool unavailable ({settings.ingest_spool_dir}): {e}")
+    if settings.ingest_buffer_enabled:
+        await ingest_buffer.start_ingest_buffer()
+        logger.info("✓ Ingest buffer flusher started")
+    if settings.ingest_decode_pool_enabled:
+        await decode_pool.start_decode_pool()
+        logger.info("✓ Ingest decode pool started")
+    await heartbeat.start_heartbeat_tracker()
+    logger.info("✓ Heartbeat tracker started")
     # TODO: Start alert engine, license checker, pollers
     logger.info("✓ Background tasks started")
 
@@ -92,6 +112,22 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
 
     # Cleanup on shutdown
     logger.info("Shutting down FlexMON API...")
+    try:
+        await decode_pool.stop_decode_pool()
+    except Exception as e:
+        logger.error(f"Error stopping decode pool: {e}")
+    try:
+        await ingest_buffer.stop_ingest_buffer()
+    except Exception as e:
+        logger.error(f"Error draining ingest buffer: {e}")
+    try:
+        await ingest_spool.stop_ingest_spool()
+    except Exception as e:
+        logger.error(f"Error stopping ingest spool: {e}")
+    try:
+        await heartbeat.stop_heartbeat_tracker()
+    except Exception as e:
+        logger.error(f"Error flushing heartbeats: {e}")
     await timescale.close_db()
     try:
         await elastic.close_es()
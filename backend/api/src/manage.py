@@ -15,7 +15,7 @@ import typer
 import psycopg2
 from passlib.hash import bcrypt_sha256
 
-from .migrations import run_online_migrations
+from .migrations import run_online_migrations, compat_view_sql, COMPACT_TABLES, COMPACT_AGGREGATES
 
 app = typer.Typer(help="FlexMON Management CLI")
 
@@ -348,6 +348,64 @@ def reset_password(
         conn.close()
 
 
+@app.command()
+def drop_legacy_metrics(
+    force: bool = typer.Option(False, "--force", help="Drop legacy tables even if they still hold rows")
+):
+    """
+    Drop the *_legacy metric tables left behind by the host dictionary migration
+
+    The compatibility views are recreated over the compact tables only. Legacy tables
+    that still hold rows, or whose legacy aggregates still hold history served by
+    tiered queries (not yet expired by retention), are kept unless --force is given.
+    Restart the API afterwards so queries stop reading the dropped aggregates.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        for table in COMPACT_TABLES:
+            legacy = f"{table}_legacy"
+            cur.execute("SELECT to_regclass(%s)", (legacy,))
+            if cur.fetchone()[0] is None:
+                continue
+
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {legacy})")
+            if cur.fetchone()[0] and not force:
+                typer.echo(f"⏭️  {legacy} still has rows; keeping it (use --force to drop)")
+                continue
+
+            # Tiered queries still read the legacy aggregates (which depend on the table)
+            history = None
+            for view, (source, *_) in COMPACT_AGGREGATES.items():
+                cur.execute("SELECT to_regclass(%s)", (f"{view}_legacy",))
+                if source != table or cur.fetchone()[0] is None:
+                    continue
+                cur.execute(f"SELECT EXISTS (SELECT 1 FROM {view}_legacy)")
+                if cur.fetchone()[0]:
+                    history = f"{view}_legacy"
+                    break
+            if history and not force:
+                typer.echo(f"⏭️  {history} still has history; keeping {legacy} (use --force to drop)")
+                continue
+
+            cur.execute(compat_view_sql(table, with_legacy=False))
+            for view, (source, *_) in COMPACT_AGGREGATES.items():
+                if source == table:
+                    cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {view}_legacy")
+            cur.execute(f"DROP TABLE {legacy}")
+            conn.commit()
+            typer.echo(f"✅ Dropped {legacy}")
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        typer.echo(f"❌ Failed to drop legacy metrics: {e}", err=True)
+        raise typer.Exit(code=1)
+    finally:
+        cur.close()
+        conn.close()
+
+
 @app.command()
 def db_info():
     """
@@ -12,6 +12,11 @@ def run_online_migrations(conn):
     """
     migrations = [
         _add_user_timestamps,
+        _add_custom_metrics_store,
+        _add_host_dictionary,
+        _add_network_rates,
+        _add_memory_aggregate_policy,
+        _record_legacy_cutoffs,
     ]
 
     for migration in migrations:
@@ -94,3 +99,475 @@ def _add_user_timestamps(conn):
         return False, f"User timestamps migration failed: {e}"
     finally:
         cur.close()
+
+
+def _add_custom_metrics_store(conn):
+    """
+    Migration 003: Add the series dictionary and the metrics_custom hypertable
+    with compression, continuous aggregates and retention
+    """
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS series (
+                id SERIAL PRIMARY KEY,
+                tenant_id VARCHAR(255) NOT NULL,
+                metric_name VARCHAR(255) NOT NULL,
+                host VARCHAR(255) NOT NULL DEFAULT '',
+                labels JSONB NOT NULL DEFAULT '{}',
+                created_at TIMESTAMP DEFAULT NOW(),
+                UNIQUE (tenant_id, metric_name, host, labels)
+            );
+            CREATE INDEX IF NOT EXISTS idx_series_tenant_host ON series(tenant_id, host, metric_name);
+            CREATE INDEX IF NOT EXISTS idx_series_labels ON series USING GIN (labels jsonb_path_ops);
+
+            CREATE TABLE IF NOT EXISTS metrics_custom (
+                timestamp TIMESTAMP NOT NULL,
+                series_id INTEGER NOT NULL,
+                value DOUBLE PRECISION
+            );
+            SELECT create_hypertable('metrics_custom', 'timestamp',
+                chunk_time_interval => INTERVAL '1 day',
+                if_not_exists => TRUE
+            );
+            CREATE INDEX IF NOT EXISTS idx_metrics_custom_series ON metrics_custom(series_id, timestamp DESC);
+        """)
+
+        # Compression settings can only be set once chunks exist uncompressed; skip if already enabled
+        cur.execute("""
+            DO $$
+            BEGIN
+              IF NOT EXISTS (
+                SELECT 1 FROM timescaledb_information.hypertables
+                WHERE hypertable_name='metrics_custom' AND compression_enabled
+              ) THEN
+                ALTER TABLE metrics_custom
+                  SET (timescaledb.compress,
+                       timescaledb.compress_orderby = 'timestamp DESC',
+                       timescaledb.compress_segmentby = 'series_id');
+              END IF;
+            END$$;
+        """)
+
+        # WITH NO DATA lets continuous aggregates be created inside this transaction;
+        # the refresh policies fill them
+        for view, bucket in (("metrics_custom_5min", "5 minutes"), ("metrics_custom_1h", "1 hour")):
+            cur.execute(f"""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+                WITH (timescaledb.continuous) AS
+                SELECT
+                    time_bucket('{bucket}', timestamp) AS bucket,
+                    series_id,
+                    AVG(value) AS value_avg,
+                    MAX(value) AS value_max,
+                    MIN(value) AS value_min,
+                    COUNT(*) AS samples
+                FROM metrics_custom
+                GROUP BY bucket, series_id
+                WITH NO DATA;
+            """)
+
+        cur.execute("""
+            SELECT add_continuous_aggregate_policy('metrics_custom_5min',
+                start_offset => INTERVAL '1 day',
+                end_offset => INTERVAL '5 minutes',
+                schedule_interval => INTERVAL '5 minutes',
+                if_not_exists => TRUE
+            );
+            SELECT add_continuous_aggregate_policy('metrics_custom_1h',
+                start_offset => INTERVAL '3 days',
+                end_offset => INTERVAL '1 hour',
+                schedule_interval => INTERVAL '1 hour',
+                if_not_exists => TRUE
+            );
+            SELECT add_compression_policy('metrics_custom', INTERVAL '1 day', if_not_exists => TRUE);
+            SELECT add_retention_policy('metrics_custom', INTERVAL '7 days', if_not_exists => TRUE);
+            SELECT add_retention_policy('metrics_custom_5min', INTERVAL '30 days', if_not_exists => TRUE);
+            SELECT add_retention_policy('metrics_custom_1h', INTERVAL '365 days', if_not_exists => TRUE);
+        """)
+
+        conn.commit()
+        return True, "Custom metrics store migration completed"
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        return False, f"Custom metrics store migration failed: {e}"
+    finally:
+        cur.close()
+
+
+# Hot hypertables keyed by an integer host_id since migration 004.
+# name -> column DDL after (timestamp, host_id), compression segmentby, view columns
+# over the compact table (m), extra dictionary joins, and the matching legacy columns
+COMPACT_TABLES = {
+    "metrics_cpu": {
+        "columns": """
+            cpu_percent DOUBLE PRECISION,
+            cpu_user DOUBLE PRECISION,
+            cpu_system DOUBLE PRECISION,
+            cpu_idle DOUBLE PRECISION,
+            cpu_iowait DOUBLE PRECISION
+        """,
+        "segmentby": "host_id",
+        "indexes": [],
+        "select": "m.cpu_percent, m.cpu_user, m.cpu_system, m.cpu_idle, m.cpu_iowait",
+        "joins": "",
+        "legacy": "cpu_percent, cpu_user, cpu_system, cpu_idle, cpu_iowait",
+    },
+    "metrics_disk": {
+        "columns": """
+            device VARCHAR(255) NOT NULL,
+            mountpoint VARCHAR(255) NOT NULL,
+            total_bytes BIGINT,
+            used_bytes BIGINT,
+            free_bytes BIGINT,
+            percent DOUBLE PRECISION
+        """,
+        "segmentby": "host_id,device",
+        "indexes": [("device", "device, mountpoint, timestamp DESC")],
+        "select": "m.device, m.mountpoint, m.total_bytes, m.used_bytes, m.free_bytes, m.percent",
+        "joins": "",
+        "legacy": "device, mountpoint, total_bytes, used_bytes, free_bytes, percent",
+    },
+    "metrics_network": {
+        "columns": """
+            interface VARCHAR(255) NOT NULL,
+            bytes_sent BIGINT,
+            bytes_recv BIGINT,
+            packets_sent BIGINT,
+            packets_recv BIGINT,
+            errors_in INTEGER,
+            errors_out INTEGER,
+            drops_in INTEGER,
+            drops_out INTEGER,
+            bytes_sent_rate DOUBLE PRECISION,
+            bytes_recv_rate DOUBLE PRECISION,
+            packets_sent_rate DOUBLE PRECISION,
+            packets_recv_rate DOUBLE PRECISION,
+            errors_in_rate DOUBLE PRECISION,
+            errors_out_rate DOUBLE PRECISION,
+            drops_in_rate DOUBLE PRECISION,
+            drops_out_rate DOUBLE PRECISION
+        """,
+        "segmentby": "host_id,interface",
+        "indexes": [("interface", "interface, timestamp DESC")],
+        "select": (
+            "m.interface, m.bytes_sent, m.bytes_recv, m.packets_sent, m.packets_recv, "
+            "m.errors_in, m.errors_out, m.drops_in, m.drops_out, "
+            "m.bytes_sent_rate, m.bytes_recv_rate, m.packets_sent_rate, m.packets_recv_rate, "
+            "m.errors_in_rate, m.errors_out_rate, m.drops_in_rate, m.drops_out_rate"
+        ),
+        "joins": "",
+        # Legacy rows predate ingest-side rates
+        "legacy": (
+            "interface, bytes_sent, bytes_recv, packets_sent, packets_recv, "
+            "errors_in, errors_out, drops_in, drops_out, "
+            + ", ".join("NULL::DOUBLE PRECISION" for _ in range(8))
+        ),
+    },
+    "metrics_process": {
+        "columns": """
+            pid INTEGER NOT NULL,
+            process_name_id INTEGER NOT NULL,
+            cpu_percent DOUBLE PRECISION,
+            memory_percent DOUBLE PRECISION,
+            status VARCHAR(50)
+        """,
+        "segmentby": "host_id,process_name_id",
+        "indexes": [("name", "process_name_id, timestamp DESC")],
+        "select": (
+            "m.pid, p.name, m.cpu_percent, m.memory_percent, m.status, "
+            "NULLIF(p.username, '') AS username"
+        ),
+        "joins": "JOIN process_names p ON p.id = m.process_name_id",
+        "legacy": "pid, name, cpu_percent, memory_percent, status, username",
+    },
+}
+
+# Continuous aggregates rebuilt on the compact tables:
+# name -> (source, bucket, aggregates, extra group keys, refresh window, retention)
+COMPACT_AGGREGATES = {
+    "metrics_cpu_5min": ("metrics_cpu", "5 minutes", """
+        AVG(cpu_percent) AS cpu_percent_avg,
+        MAX(cpu_percent) AS cpu_percent_max,
+        AVG(cpu_user) AS cpu_user_avg,
+        AVG(cpu_system) AS cpu_system_avg,
+        AVG(cpu_idle) AS cpu_idle_avg,
+        AVG(cpu_iowait) AS cpu_iowait_avg
+    """, "", "1 day", "30 days"),
+    "metrics_cpu_1h": ("metrics_cpu", "1 hour", """
+        AVG(cpu_percent) AS cpu_percent_avg,
+        MAX(cpu_percent) AS cpu_percent_max,
+        MIN(cpu_percent) AS cpu_percent_min
+    """, "", "3 days", "365 days"),
+    "metrics_network_5min": ("metrics_network", "5 minutes", """
+        AVG(bytes_sent_rate) AS bytes_sent_rate_avg,
+        MAX(bytes_sent_rate) AS bytes_sent_rate_max,
+        AVG(bytes_recv_rate) AS bytes_recv_rate_avg,
+        MAX(bytes_recv_rate) AS bytes_recv_rate_max,
+        AVG(packets_sent_rate) AS packets_sent_rate_avg,
+        AVG(packets_recv_rate) AS packets_recv_rate_avg,
+        AVG(errors_in_rate) AS errors_in_rate_avg,
+        AVG(errors_out_rate) AS errors_out_rate_avg,
+        AVG(drops_in_rate) AS drops_in_rate_avg,
+        AVG(drops_out_rate) AS drops_out_rate_avg
+    """, ", interface", "1 day", "30 days"),
+}
+
+
+def _relkind(cur, name):
+    cur.execute(
+        "SELECT relkind FROM pg_class WHERE relname = %s AND relnamespace = 'public'::regnamespace",
+        (name,)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def compat_view_sql(table, with_legacy):
+    """
+    View exposing a compact hypertable with the original (tenant_id, host) columns;
+    while pre-migration rows remain, they are appended from the *_legacy table
+    """
+    spec = COMPACT_TABLES[table]
+    sql = f"""
+        CREATE OR REPLACE VIEW {table} AS
+        SELECT m.timestamp, h.tenant_id, h.hostname AS host, {spec["select"]}
+        FROM {table}_compact m
+        JOIN hosts h ON h.id = m.host_id
+        {spec["joins"]}
+    """
+    if with_legacy:
+        sql += f"""
+        UNION ALL
+        SELECT timestamp, tenant_id, host, {spec["legacy"]}
+        FROM {table}_legacy
+        """
+    return sql
+
+
+def _create_compact_aggregate(cur, view):
+    """Create a COMPACT_AGGREGATES continuous aggregate (empty; its refresh policy fills it)"""
+    source, bucket, aggregates, group_by, refresh_start, retention = COMPACT_AGGREGATES[view]
+    cur.execute(f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+        WITH (timescaledb.continuous) AS
+        SELECT
+            time_bucket('{bucket}', timestamp) AS bucket,
+            host_id{group_by},
+            {aggregates}
+        FROM {source}_compact
+        GROUP BY bucket, host_id{group_by}
+        WITH NO DATA;
+        SELECT add_continuous_aggregate_policy('{view}',
+            start_offset => INTERVAL '{refresh_start}',
+            end_offset => INTERVAL '{bucket}',
+            schedule_interval => INTERVAL '{bucket}',
+            if_not_exists => TRUE
+        );
+        SELECT add_retention_policy('{view}', INTERVAL '{retention}', if_not_exists => TRUE);
+    """)
+
+
+def _add_host_dictionary(conn):
+    """
+    Migration 004: Move metrics_cpu/disk/network/process to integer host keys
+    Existing hypertables (and their continuous aggregates) are renamed to *_legacy and
+    left to age out under their retention policies; views with the original names
+    union them with the new *_compact tables, so readers see no change. The rename time
+    of each aggregate is recorded in legacy_cutoffs: tiered queries read the legacy
+    aggregate before it and the new one from it.
+    `manage.py drop-legacy-metrics` removes the legacy tables once they are empty.
+    """
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS hosts (
+                id SERIAL PRIMARY KEY,
+                tenant_id VARCHAR(255) NOT NULL,
+                hostname VARCHAR(255) NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                UNIQUE (tenant_id, hostname)
+            );
+            CREATE TABLE IF NOT EXISTS process_names (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                username VARCHAR(255) NOT NULL DEFAULT '',
+                UNIQUE (name, username)
+            );
+            CREATE TABLE IF NOT EXISTS legacy_cutoffs (
+                view TEXT PRIMARY KEY,
+                cutoff TIMESTAMP NOT NULL
+            );
+        """)
+
+        for table, spec in COMPACT_TABLES.items():
+            compact = f"{table}_compact"
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {compact} (
+                    timestamp TIMESTAMP NOT NULL,
+                    host_id INTEGER NOT NULL,
+                    {spec["columns"]}
+                );
+                SELECT create_hypertable('{compact}', 'timestamp',
+                    chunk_time_interval => INTERVAL '1 day',
+                    if_not_exists => TRUE
+                );
+                CREATE INDEX IF NOT EXISTS idx_{compact}_host ON {compact}(host_id, timestamp DESC);
+            """)
+            for suffix, columns in spec["indexes"]:
+                cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{compact}_{suffix} ON {compact}({columns})")
+
+            cur.execute(f"""
+                DO $$
+                BEGIN
+                  IF NOT EXISTS (
+                    SELECT 1 FROM timescaledb_information.hypertables
+                    WHERE hypertable_name='{compact}' AND compression_enabled
+                  ) THEN
+                    ALTER TABLE {compact}
+                      SET (timescaledb.compress,
+                           timescaledb.compress_orderby = 'timestamp DESC',
+                           timescaledb.compress_segmentby = '{spec["segmentby"]}');
+                  END IF;
+                END$$;
+                SELECT add_compression_policy('{compact}', INTERVAL '1 day', if_not_exists => TRUE);
+                SELECT add_retention_policy('{compact}', INTERVAL '7 days', if_not_exists => TRUE);
+            """)
+
+            # Still the original string-keyed hypertable: keep it (and its aggregates) as legacy
+            if _relkind(cur, table) == "r":
+                cur.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+                for view, (source, *_) in COMPACT_AGGREGATES.items():
+                    if source == table and _relkind(cur, view) == "v":
+                        cur.execute(f"ALTER MATERIALIZED VIEW {view} RENAME TO {view}_legacy")
+                        cur.execute(
+                            "INSERT INTO legacy_cutoffs (view, cutoff) VALUES (%s, timezone('UTC', now())) "
+                            "ON CONFLICT (view) DO NOTHING",
+                            (view,)
+                        )
+
+            # Views from an earlier run are left alone; later migrations extend them
+            if _relkind(cur, table) is None:
+                cur.execute(compat_view_sql(table, _relkind(cur, f"{table}_legacy") == "r"))
+
+        for view in COMPACT_AGGREGATES:
+            _create_compact_aggregate(cur, view)
+
+        conn.commit()
+        return True, "Host dictionary migration completed"
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        return False, f"Host dictionary migration failed: {e}"
+    finally:
+        cur.close()
+
+
+NETWORK_RATE_COLUMNS = (
+    "bytes_sent_rate", "bytes_recv_rate", "packets_sent_rate", "packets_recv_rate",
+    "errors_in_rate", "errors_out_rate", "drops_in_rate", "drops_out_rate"
+)
+
+
+def _add_network_rates(conn):
+    """
+    Migration 005: Add per-second rate columns to metrics_network_compact, expose them
+    through the metrics_network view, and rebuild metrics_network_5min on the rates
+    (it used MAX - MIN of raw counters, which breaks on counter resets)
+    """
+    cur = conn.cursor()
+
+    try:
+        for column in NETWORK_RATE_COLUMNS:
+            cur.execute(
+                f"ALTER TABLE metrics_network_compact ADD COLUMN IF NOT EXISTS {column} DOUBLE PRECISION"
+            )
+
+        # New columns are appended at the end, which CREATE OR REPLACE VIEW allows
+        cur.execute(compat_view_sql(
+            "metrics_network", _relkind(cur, "metrics_network_legacy") == "r"
+        ))
+
+        # Continuous aggregates cannot be altered; replace the counter-delta version
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'metrics_network_5min' AND column_name = 'bytes_sent_rate_avg'
+        """)
+        if cur.fetchone() is None:
+            cur.execute("DROP MATERIALIZED VIEW IF EXISTS metrics_network_5min")
+            _create_compact_aggregate(cur, "metrics_network_5min")
+
+        conn.commit()
+        return True, "Network rates migration completed"
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        return False, f"Network rates migration failed: {e}"
+    finally:
+        cur.close()
+
+
+def _add_memory_aggregate_policy(conn):
+    """
+    Migration 006: Add the missing refresh policy for metrics_memory_5min
+    Without it the aggregate is never materialized, so tiered queries would find it empty
+    """
+    cur = conn.cursor()
+
+    try:
+        if _relkind(cur, "metrics_memory_5min") is not None:
+            cur.execute("""
+                SELECT add_continuous_aggregate_policy('metrics_memory_5min',
+                    start_offset => INTERVAL '1 day',
+                    end_offset => INTERVAL '5 minutes',
+                    schedule_interval => INTERVAL '5 minutes',
+                    if_not_exists => TRUE
+                )
+            """)
+
+        conn.commit()
+        return True, "Memory aggregate policy migration completed"
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        return False, f"Memory aggregate policy migration failed: {e}"
+    finally:
+        cur.close()
+
+
+def _record_legacy_cutoffs(conn):
+    """
+    Migration 007: Record the legacy aggregate cutoff for installs migrated before it
+    Migration 004 now records when it renamed each aggregate; for aggregates renamed
+    earlier, the last legacy bucket is used instead. That bucket may be partial, so it
+    is served from the new aggregate.
+    """
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS legacy_cutoffs (
+                view TEXT PRIMARY KEY,
+                cutoff TIMESTAMP NOT NULL
+            )
+        """)
+        for view in COMPACT_AGGREGATES:
+            if _relkind(cur, f"{view}_legacy") != "v":
+                continue
+            cur.execute(f"""
+                INSERT INTO legacy_cutoffs (view, cutoff)
+                SELECT %s, MAX(bucket) FROM {view}_legacy HAVING MAX(bucket) IS NOT NULL
+                ON CONFLICT (view) DO NOTHING
+            """, (view,))
+
+        conn.commit()
+        return True, "Legacy cutoff migration completed"
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        return False, f"Legacy cutoff migration failed: {e}"
+    finally:
+        cur.close()
@@ -89,14 +89,35 @@ SELECT create_hypertable('host_info', 'timestamp',
 
 CREATE INDEX IF NOT EXISTS idx_host_info_tenant_host ON host_info(tenant_id, host, timestamp DESC);
 
+-- =============================================================================
+-- HOST DICTIONARY
+-- =============================================================================
+
+-- The hot metric hypertables store an integer host_id instead of repeating
+-- tenant_id/host strings on every row; the views below restore the string columns
+CREATE TABLE IF NOT EXISTS hosts (
+    id SERIAL PRIMARY KEY,
+    tenant_id VARCHAR(255) NOT NULL,
+    hostname VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE (tenant_id, hostname)
+);
+
+-- Process name/user pairs referenced by metrics_process_compact
+CREATE TABLE IF NOT EXISTS process_names (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    username VARCHAR(255) NOT NULL DEFAULT '',
+    UNIQUE (name, username)
+);
+
 -- =============================================================================
 -- CPU METRICS
 -- =============================================================================
 
-CREATE TABLE IF NOT EXISTS metrics_cpu (
+CREATE TABLE IF NOT EXISTS metrics_cpu_compact (
     timestamp TIMESTAMP NOT NULL,
-    tenant_id VARCHAR(255) NOT NULL,
-    host VARCHAR(255) NOT NULL,
+    host_id INTEGER NOT NULL,
     cpu_percent DOUBLE PRECISION,
     cpu_user DOUBLE PRECISION,
     cpu_system DOUBLE PRECISION,
@@ -104,41 +125,59 @@ CREATE TABLE IF NOT EXISTS metrics_cpu (
     cpu_iowait DOUBLE PRECISION
 );
 
-SELECT create_hypertable('metrics_cpu', 'timestamp',
+SELECT create_hypertable('metrics_cpu_compact', 'timestamp',
     chunk_time_interval => INTERVAL '1 day',
     if_not_exists => TRUE
 );
 
-CREATE INDEX IF NOT EXISTS idx_metrics_cpu_tenant_host ON metrics_cpu(tenant_id, host, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_metrics_cpu_compact_host ON metrics_cpu_compact(host_id, timestamp DESC);
+
+-- Readers keep the (tenant_id, host) layout
+CREATE OR REPLACE VIEW metrics_cpu AS
+SELECT m.timestamp, h.tenant_id, h.hostname AS host,
+       m.cpu_percent, m.cpu_user, m.cpu_system, m.cpu_idle, m.cpu_iowait
+FROM metrics_cpu_compact m
+JOIN hosts h ON h.id = m.host_id;
 
 -- Continuous aggregates for 5-minute averages
 CREATE MATERIALIZED VIEW IF NOT EXISTS metrics_cpu_5min
 WITH (timescaledb.continuous) AS
 SELECT
     time_bucket('5 minutes', timestamp) AS bucket,
-    tenant_id,
-    host,
+    host_id,
     AVG(cpu_percent) AS cpu_percent_avg,
     MAX(cpu_percent) AS cpu_percent_max,
     AVG(cpu_user) AS cpu_user_avg,
     AVG(cpu_system) AS cpu_system_avg,
     AVG(cpu_idle) AS cpu_idle_avg,
     AVG(cpu_iowait) AS cpu_iowait_avg
-FROM metrics_cpu
-GROUP BY bucket, tenant_id, host;
+FROM metrics_cpu_compact
+GROUP BY bucket, host_id;
 
 -- Continuous aggregates for 1-hour averages
 CREATE MATERIALIZED VIEW IF NOT EXISTS metrics_cpu_1h
 WITH (timescaledb.continuous) AS
 SELECT
     time_bucket('1 hour', timestamp) AS bucket,
-    tenant_id,
-    host,
+    host_id,
     AVG(cpu_percent) AS cpu_percent_avg,
     MAX(cpu_percent) AS cpu_percent_max,
     MIN(cpu_percent) AS cpu_percent_min
-FROM metrics_cpu
-GROUP BY bucket, tenant_id, host;
+FROM metrics_cpu_compact
+GROUP BY bucket, host_id;
+
+SELECT add_continuous_aggregate_policy('metrics_cpu_5min',
+    start_offset => INTERVAL '1 day',
+    end_offset => INTERVAL '5 minutes',
+    schedule_interval => INTERVAL '5 minutes',
+    if_not_exists => TRUE
+);
+SELECT add_continuous_aggregate_policy('metrics_cpu_1h',
+    start_offset => INTERVAL '3 days',
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '1 hour',
+    if_not_exists => TRUE
+);
 
 -- =============================================================================
 -- MEMORY METRICS
@@ -178,14 +217,20 @@ SELECT
 FROM metrics_memory
 GROUP BY bucket, tenant_id, host;
 
+SELECT add_continuous_aggregate_policy('metrics_memory_5min',
+    start_offset => INTERVAL '1 day',
+    end_offset => INTERVAL '5 minutes',
+    schedule_interval => INTERVAL '5 minutes',
+    if_not_exists => TRUE
+);
+
 -- =============================================================================
 -- DISK METRICS
 -- =============================================================================
 
-CREATE TABLE IF NOT EXISTS metrics_disk (
+CREATE TABLE IF NOT EXISTS metrics_disk_compact (
     timestamp TIMESTAMP NOT NULL,
-    tenant_id VARCHAR(255) NOT NULL,
-    host VARCHAR(255) NOT NULL,
+    host_id INTEGER NOT NULL,
     device VARCHAR(255) NOT NULL,
     mountpoint VARCHAR(255) NOT NULL,
     total_bytes BIGINT,
@@ -194,22 +239,27 @@ CREATE TABLE IF NOT EXISTS metrics_disk (
     percent DOUBLE PRECISION
 );
 
-SELECT create_hypertable('metrics_disk', 'timestamp',
+SELECT create_hypertable('metrics_disk_compact', 'timestamp',
     chunk_time_interval => INTERVAL '1 day',
     if_not_exists => TRUE
 );
 
-CREATE INDEX IF NOT EXISTS idx_metrics_disk_tenant_host ON metrics_disk(tenant_id, host, timestamp DESC);
-CREATE INDEX IF NOT EXISTS idx_metrics_disk_device ON metrics_disk(device, mountpoint, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_metrics_disk_compact_host ON metrics_disk_compact(host_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_metrics_disk_compact_device ON metrics_disk_compact(device, mountpoint, timestamp DESC);
+
+CREATE OR REPLACE VIEW metrics_disk AS
+SELECT m.timestamp, h.tenant_id, h.hostname AS host, m.device, m.mountpoint,
+       m.total_bytes, m.used_bytes, m.free_bytes, m.percent
+FROM metrics_disk_compact m
+JOIN hosts h ON h.id = m.host_id;
 
 -- =============================================================================
 -- NETWORK METRICS
 -- =============================================================================
 
-CREATE TABLE IF NOT EXISTS metrics_network (
+CREATE TABLE IF NOT EXISTS metrics_network_compact (
     timestamp TIMESTAMP NOT NULL,
-    tenant_id VARCHAR(255) NOT NULL,
-    host VARCHAR(255) NOT NULL,
+    host_id INTEGER NOT NULL,
     interface VARCHAR(255) NOT NULL,
     bytes_sent BIGINT,
     bytes_recv BIGINT,
@@ -218,55 +268,160 @@ CREATE TABLE IF NOT EXISTS metrics_network (
     errors_in INTEGER,
     errors_out INTEGER,
     drops_in INTEGER,
-    drops_out INTEGER
+    drops_out INTEGER,
+    -- Per-second rates computed at ingest from consecutive counter samples;
+    -- NULL for the first sample of an interface and after a counter reset
+    bytes_sent_rate DOUBLE PRECISION,
+    bytes_recv_rate DOUBLE PRECISION,
+    packets_sent_rate DOUBLE PRECISION,
+    packets_recv_rate DOUBLE PRECISION,
+    errors_in_rate DOUBLE PRECISION,
+    errors_out_rate DOUBLE PRECISION,
+    drops_in_rate DOUBLE PRECISION,
+    drops_out_rate DOUBLE PRECISION
 );
 
-SELECT create_hypertable('metrics_network', 'timestamp',
+SELECT create_hypertable('metrics_network_compact', 'timestamp',
     chunk_time_interval => INTERVAL '1 day',
     if_not_exists => TRUE
 );
 
-CREATE INDEX IF NOT EXISTS idx_metrics_network_tenant_host ON metrics_network(tenant_id, host, timestamp DESC);
-CREATE INDEX IF NOT EXISTS idx_metrics_network_interface ON metrics_network(interface, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_metrics_network_compact_host ON metrics_network_compact(host_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_metrics_network_compact_interface ON metrics_network_compact(interface, timestamp DESC);
+
+CREATE OR REPLACE VIEW metrics_network AS
+SELECT m.timestamp, h.tenant_id, h.hostname AS host, m.interface,
+       m.bytes_sent, m.bytes_recv, m.packets_sent, m.packets_recv,
+       m.errors_in, m.errors_out, m.drops_in, m.drops_out,
+       m.bytes_sent_rate, m.bytes_recv_rate, m.packets_sent_rate, m.packets_recv_rate,
+       m.errors_in_rate, m.errors_out_rate, m.drops_in_rate, m.drops_out_rate
+FROM metrics_network_compact m
+JOIN hosts h ON h.id = m.host_id;
 
 -- Continuous aggregates for network rates
 CREATE MATERIALIZED VIEW IF NOT EXISTS metrics_network_5min
 WITH (timescaledb.continuous) AS
 SELECT
     time_bucket('5 minutes', timestamp) AS bucket,
-    tenant_id,
-    host,
+    host_id,
     interface,
-    MAX(bytes_sent) - MIN(bytes_sent) AS bytes_sent_delta,
-    MAX(bytes_recv) - MIN(bytes_recv) AS bytes_recv_delta,
-    SUM(errors_in) AS errors_in_sum,
-    SUM(errors_out) AS errors_out_sum
-FROM metrics_network
-GROUP BY bucket, tenant_id, host, interface;
+    AVG(bytes_sent_rate) AS bytes_sent_rate_avg,
+    MAX(bytes_sent_rate) AS bytes_sent_rate_max,
+    AVG(bytes_recv_rate) AS bytes_recv_rate_avg,
+    MAX(bytes_recv_rate) AS bytes_recv_rate_max,
+    AVG(packets_sent_rate) AS packets_sent_rate_avg,
+    AVG(packets_recv_rate) AS packets_recv_rate_avg,
+    AVG(errors_in_rate) AS errors_in_rate_avg,
+    AVG(errors_out_rate) AS errors_out_rate_avg,
+    AVG(drops_in_rate) AS drops_in_rate_avg,
+    AVG(drops_out_rate) AS drops_out_rate_avg
+FROM metrics_network_compact
+GROUP BY bucket, host_id, interface;
+
+SELECT add_continuous_aggregate_policy('metrics_network_5min',
+    start_offset => INTERVAL '1 day',
+    end_offset => INTERVAL '5 minutes',
+    schedule_interval => INTERVAL '5 minutes',
+    if_not_exists => TRUE
+);
 
 -- =============================================================================
 -- PROCESS METRICS
 -- =============================================================================
 
-CREATE TABLE IF NOT EXISTS metrics_process (
+CREATE TABLE IF NOT EXISTS metrics_process_compact (
     timestamp TIMESTAMP NOT NULL,
-    tenant_id VARCHAR(255) NOT NULL,
-    host VARCHAR(255) NOT NULL,
+    host_id INTEGER NOT NULL,
     pid INTEGER NOT NULL,
-    name VARCHAR(255) NOT NULL,
+    process_name_id INTEGER NOT NULL,
     cpu_percent DOUBLE PRECISION,
     memory_percent DOUBLE PRECISION,
-    status VARCHAR(50),
-    username VARCHAR(255)
+    status VARCHAR(50)
+);
+
+SELECT create_hypertable('metrics_process_compact', 'timestamp',
+    chunk_time_interval => INTERVAL '1 day',
+    if_not_exists => TRUE
+);
+
+CREATE INDEX IF NOT EXISTS idx_metrics_process_compact_host ON metrics_process_compact(host_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_metrics_process_compact_name ON metrics_process_compact(process_name_id, timestamp DESC);
+
+CREATE OR REPLACE VIEW metrics_process AS
+SELECT m.timestamp, h.tenant_id, h.hostname AS host, m.pid, p.name,
+       m.cpu_percent, m.memory_percent, m.status, NULLIF(p.username, '') AS username
+FROM metrics_process_compact m
+JOIN hosts h ON h.id = m.host_id
+JOIN process_names p ON p.id = m.process_name_id;
+
+-- =============================================================================
+-- CUSTOM METRICS (labelled series)
+-- =============================================================================
+
+-- Series dictionary: one row per (tenant, metric name, host, label set)
+CREATE TABLE IF NOT EXISTS series (
+    id SERIAL PRIMARY KEY,
+    tenant_id VARCHAR(255) NOT NULL,
+    metric_name VARCHAR(255) NOT NULL,
+    host VARCHAR(255) NOT NULL DEFAULT '',
+    labels JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE (tenant_id, metric_name, host, labels)
+);
+
+CREATE INDEX IF NOT EXISTS idx_series_tenant_host ON series(tenant_id, host, metric_name);
+CREATE INDEX IF NOT EXISTS idx_series_labels ON series USING GIN (labels jsonb_path_ops);
+
+CREATE TABLE IF NOT EXISTS metrics_custom (
+    timestamp TIMESTAMP NOT NULL,
+    series_id INTEGER NOT NULL,
+    value DOUBLE PRECISION
 );
 
-SELECT create_hypertable('metrics_process', 'timestamp',
+SELECT create_hypertable('metrics_custom', 'timestamp',
     chunk_time_interval => INTERVAL '1 day',
     if_not_exists => TRUE
 );
 
-CREATE INDEX IF NOT EXISTS idx_metrics_process_tenant_host ON metrics_process(tenant_id, host, timestamp DESC);
-CREATE INDEX IF NOT EXISTS idx_metrics_process_name ON metrics_process(name, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_metrics_custom_series ON metrics_custom(series_id, timestamp DESC);
+
+-- Continuous aggregates
+CREATE MATERIALIZED VIEW IF NOT EXISTS metrics_custom_5min
+WITH (timescaledb.continuous) AS
+SELECT
+    time_bucket('5 minutes', timestamp) AS bucket,
+    series_id,
+    AVG(value) AS value_avg,
+    MAX(value) AS value_max,
+    MIN(value) AS value_min,
+    COUNT(*) AS samples
+FROM metrics_custom
+GROUP BY bucket, series_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS metrics_custom_1h
+WITH (timescaledb.continuous) AS
+SELECT
+    time_bucket('1 hour', timestamp) AS bucket,
+    series_id,
+    AVG(value) AS value_avg,
+    MAX(value) AS value_max,
+    MIN(value) AS value_min,
+    COUNT(*) AS samples
+FROM metrics_custom
+GROUP BY bucket, series_id;
+
+SELECT add_continuous_aggregate_policy('metrics_custom_5min',
+    start_offset => INTERVAL '1 day',
+    end_offset => INTERVAL '5 minutes',
+    schedule_interval => INTERVAL '5 minutes',
+    if_not_exists => TRUE
+);
+SELECT add_continuous_aggregate_policy('metrics_custom_1h',
+    start_offset => INTERVAL '3 days',
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '1 hour',
+    if_not_exists => TRUE
+);
 
 -- =============================================================================
 -- ALERTS
@@ -376,19 +531,22 @@ CREATE INDEX IF NOT EXISTS idx_platform_logs_action ON platform_logs(action);
 -- =============================================================================
 
 -- Raw metrics: 7 days
-SELECT add_retention_policy('metrics_cpu', INTERVAL '7 days', if_not_exists => TRUE);
+SELECT add_retention_policy('metrics_cpu_compact', INTERVAL '7 days', if_not_exists => TRUE);
 SELECT add_retention_policy('metrics_memory', INTERVAL '7 days', if_not_exists => TRUE);
-SELECT add_retention_policy('metrics_disk', INTERVAL '7 days', if_not_exists => TRUE);
-SELECT add_retention_policy('metrics_network', INTERVAL '7 days', if_not_exists => TRUE);
-SELECT add_retention_policy('metrics_process', INTERVAL '7 days', if_not_exists => TRUE);
+SELECT add_retention_policy('metrics_disk_compact', INTERVAL '7 days', if_not_exists => TRUE);
+SELECT add_retention_policy('metrics_network_compact', INTERVAL '7 days', if_not_exists => TRUE);
+SELECT add_retention_policy('metrics_process_compact', INTERVAL '7 days', if_not_exists => TRUE);
+SELECT add_retention_policy('metrics_custom', INTERVAL '7 days', if_not_exists => TRUE);
 
 -- 5-minute aggregates: 30 days
 SELECT add_retention_policy('metrics_cpu_5min', INTERVAL '30 days', if_not_exists => TRUE);
 SELECT add_retention_policy('metrics_memory_5min', INTERVAL '30 days', if_not_exists => TRUE);
 SELECT add_retention_policy('metrics_network_5min', INTERVAL '30 days', if_not_exists => TRUE);
+SELECT add_retention_policy('metrics_custom_5min', INTERVAL '30 days', if_not_exists => TRUE);
 
 -- 1-hour aggregates: 365 days
 SELECT add_retention_policy('metrics_cpu_1h', INTERVAL '365 days', if_not_exists => TRUE);
+SELECT add_retention_policy('metrics_custom_1h', INTERVAL '365 days', if_not_exists => TRUE);
 
 -- Alerts: 90 days
 CREATE OR REPLACE FUNCTION cleanup_old_alerts() RETURNS void AS $$
@@ -403,30 +561,35 @@ $$ LANGUAGE plpgsql;
 -- =============================================================================
 
 -- Enable compression settings on hypertables (must be done before adding policies)
-ALTER TABLE metrics_cpu
+ALTER TABLE metrics_cpu_compact
   SET (timescaledb.compress,
        timescaledb.compress_orderby = 'timestamp DESC',
-       timescaledb.compress_segmentby = 'tenant_id,host');
+       timescaledb.compress_segmentby = 'host_id');
 
 ALTER TABLE metrics_memory
   SET (timescaledb.compress,
        timescaledb.compress_orderby = 'timestamp DESC',
        timescaledb.compress_segmentby = 'tenant_id,host');
 
-ALTER TABLE metrics_disk
+ALTER TABLE metrics_disk_compact
+  SET (timescaledb.compress,
+       timescaledb.compress_orderby = 'timestamp DESC',
+       timescaledb.compress_segmentby = 'host_id,device');
+
+ALTER TABLE metrics_network_compact
   SET (timescaledb.compress,
        timescaledb.compress_orderby = 'timestamp DESC',
-       timescaledb.compress_segmentby = 'tenant_id,host,device');
+       timescaledb.compress_segmentby = 'host_id,interface');
 
-ALTER TABLE metrics_network
+ALTER TABLE metrics_process_compact
   SET (timescaledb.compress,
        timescaledb.compress_orderby = 'timestamp DESC',
-       timescaledb.compress_segmentby = 'tenant_id,host,interface');
+       timescaledb.compress_segmentby = 'host_id,process_name_id');
 
-ALTER TABLE metrics_process
+ALTER TABLE metrics_custom
   SET (timescaledb.compress,
        timescaledb.compress_orderby = 'timestamp DESC',
-       timescaledb.compress_segmentby = 'tenant_id,host,name');
+       timescaledb.compress_segmentby = 'series_id');
 
 ALTER TABLE host_info
   SET (timescaledb.compress,
@@ -434,11 +597,12 @@ ALTER TABLE host_info
        timescaledb.compress_segmentby = 'tenant_id,host');
 
 -- Add compression policies (compress chunks older than 1 day)
-SELECT add_compression_policy('metrics_cpu', INTERVAL '1 day', if_not_exists => TRUE);
+SELECT add_compression_policy('metrics_cpu_compact', INTERVAL '1 day', if_not_exists => TRUE);
 SELECT add_compression_policy('metrics_memory', INTERVAL '1 day', if_not_exists => TRUE);
-SELECT add_compression_policy('metrics_disk', INTERVAL '1 day', if_not_exists => TRUE);
-SELECT add_compression_policy('metrics_network', INTERVAL '1 day', if_not_exists => TRUE);
-SELECT add_compression_policy('metrics_process', INTERVAL '1 day', if_not_exists => TRUE);
+SELECT add_compression_policy('metrics_disk_compact', INTERVAL '1 day', if_not_exists => TRUE);
+SELECT add_compression_policy('metrics_network_compact', INTERVAL '1 day', if_not_exists => TRUE);
+SELECT add_compression_policy('metrics_process_compact', INTERVAL '1 day', if_not_exists => TRUE);
+SELECT add_compression_policy('metrics_custom', INTERVAL '1 day', if_not_exists => TRUE);
 SELECT add_compression_policy('host_info', INTERVAL '1 day', if_not_exists => TRUE);
 
 -- =============================================================================
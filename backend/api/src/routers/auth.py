@@ -7,7 +7,7 @@ from fastapi import APIRouter, HTTPException, status, Depends, Request
 from datetime import datetime, timedelta
 from ..models import UserLogin, Token, User
 from ..deps.security import create_access_token, verify_password, get_platform_admin, get_tenant_admin
-from ..services import timescale
+from ..services import timescale, tenant_cache
 from ..config import settings
 
 router = APIRouter()
@@ -105,8 +105,7 @@ async def login(credentials: UserLogin, request: Request):
 
         # Check if tenant is enabled (if not platform_admin)
         if user["role"] != "platform_admin" and user["tenant_id"]:
-            tenant_query = "SELECT enabled FROM tenants WHERE id = $1"
-            tenant = await timescale.fetch_one(tenant_query, user["tenant_id"])
+            tenant = await tenant_cache.get_tenant_state(user["tenant_id"])
             if not tenant or not tenant["enabled"]:
                 logger.warning(f"[{request_id}] Login failed: tenant disabled - username='{username}', tenant_id='{user['tenant_id']}'")
                 raise HTTPException(
@@ -6,7 +6,7 @@ from typing import List
 from ..models import AgentRegistration, AgentInfo
 from ..deps.security import get_tenant_admin
 from ..deps.tenancy import get_tenant_id_optional
-from ..services import timescale
+from ..services import timescale, tenant_cache, heartbeat
 import hashlib
 
 router = APIRouter()
@@ -94,6 +94,12 @@ async def list_agents(
         query = "SELECT * FROM agents ORDER BY last_seen DESC"
         agents = await timescale.fetch_all(query)
 
+    # Overlay heartbeats not yet written back to agents.last_seen
+    for agent in agents:
+        seen = heartbeat.last_seen(agent["tenant_id"], agent["hostname"])
+        if seen and (agent["last_seen"] is None or seen > agent["last_seen"]):
+            agent["last_seen"] = seen
+
     return [AgentInfo(**agent) for agent in agents]
 
 
@@ -124,37 +130,45 @@ async def bind_license(
             detail="Access denied"
         )
 
-    # Check license limits
+    # Check license limits (cached tenant state; the guarded UPDATE below is authoritative)
     if licensed:
-        tenant = await timescale.fetch_one(
-            "SELECT license_agent_limit, licensed_agents FROM tenants WHERE id = $1",
-            agent["tenant_id"]
-        )
+        tenant = await tenant_cache.get_tenant_state(agent["tenant_id"])
 
-        if tenant["licensed_agents"] >= tenant["license_agent_limit"]:
+        if not tenant or tenant["licensed_agents"] >= tenant["license_agent_limit"]:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="License limit reached"
             )
 
-    # Update agent
-    await timescale.execute_query(
-        "UPDATE agents SET licensed = $1 WHERE id = $2",
-        licensed,
-        agent_id
-    )
-
     # Update tenant licensed count
     if licensed:
-        await timescale.execute_query(
-            "UPDATE tenants SET licensed_agents = licensed_agents + 1 WHERE id = $1",
+        reserved = await timescale.fetch_one(
+            """
+            UPDATE tenants SET licensed_agents = licensed_agents + 1
+            WHERE id = $1 AND licensed_agents < license_agent_limit
+            RETURNING id
+            """,
             agent["tenant_id"]
         )
+        tenant_cache.invalidate(agent["tenant_id"])
+        if not reserved:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="License limit reached"
+            )
     else:
         await timescale.execute_query(
             "UPDATE tenants SET licensed_agents = licensed_agents - 1 WHERE id = $1",
             agent["tenant_id"]
         )
+        tenant_cache.invalidate(agent["tenant_id"])
+
+    # Update agent
+    await timescale.execute_query(
+        "UPDATE agents SET licensed = $1 WHERE id = $2",
+        licensed,
+        agent_id
+    )
 
     return {"message": "License updated successfully"}
 
@@ -2,37 +2,184 @@
 Metrics ingestion endpoint
 Handles batch metrics from agents (JSON Lines format)
 """
-from fastapi import APIRouter, HTTPException, status, Depends, Request
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import json
+import logging
 from datetime import datetime
-from ..deps.security import get_current_user
+from ..deps.security import get_current_user, get_platform_admin
 from ..deps.tenancy import get_tenant_id
-from ..services import timescale
+from ..services import timescale, ingest_buffer, ingest_spool, metrics_codec, decode_pool, content_encoding, prometheus_remote_write, otlp_metrics, series_store, host_dictionary, host_inventory, cardinality, network_rates, tenant_cache, heartbeat, idempotency, admission, query_planner, downsample, metric_export, query_cache
 from ..config import settings
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 @router.post("/ingest/metrics/batch")
 async def ingest_metrics_batch(
     request: Request,
+    response: Response,
+    partial: bool = Query(False, description="Write valid records and report invalid lines instead of rejecting the batch"),
     tenant_id: str = Depends(get_tenant_id),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Ingest batch of metrics in JSON Lines format
+    Accepts Content-Encoding: gzip or zstd (limits apply to the decompressed body)
     Max size: 15 MB / 3000 records
+    Optional Idempotency-Key (or X-Batch-ID) header makes retries of the same batch a no-op
+    partial=true accepts the valid records of a batch and reports the invalid lines
     Enforces license validation - blocks unlicensed tenants
     """
-    # Check tenant license status
-    tenant_check = await timescale.fetch_one(
-        """
-        SELECT enabled, license_expires_at, grace_period_until
-        FROM tenants WHERE id = $1
-        """,
-        tenant_id
-    )
+    await _check_tenant_license(tenant_id)
+
+    # Check content type
+    if request.headers.get("content-type") != "application/x-ndjson":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Content-Type must be application/x-ndjson"
+        )
+
+    # Reject unsupported encodings and declared oversized bodies before reading anything
+    _check_content_length(request)
+    _request_encoding(request)
+
+    # Replayed batches (agent/gateway retries) are acknowledged without writing again
+    idempotency_key = _idempotency_key(request)
+    if idempotency_key:
+        replayed = await idempotency.begin(tenant_id, idempotency_key)
+        if replayed is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return replayed
+
+    # Shed load with 429 + Retry-After rather than queueing on the connection pool
+    try:
+        admission_token = _admit()
+    except HTTPException:
+        if idempotency_key:
+            idempotency.abort(tenant_id, idempotency_key)
+        raise
+
+    try:
+        result = await _ingest_ndjson(request, tenant_id, partial)
+    except BaseException:
+        if idempotency_key:
+            idempotency.abort(tenant_id, idempotency_key)
+        raise
+    finally:
+        admission.release(admission_token)
+
+    if idempotency_key:
+        idempotency.complete(tenant_id, idempotency_key, result)
+    return result
+
+
+@router.post("/ingest/prometheus/write", status_code=status.HTTP_204_NO_CONTENT)
+async def ingest_prometheus_write(
+    request: Request,
+    tenant_id: str = Depends(get_tenant_id),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Prometheus remote_write receiver (snappy-compressed protobuf WriteRequest)
+    node_exporter CPU, memory, filesystem and network series are stored in the metrics_* tables;
+    other series are counted and dropped. Max size: 15 MB (compressed and decompressed)
+    """
+    await _check_tenant_license(tenant_id)
+
+    if request.headers.get("content-type") != "application/x-protobuf":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Content-Type must be application/x-protobuf"
+        )
+    if (request.headers.get("content-encoding") or "").strip().lower() != "snappy":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Content-Encoding must be snappy"
+        )
+    _check_content_length(request)
+
+    admission_token = _admit()
+    try:
+        max_bytes = settings.metrics_batch_max_size_mb * 1024 * 1024
+        body = await _read_body(request, max_bytes)
+        try:
+            batches, hosts = prometheus_remote_write.decode(body, tenant_id, max_bytes)
+        except prometheus_remote_write.RemoteWriteSizeExceeded:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch size exceeds {settings.metrics_batch_max_size_mb} MB"
+            )
+        except prometheus_remote_write.RemoteWriteDecodeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+
+        await _write_metric_batches(cardinality.limit_batches(batches))
+        heartbeat.record(tenant_id, hosts)
+        query_cache.advance(tenant_id, hosts)
+    finally:
+        admission.release(admission_token)
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/ingest/otlp/v1/metrics")
+async def ingest_otlp_metrics(
+    request: Request,
+    tenant_id: str = Depends(get_tenant_id),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    OTLP/HTTP metrics receiver (ExportMetricsServiceRequest as protobuf or JSON)
+    OpenTelemetry host metrics are stored in the metrics_* tables, keyed by the host.name
+    resource attribute; other gauges and sums become custom metrics (metrics_custom, labelled
+    by their attributes) unless they exceed the series limits. Histograms, summaries and
+    resources without host.name are counted and dropped
+    Accepts Content-Encoding: gzip or zstd. Max size: 15 MB (decompressed)
+    """
+    await _check_tenant_license(tenant_id)
+
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if content_type not in ("application/x-protobuf", "application/json"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Content-Type must be application/x-protobuf or application/json"
+        )
+    _check_content_length(request)
+    _request_encoding(request)
+
+    admission_token = _admit()
+    try:
+        body = b"".join([chunk async for chunk in _request_body_chunks(request)])
+        try:
+            batches, hosts = otlp_metrics.decode(body, content_type, tenant_id)
+        except otlp_metrics.OtlpDecodeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+
+        await _write_metric_batches(cardinality.limit_batches(batches))
+        heartbeat.record(tenant_id, hosts)
+        query_cache.advance(tenant_id, hosts)
+    finally:
+        admission.release(admission_token)
+
+    # Empty ExportMetricsServiceResponse (full success) in the request's encoding
+    if content_type == "application/json":
+        return Response(content=b"{}", media_type="application/json")
+    return Response(content=b"", media_type="application/x-protobuf")
+
+
+async def _check_tenant_license(tenant_id: str):
+    """Block ingestion for unknown tenants and expired licenses past their grace period"""
+    # Check tenant license status (cached; invalidated on tenant updates)
+    tenant_check = await tenant_cache.get_tenant_state(tenant_id)
 
     if not tenant_check:
         raise HTTPException(
@@ -42,266 +189,368 @@ async def ingest_metrics_batch(
 
     if not tenant_check["enabled"]:
         # Check if grace period is still valid
-        from datetime import datetime as dt
         grace_until = tenant_check.get("grace_period_until")
-        if not grace_until or dt.utcnow() > grace_until:
+        if not grace_until or datetime.utcnow() > grace_until:
             raise HTTPException(
                 status_code=status.HTTP_402_PAYMENT_REQUIRED,
                 detail="Tenant license expired. Metrics ingestion blocked."
             )
 
-    # Check content type
-    if request.headers.get("content-type") != "application/x-ndjson":
+
+def _admit() -> float:
+    """Admit an ingest request or answer 429 + Retry-After; returns the admission token"""
+    try:
+        return admission.admit()
+    except admission.Overloaded as e:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Content-Type must be application/x-ndjson"
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Ingest overloaded ({e.reason}), retry later",
+            headers={"Retry-After": str(e.retry_after)}
         )
 
-    # Read body
-    body = await request.body()
 
-    # Check size limit
-    size_mb = len(body) / (1024 * 1024)
-    if size_mb > settings.metrics_batch_max_size_mb:
+async def _ingest_ndjson(request: Request, tenant_id: str, partial: bool = False) -> dict:
+    """
+    Parse, validate and write an NDJSON batch; returns the ingest response
+    In partial mode invalid lines are skipped and reported instead of failing the batch
+    """
+    pool = decode_pool.get_pool()
+    try:
+        if pool is None:
+            # Parse NDJSON line by line as the (possibly compressed) body streams in
+            decoded = metrics_codec.BatchDecoder(tenant_id, partial, settings.ingest_partial_max_reported_lines)
+            async for line in _iter_ndjson_lines(_request_body_chunks(request)):
+                decoded.add(line)
+            report = decoded.report.to_dict() if decoded.report is not None else None
+        else:
+            # Large batches are decoded in a worker process, small ones inline. Only the
+            # first min_bytes are read before deciding, so small batches keep the
+            # incremental size and record limits of the streaming path
+            chunks = _request_body_chunks(request)
+            head = await _read_prefix(chunks, pool.min_bytes)
+            if pool.should_offload(len(head)):
+                body = await _collect_chunks(_prefixed(bytes(head), chunks), settings.metrics_batch_max_size_mb * 1024 * 1024)
+                decoded = await pool.decode(bytes(body), tenant_id, partial)
+                report = decoded.report
+            else:
+                decoded = metrics_codec.BatchDecoder(tenant_id, partial, settings.ingest_partial_max_reported_lines)
+                async for line in _iter_ndjson_lines(_prefixed(bytes(head), chunks)):
+                    decoded.add(line)
+                report = decoded.report.to_dict() if decoded.report is not None else None
+    except metrics_codec.MetricDecodeError as e:
         raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"Batch size exceeds {settings.metrics_batch_max_size_mb} MB"
+            status_code=status.HTTP_403_FORBIDDEN if e.reason == "tenant_mismatch" else status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-
-    # Parse NDJSON
-    lines = body.decode("utf-8").strip().split("\n")
-
-    if len(lines) > settings.metrics_batch_max_records:
+    except decode_pool.RecordLimitExceeded as e:
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"Batch exceeds {settings.metrics_batch_max_records} records"
+            detail=str(e)
         )
+    batches = decoded.batches
 
-    # Separate metrics by type
-    cpu_metrics = []
-    memory_metrics = []
-    disk_metrics = []
-    network_metrics = []
-    process_metrics = []
+    # Per-host cardinality limits (process names, interfaces, disks)
+    batches = cardinality.limit_batches(batches)
 
-    for line in lines:
-        if not line.strip():
-            continue
+    # Inventory is only stored when it changed since the last write for that host
+    batches["host_info"] = host_inventory.changed_rows(batches["host_info"])
 
-        try:
-            record = json.loads(line)
-        except json.JSONDecodeError as e:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid JSON: {str(e)}"
-            )
-
-        # Validate tenant_id matches
-        if record.get("tenant_id") != tenant_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Tenant ID mismatch"
-            )
+    # Hand rows to the write-behind buffer, or write them with binary COPY directly
+    inserted_count, buffered = await _write_metric_batches(batches)
+    host_inventory.remember(batches["host_info"])
 
-        # Route by metric type
-        metric_type = record.get("metric_type")
-
-        if metric_type == "cpu":
-            cpu_metrics.append(record)
-        elif metric_type == "memory":
-            memory_metrics.append(record)
-        elif metric_type == "disk":
-            disk_metrics.append(record)
-        elif metric_type == "network":
-            network_metrics.append(record)
-        elif metric_type == "process":
-            process_metrics.append(record)
-
-    # Insert metrics in batches
-    inserted_count = 0
-
-    if cpu_metrics:
-        await _insert_cpu_metrics(cpu_metrics)
-        inserted_count += len(cpu_metrics)
-
-    if memory_metrics:
-        await _insert_memory_metrics(memory_metrics)
-        inserted_count += len(memory_metrics)
-
-    if disk_metrics:
-        await _insert_disk_metrics(disk_metrics)
-        inserted_count += len(disk_metrics)
-
-    if network_metrics:
-        await _insert_network_metrics(network_metrics)
-        inserted_count += len(network_metrics)
-
-    if process_metrics:
-        await _insert_process_metrics(process_metrics)
-        inserted_count += len(process_metrics)
-
-    # Update agent last_seen timestamp for all unique hosts
-    unique_hosts = set()
-    for metrics_list in [cpu_metrics, memory_metrics, disk_metrics, network_metrics, process_metrics]:
-        for m in metrics_list:
-            unique_hosts.add(m.get("host"))
-
-    for host in unique_hosts:
-        await timescale.execute_query(
-            """
-            UPDATE agents
-            SET last_seen = NOW()
-            WHERE tenant_id = $1 AND hostname = $2
-            """,
-            tenant_id,
-            host
-        )
+    # Record agent heartbeats (written to agents.last_seen by the heartbeat tracker)
+    heartbeat.record(tenant_id, decoded.hosts)
+    # Cached query results that include now are stale for these hosts
+    query_cache.advance(tenant_id, decoded.hosts)
 
-    return {
+    result = {
         "message": "Metrics ingested successfully",
         "count": inserted_count,
+        "buffered": buffered,
         "breakdown": {
-            "cpu": len(cpu_metrics),
-            "memory": len(memory_metrics),
-            "disk": len(disk_metrics),
-            "network": len(network_metrics),
-            "process": len(process_metrics)
+            metric_type: len(rows) for metric_type, rows in batches.items()
         }
     }
+    if report is not None:
+        result["errors"] = report
+    return result
+
+
+def _idempotency_key(request: Request) -> Optional[str]:
+    """Batch idempotency key from the Idempotency-Key (or X-Batch-ID) header, if any"""
+    key = request.headers.get("idempotency-key") or request.headers.get("x-batch-id")
+    if key is None:
+        return None
+    try:
+        return idempotency.validate_key(key)
+    except idempotency.InvalidIdempotencyKey as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
 
 
-async def _insert_cpu_metrics(metrics: List[dict]):
-    """Insert CPU metrics"""
-    query = """
-        INSERT INTO metrics_cpu (timestamp, tenant_id, host, cpu_percent, cpu_user, cpu_system, cpu_idle, cpu_iowait)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-    """
+def _check_content_length(request: Request):
+    """Reject a request whose declared Content-Length already exceeds the batch size limit"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > settings.metrics_batch_max_size_mb * 1024 * 1024:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch size exceeds {settings.metrics_batch_max_size_mb} MB"
+            )
+
 
-    for m in metrics:
-        await timescale.execute_query(
-            query,
-            m.get("timestamp", datetime.utcnow()),
-            m["tenant_id"],
-            m["host"],
-            m.get("cpu_percent"),
-            m.get("cpu_user"),
-            m.get("cpu_system"),
-            m.get("cpu_idle"),
-            m.get("cpu_iowait", 0.0)
+def _request_encoding(request: Request) -> str:
+    """Validate the Content-Encoding header"""
+    try:
+        return content_encoding.normalize_encoding(request.headers.get("content-encoding"))
+    except content_encoding.UnsupportedEncodingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(e)
         )
 
 
-async def _insert_memory_metrics(metrics: List[dict]):
-    """Insert memory metrics"""
-    query = """
-        INSERT INTO metrics_memory (timestamp, tenant_id, host, memory_total, memory_used, memory_free, memory_percent, swap_total, swap_used, swap_free, swap_percent)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+async def _request_body_chunks(request: Request) -> AsyncIterator[bytes]:
+    """
+    Stream the request body, decompressing gzip/zstd bodies on the fly
+    The batch size limit applies to the decompressed size
     """
+    max_bytes = settings.metrics_batch_max_size_mb * 1024 * 1024
+    chunks = content_encoding.decompress_stream(request.stream(), _request_encoding(request), max_bytes)
 
-    for m in metrics:
-        await timescale.execute_query(
-            query,
-            m.get("timestamp", datetime.utcnow()),
-            m["tenant_id"],
-            m["host"],
-            m.get("memory_total"),
-            m.get("memory_used"),
-            m.get("memory_free"),
-            m.get("memory_percent"),
-            m.get("swap_total"),
-            m.get("swap_used"),
-            m.get("swap_free"),
-            m.get("swap_percent")
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except content_encoding.DecompressedSizeExceeded:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch size exceeds {settings.metrics_batch_max_size_mb} MB"
+        )
+    except content_encoding.InvalidCompressedData as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
 
 
-async def _insert_disk_metrics(metrics: List[dict]):
-    """Insert disk metrics"""
-    query = """
-        INSERT INTO metrics_disk (timestamp, tenant_id, host, device, mountpoint, total_bytes, used_bytes, free_bytes, percent)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-    """
+async def _read_body(request: Request, max_bytes: int) -> bytes:
+    """Read a whole (compressed) request body, rejecting it once it exceeds max_bytes"""
+    return bytes(await _collect_chunks(request.stream(), max_bytes))
 
-    for m in metrics:
-        await timescale.execute_query(
-            query,
-            m.get("timestamp", datetime.utcnow()),
-            m["tenant_id"],
-            m["host"],
-            m.get("device"),
-            m.get("mountpoint"),
-            m.get("total"),
-            m.get("used"),
-            m.get("free"),
-            m.get("percent")
-        )
 
+async def _collect_chunks(chunks: AsyncIterator[bytes], max_bytes: int) -> bytearray:
+    """Read a streamed body into memory, rejecting it once it exceeds max_bytes"""
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch size exceeds {settings.metrics_batch_max_size_mb} MB"
+            )
+    return body
 
-async def _insert_network_metrics(metrics: List[dict]):
-    """Insert network metrics"""
-    query = """
-        INSERT INTO metrics_network (timestamp, tenant_id, host, interface, bytes_sent, bytes_recv, packets_sent, packets_recv, errors_in, errors_out, drops_in, drops_out)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+
+async def _read_prefix(chunks: AsyncIterator[bytes], size: int) -> bytearray:
+    """Buffer a streamed body until `size` bytes were read or it ended; the rest stays unread"""
+    head = bytearray()
+    async for chunk in chunks:
+        head += chunk
+        if len(head) >= size:
+            break
+    return head
+
+
+async def _prefixed(head: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """An already read prefix followed by the rest of the stream"""
+    if head:
+        yield head
+    async for chunk in chunks:
+        yield chunk
+
+
+async def _iter_ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Split a streamed NDJSON body into lines (as bytes), blank ones included so that
+    BatchDecoder's line indexes match the body. Size and record limits (non-blank lines)
+    are enforced as data arrives, so oversized batches are rejected without reading
+    the rest of the body
     """
+    max_bytes = settings.metrics_batch_max_size_mb * 1024 * 1024
+    max_records = settings.metrics_batch_max_records
+    received = 0
+    records = 0
+    pending = bytearray()
+
+    async for chunk in chunks:
+        if not chunk:
+            continue
 
-    for m in metrics:
-        await timescale.execute_query(
-            query,
-            m.get("timestamp", datetime.utcnow()),
-            m["tenant_id"],
-            m["host"],
-            m.get("interface"),
-            m.get("bytes_sent"),
-            m.get("bytes_recv"),
-            m.get("packets_sent"),
-            m.get("packets_recv"),
-            m.get("errors_in", 0),
-            m.get("errors_out", 0),
-            m.get("drops_in", 0),
-            m.get("drops_out", 0)
-        )
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch size exceeds {settings.metrics_batch_max_size_mb} MB"
+            )
 
+        pending += chunk
+        last_newline = pending.rfind(b"\n")
+        if last_newline < 0:
+            continue
 
-async def _insert_process_metrics(metrics: List[dict]):
-    """Insert process metrics"""
-    query = """
-        INSERT INTO metrics_process (timestamp, tenant_id, host, pid, name, cpu_percent, memory_percent, status, username)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+        complete = bytes(pending[:last_newline])
+        del pending[:last_newline + 1]
+
+        for line in complete.split(b"\n"):
+            if line.strip():
+                records += 1
+                if records > max_records:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Batch exceeds {max_records} records"
+                    )
+            yield line
+
+    # Final line without a trailing newline
+    if pending.strip():
+        records += 1
+        if records > max_records:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch exceeds {max_records} records"
+            )
+        yield bytes(pending)
+
+
+async def _write_metric_batches(batches: Dict[str, List[tuple]]) -> Tuple[int, bool]:
     """
+    Write per-type row batches through the bulk COPY path
+    Rows go to the write-behind buffer when it is running and has room;
+    otherwise they are written synchronously in one transaction (which also backpressures the agent).
+    If that write fails, the batch is appended to the on-disk spool and replayed later.
+    Returns (row count, buffered)
+    """
+    copy_batches = {}
+    for metric_type, rows in batches.items():
+        if rows:
+            schema = metrics_codec.SCHEMAS[metric_type]
+            columns = schema.columns
+            # Cumulative interface counters also get per-second rates
+            if metric_type == "network":
+                rows = network_rates.add_rates(rows)
+                columns += network_rates.RATE_COLUMNS
+            copy_batches[schema.table] = (columns, rows)
+
+    if not copy_batches:
+        return 0, False
+
+    # Custom metric rows carry series keys until they are resolved to series ids;
+    # host metric rows carry tenant/host strings until they are mapped to host ids.
+    # Resolution needs the database, so when it fails the string-keyed rows are
+    # spooled (replay resolves them) rather than rejected
+    try:
+        compacted = await host_dictionary.compact_batches(await series_store.resolve_batches(copy_batches))
+    except Exception as e:
+        spool = ingest_spool.get_spool()
+        if not spool:
+            logger.error(f"Dictionary resolution failed: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Metrics storage unavailable"
+            )
+        logger.warning(f"Dictionary resolution failed ({e}); spooling batch to disk")
+        return await _spool_batches(spool, copy_batches)
 
-    for m in metrics:
-        await timescale.execute_query(
-            query,
-            m.get("timestamp", datetime.utcnow()),
-            m["tenant_id"],
-            m["host"],
-            m.get("pid"),
-            m.get("name"),
-            m.get("cpu_percent"),
-            m.get("memory_percent"),
-            m.get("status"),
-            m.get("username")
+    buffer = ingest_buffer.get_buffer()
+    if buffer:
+        try:
+            return buffer.add(compacted), True
+        except ingest_buffer.BufferFullError as e:
+            logger.warning(f"{e}; writing batch synchronously")
+
+    try:
+        return await timescale.copy_many(compacted), False
+    except Exception as e:
+        spool = ingest_spool.get_spool()
+        if not spool:
+            raise
+        logger.warning(f"Database write failed ({e}); spooling batch to disk")
+    return await _spool_batches(spool, compacted)
+
+
+async def _spool_batches(spool: ingest_spool.IngestSpool, copy_batches: Dict[str, tuple]) -> Tuple[int, bool]:
+    """Append batches to the on-disk spool, or answer 503 when it is full"""
+    try:
+        return await spool.append(copy_batches), True
+    except ingest_spool.SpoolFullError as e:
+        logger.error(str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Metrics storage unavailable"
         )
 
 
+@router.get("/ingest/stats")
+async def ingest_stats(current_user: dict = Depends(get_platform_admin)):
+    """
+    Ingest pipeline statistics (write-behind buffer, disk spool, tenant state cache,
+    heartbeats, idempotency keys, admission control, pool usage, decode pool, remote_write/OTLP mapping
+    and the custom metrics series cache)
+    """
+    return {
+        "buffer": ingest_buffer.get_buffer_stats(),
+        "spool": ingest_spool.get_spool_stats(),
+        "tenant_cache": tenant_cache.get_cache_stats(),
+        "heartbeat": heartbeat.get_tracker_stats(),
+        "idempotency": idempotency.get_store_stats(),
+        "admission": admission.get_admission_stats(),
+        "prometheus": prometheus_remote_write.get_stats(),
+        "otlp": otlp_metrics.get_stats(),
+        "series": series_store.get_cache_stats(),
+        "host_dictionary": host_dictionary.get_cache_stats(),
+        "host_info": host_inventory.get_stats(),
+        "cardinality": cardinality.get_stats(),
+        "network_rates": network_rates.get_stats(),
+        "decode_pool": decode_pool.get_pool_stats(),
+    }
+
+
 @router.get("/metrics/{metric_type}/query")
 async def query_metrics(
     metric_type: str,
-    host: str,
     start_time: datetime,
     end_time: datetime,
+    host: List[str] = Query(..., description="Repeat for several hosts in one query"),
+    name: Optional[str] = None,
+    label: Optional[List[str]] = Query(None),
+    max_points: Optional[int] = Query(None, ge=1, le=10000, description="Target number of points per series"),
+    resolution: str = Query("auto", description="auto, raw, 5min or 1h"),
+    fields: Optional[str] = Query(None, description="Comma-separated value columns to return"),
+    layout: Optional[str] = Query(None, description="rows or columnar (default: rows for one host, columnar for several)"),
     tenant_id: str = Depends(get_tenant_id),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Query metrics for a specific host and time range
+    Query metrics for one or more hosts and a time range
+    cpu, memory and network are served from the finest of the raw, 5-minute and 1-hour
+    tiers that fits max_points (resolution=auto), stitched at retention boundaries;
+    the response reports the tier used. An explicit max_points also LTTB-downsamples
+    each series to at most that many points
+    Repeated `host` parameters fetch several hosts in one statement; `fields` limits the
+    value columns. layout=columnar returns per-host column arrays instead of rows
+    metric_type=custom requires `name`, a single host, and accepts repeated `label=key:value` filters
     """
     table_map = {
         "cpu": "metrics_cpu",
         "memory": "metrics_memory",
         "disk": "metrics_disk",
         "network": "metrics_network",
-        "process": "metrics_process"
+        "process": "metrics_process",
+        "host_info": "host_info",
+        "custom": "metrics_custom"
     }
 
     if metric_type not in table_map:
@@ -310,25 +559,222 @@ async def query_metrics(
             detail=f"Invalid metric type. Must be one of: {', '.join(table_map.keys())}"
         )
 
-    table = table_map[metric_type]
+    hosts = list(dict.fromkeys(host))
+    if len(hosts) > settings.query_max_hosts:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many hosts. At most {settings.query_max_hosts} per query"
+        )
+    if layout is None:
+        layout = "columnar" if len(hosts) > 1 else "rows"
+    if layout not in ("rows", "columnar"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid layout. Must be one of: rows, columnar"
+        )
+
+    if metric_type == "custom":
+        if len(hosts) > 1 or fields or layout != "rows":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Custom metrics are queried for a single host, without fields or layout"
+            )
+        return await _query_custom_metrics(tenant_id, hosts[0], start_time, end_time, name, label, max_points)
+
+    if resolution not in query_planner.RESOLUTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid resolution. Must be one of: {', '.join(query_planner.RESOLUTIONS)}"
+        )
+
+    # Ranges are widened to cache buckets so refreshes of a sliding window share results
+    requested_start, requested_end = query_planner.to_utc_naive(start_time), query_planner.to_utc_naive(end_time)
+    start, end = query_cache.align(requested_start, requested_end)
+    try:
+        plan = query_planner.plan_query(
+            metric_type, table_map[metric_type], start, end,
+            max_points or settings.query_default_max_points, resolution
+        )
+    except query_planner.ResolutionUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    try:
+        projection = plan.project([field.strip() for field in fields.split(",") if field.strip()] if fields else None)
+    except query_planner.UnknownField as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    query, args = query_planner.build_query(plan, tenant_id, hosts, limit=10000 * len(hosts), fields=projection)
+    results = await query_cache.fetch(
+        (tenant_id, metric_type, tuple(hosts), start, end, plan.tier.name, projection),
+        tenant_id, hosts, end,
+        lambda: timescale.fetch_all(query, *args)
+    )
+    if (start, end) != (requested_start, requested_end):
+        # Cut the widened range back to what was asked for, into a new list (cached rows are shared)
+        results = [row for row in results if requested_start <= row["timestamp"] <= requested_end]
+    fetched = len(results)
+
+    # LTTB per series when the caller asked for a point budget
+    if max_points:
+        results = downsample.downsample_rows(metric_type, results, max_points)
+
+    response = {
+        "metric_type": metric_type,
+        **({"host": hosts[0]} if len(hosts) == 1 else {"hosts": hosts}),
+        "start_time": start_time,
+        "end_time": end_time,
+        "resolution": plan.tier.name,
+        "tiers": plan.describe(),
+        "fields": list(projection or plan.fields()),
+        "downsampled_from": fetched if len(results) < fetched else None,
+        "count": len(results),
+    }
+    if layout == "columnar":
+        response["series"] = query_planner.to_columnar(results)
+    else:
+        response["data"] = results
+    return response
+
+
+@router.get("/metrics/{metric_type}/export")
+async def export_metrics(
+    metric_type: str,
+    start_time: datetime,
+    end_time: datetime,
+    host: Optional[str] = None,
+    format: str = Query("ndjson", description="ndjson or csv"),
+    limit: Optional[int] = Query(None, ge=1, description="Rows per page; unset streams the whole range"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    tenant_id: str = Depends(get_tenant_id),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Stream raw metric rows as NDJSON or CSV, for one host or all of the tenant's hosts
+    Rows are ordered by (timestamp, host) (plus device/interface/pid) and read through a
+    server-side cursor, so exports of any size run in constant memory. With `limit`,
+    each page ends with a next_cursor to pass back as `cursor`
+    """
+    if metric_type not in metric_export.EXPORT_TABLES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid metric type. Must be one of: {', '.join(metric_export.EXPORT_TABLES)}"
+        )
+    if format not in metric_export.FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid format. Must be one of: {', '.join(metric_export.FORMATS)}"
+        )
+
+    try:
+        after = metric_export.decode_cursor(metric_type, cursor) if cursor else None
+    except metric_export.InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    query, args = metric_export.build_query(
+        metric_type, tenant_id, host,
+        query_planner.to_utc_naive(start_time), query_planner.to_utc_naive(end_time),
+        after, limit
+    )
+
+    exporter = metric_export.get_exporter()
+    try:
+        slot = exporter.reserve()
+    except metric_export.ExportBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "5"}
+        )
+
+    filename = f"{metric_type}-{start_time:%Y%m%dT%H%M%S}.{format}"
+    try:
+        # The stream frees the slot when it finishes; the background task covers a
+        # response whose body is never iterated (client gone before the first chunk)
+        return StreamingResponse(
+            exporter.stream(slot, metric_type, format, query, args, limit),
+            media_type=metric_export.FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+            background=BackgroundTask(slot.release)
+        )
+    except Exception:
+        slot.release()
+        raise
+
 
-    query = f"""
-        SELECT *
-        FROM {table}
-        WHERE tenant_id = $1
-        AND host = $2
-        AND timestamp BETWEEN $3 AND $4
-        ORDER BY timestamp DESC
+@router.get("/metrics/query/stats")
+async def query_stats(current_user: dict = Depends(get_platform_admin)):
+    """Metric query statistics (result cache, export streams)"""
+    return {
+        "cache": query_cache.get_cache_stats(),
+        "export": metric_export.get_stats(),
+    }
+
+
+async def _query_custom_metrics(
+    tenant_id: str,
+    host: str,
+    start_time: datetime,
+    end_time: datetime,
+    name: Optional[str],
+    labels: Optional[List[str]],
+    max_points: Optional[int] = None
+) -> dict:
+    """Custom metric points for one metric name, optionally narrowed by label values"""
+    if not name:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Query parameter 'name' is required for custom metrics"
+        )
+
+    label_filter = {}
+    for item in labels or []:
+        key, sep, value = item.partition(":")
+        if not sep or not key:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid label filter '{item}'. Use key:value"
+            )
+        label_filter[key] = value
+
+    # Resolve matching series first so the hypertable is scanned by series_id
+    query = """
+        SELECT m.timestamp, s.labels, m.value
+        FROM metrics_custom m
+        JOIN series s ON s.id = m.series_id
+        WHERE m.series_id = ANY(ARRAY(
+            SELECT id FROM series
+            WHERE tenant_id = $1 AND host = $2 AND metric_name = $3 AND labels @> $4::jsonb
+        ))
+        AND m.timestamp BETWEEN $5 AND $6
+        ORDER BY m.timestamp DESC
         LIMIT 10000
     """
 
-    results = await timescale.fetch_all(query, tenant_id, host, start_time, end_time)
+    results = await timescale.fetch_all(
+        query, tenant_id, host, name, json.dumps(label_filter), start_time, end_time
+    )
+    for row in results:
+        row["labels"] = json.loads(row["labels"])
+    fetched = len(results)
+    if max_points:
+        results = downsample.downsample_rows("custom", results, max_points)
 
     return {
-        "metric_type": metric_type,
+        "metric_type": "custom",
+        "name": name,
         "host": host,
         "start_time": start_time,
         "end_time": end_time,
+        "downsampled_from": fetched if len(results) < fetched else None,
         "count": len(results),
         "data": results
     }
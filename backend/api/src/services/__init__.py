@@ -1,5 +1,5 @@
 """Services module"""
-from . import timescale, elastic, alerts_engine, notifications, licensing, vmware_poller, snmp_poller
+from . import timescale, elastic, alerts_engine, notifications, licensing, vmware_poller, snmp_poller, ingest_buffer, ingest_spool, metrics_codec, decode_pool, dictionary_cache, series_store, host_dictionary, host_inventory, cardinality, network_rates, content_encoding, protowire, host_rows, prometheus_remote_write, otlp_metrics, tenant_cache, heartbeat, idempotency, admission, query_planner, downsample, metric_export, query_cache
 
 __all__ = [
     "timescale",
@@ -8,5 +8,28 @@ __all__ = [
     "notifications",
     "licensing",
     "vmware_poller",
-    "snmp_poller"
+    "snmp_poller",
+    "ingest_buffer",
+    "ingest_spool",
+    "metrics_codec",
+    "decode_pool",
+    "dictionary_cache",
+    "series_store",
+    "host_dictionary",
+    "host_inventory",
+    "cardinality",
+    "network_rates",
+    "content_encoding",
+    "protowire",
+    "host_rows",
+    "prometheus_remote_write",
+    "otlp_metrics",
+    "tenant_cache",
+    "heartbeat",
+    "idempotency",
+    "admission",
+    "query_planner",
+    "downsample",
+    "metric_export",
+    "query_cache"
 ]
@@ -0,0 +1,130 @@
+"""
+Ingest admission control
+Sheds ingest load with 429 + Retry-After when the pipeline is saturated (too many
+batches in flight, slow pool acquires, or a nearly full write-behind buffer) instead
+of letting requests queue on the connection pool until everything times out
+"""
+import logging
+import math
+import random
+import time
+from typing import Optional
+from ..config import settings
+from . import timescale, ingest_buffer
+
+logger = logging.getLogger(__name__)
+
+MIN_RETRY_AFTER_SEC = 1
+MAX_RETRY_AFTER_SEC = 60
+
+
+class Overloaded(Exception):
+    """Ingest is over an admission limit"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Admission decisions for ingest batches"""
+
+    def __init__(
+        self,
+        max_inflight: int = 32,
+        max_acquire_wait_ms: float = 250.0,
+        buffer_high_watermark: float = 0.8
+    ):
+        self.max_inflight = max_inflight
+        self.max_acquire_wait_ms = max_acquire_wait_ms
+        self.buffer_high_watermark = buffer_high_watermark
+
+        self.inflight = 0
+        # Smoothed batch processing time (seconds)
+        self._batch_sec = 0.0
+        self.stats = {"admitted": 0, "rejected": 0, "rejected_by": {}}
+
+    def admit(self):
+        """Admit a batch or raise Overloaded; every admit() must be paired with release()"""
+        reason, retry_after = self._check()
+        if reason:
+            self.stats["rejected"] += 1
+            self.stats["rejected_by"][reason] = self.stats["rejected_by"].get(reason, 0) + 1
+            raise Overloaded(reason, self._clamp(retry_after))
+
+        self.inflight += 1
+        self.stats["admitted"] += 1
+        return time.monotonic()
+
+    def release(self, admitted_at: float):
+        """Release an admitted batch and fold its duration into the estimate"""
+        self.inflight -= 1
+        elapsed = time.monotonic() - admitted_at
+        self._batch_sec += 0.2 * (elapsed - self._batch_sec)
+
+    def _check(self):
+        """Return (reason, retry_after_sec) when over a limit, else (None, 0)"""
+        if self.inflight >= self.max_inflight:
+            # Roughly one batch-time per wave of in-flight batches ahead of us
+            waves = self.inflight / self.max_inflight
+            return "inflight", waves * max(self._batch_sec, 1.0)
+
+        # Decays while nothing acquires, so shedding stops once a stuck pool drains
+        wait_ms = timescale.get_acquire_wait_ms()
+        if wait_ms > self.max_acquire_wait_ms:
+            return "pool_wait", 2 * wait_ms / 1000
+
+        buffer = ingest_buffer.get_buffer()
+        if buffer and buffer.depth >= self.buffer_high_watermark * buffer.max_rows:
+            return "buffer_depth", self._buffer_drain_sec(buffer)
+
+        return None, 0
+
+    @staticmethod
+    def _buffer_drain_sec(buffer: "ingest_buffer.IngestBuffer") -> float:
+        """Estimate how long the flusher needs to drain back below the watermark"""
+        last_ms = buffer.stats.get("last_flush_ms")
+        if not last_ms or not buffer.flush_rows:
+            return buffer.flush_interval_sec
+        rows_per_sec = buffer.flush_rows / (last_ms / 1000)
+        return max(buffer.flush_interval_sec, buffer.depth / max(rows_per_sec, 1.0))
+
+    @staticmethod
+    def _clamp(retry_after: float) -> int:
+        # Jitter spreads retries so shed agents don't return in lockstep
+        seconds = math.ceil(retry_after) + random.randint(0, 2)
+        return max(MIN_RETRY_AFTER_SEC, min(MAX_RETRY_AFTER_SEC, seconds))
+
+    def get_stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "batch_ms": round(self._batch_sec * 1000, 1),
+            "max_acquire_wait_ms": self.max_acquire_wait_ms,
+            "pool": timescale.get_pool_stats(),
+            **self.stats,
+        }
+
+
+# Global controller instance
+_controller = AdmissionController(
+    max_inflight=settings.ingest_max_inflight_batches,
+    max_acquire_wait_ms=settings.ingest_max_acquire_wait_ms,
+    buffer_high_watermark=settings.ingest_buffer_high_watermark
+)
+
+
+def admit() -> float:
+    """Admit an ingest batch (raises Overloaded); returns a token for release()"""
+    return _controller.admit()
+
+
+def release(token: Optional[float]):
+    """Release an admitted ingest batch"""
+    if token is not None:
+        _controller.release(token)
+
+
+def get_admission_stats() -> dict:
+    return _controller.get_stats()
@@ -6,7 +6,8 @@ from datetime import datetime, timedelta
 from typing import List, Dict
 import hashlib
 import logging
-from . import timescale
+from . import timescale, heartbeat
+from .network_rates import RATE_COLUMNS as NETWORK_RATE_COLUMNS
 
 logger = logging.getLogger(__name__)
 
@@ -185,10 +186,16 @@ class AlertsEngine:
         baseline_minutes = config.get("baseline_minutes", 60)
         duration = timedelta(minutes=rule["duration_minutes"])
 
-        # Table mapping for network metrics
-        if "network" in metric:
+        # Network counters are compared as per-second rates (computed at ingest);
+        # averaging the raw cumulative counters would only track their growth
+        if metric.startswith("network_"):
             table = "metrics_network"
             column = metric.replace("network_", "")
+            if not column.endswith("_rate"):
+                column += "_rate"
+            if column not in NETWORK_RATE_COLUMNS:
+                logger.warning(f"Unknown anomaly metric {metric} in rule {rule.get('id')}")
+                return
         else:
             return
 
@@ -225,15 +232,17 @@ class AlertsEngine:
 
         for curr in current_values:
             key = f"{curr['tenant_id']}:{curr['host']}:{curr['interface']}"
-            baseline = baseline_map.get(key, 0)
+            # Rates are NULL for first samples and counter resets
+            baseline = baseline_map.get(key) or 0
+            current = curr["current_avg"]
 
-            if baseline > 0 and curr["current_avg"] > (baseline * multiplier):
+            if baseline > 0 and current is not None and current > (baseline * multiplier):
                 await self._fire_alert(
                     rule,
                     curr["tenant_id"],
                     curr["host"],
-                    curr["current_avg"],
-                    f"{rule['name']}: {metric} spike detected ({curr['current_avg']:.0f} vs baseline {baseline:.0f})"
+                    current,
+                    f"{rule['name']}: {metric} spike detected ({current:.0f}/s vs baseline {baseline:.0f}/s)"
                 )
 
     async def _evaluate_absence(self, rule: Dict):
@@ -249,7 +258,11 @@ class AlertsEngine:
 
         results = await timescale.fetch_all(query, duration)
 
+        # agents.last_seen is written back periodically; trust fresher in-memory heartbeats
+        cutoff = datetime.utcnow() - duration
         for result in results:
+            if heartbeat.seen_since(result["tenant_id"], result["host"], cutoff):
+                continue
             await self._fire_alert(
                 rule,
                 result["tenant_id"],
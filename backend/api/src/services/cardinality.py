@@ -0,0 +1,162 @@
+"""
+Per-host cardinality limits at ingest
+Process names, network interfaces and disk devices are compression segmentby columns,
+so every new value opens new compressed segments. On container hosts these churn
+without bound; each (tenant, host) may keep at most a configured number of distinct
+values per metric type. Overflow process rows are folded into one "_other" row per
+timestamp; overflow interface and disk rows are dropped.
+
+Values are tracked in exact bounded sets with a last-seen time; once a set is full,
+values not seen for a window are evicted to make room for new ones.
+"""
+import logging
+import time
+from collections import deque
+from typing import Callable, Dict, Hashable, List, Tuple
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+OTHER_PROCESS = "_other"
+
+# metric_type -> distinct value of a row (rows in metrics_codec.SCHEMAS column order)
+VALUE_OF: Dict[str, Callable[[tuple], Hashable]] = {
+    # (timestamp, tenant_id, host, pid, name, cpu_percent, memory_percent, status, username)
+    "process": lambda row: (row[4], row[8]),
+    # (timestamp, tenant_id, host, interface, ...)
+    "network": lambda row: row[3],
+    # (timestamp, tenant_id, host, device, mountpoint, ...)
+    "disk": lambda row: (row[3], row[4]),
+}
+
+
+class _ValueSet:
+    """Distinct values of one (tenant, host, metric type) with last-seen times"""
+    __slots__ = ("limit", "seen", "pruned_at", "over_limit")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.seen: Dict[Hashable, float] = {}
+        self.pruned_at = 0.0
+        self.over_limit = False
+
+
+class CardinalityLimiter:
+    """Bounded distinct-value sets per (tenant_id, host, metric_type)"""
+
+    def __init__(self, limits: Dict[str, int], window_sec: float = 3600):
+        self.limits = limits
+        self.window_sec = window_sec
+        self._sets: Dict[Tuple[str, str, str], _ValueSet] = {}
+        # Most recent limit hits, for the stats endpoint
+        self._recent = deque(maxlen=20)
+        self.stats = {
+            "limited_rows": {metric_type: 0 for metric_type in limits},
+            "limit_hits": 0,
+        }
+
+    def admit(self, tenant_id: str, host: str, metric_type: str, value: Hashable, now: float) -> bool:
+        """Whether a row with this value may be stored; records the value when admitted"""
+        key = (tenant_id, host, metric_type)
+        values = self._sets.get(key)
+        if values is None:
+            values = self._sets[key] = _ValueSet(self.limits[metric_type])
+
+        if value in values.seen:
+            values.seen[value] = now
+            return True
+
+        if len(values.seen) >= values.limit:
+            self._prune(values, now)
+        if len(values.seen) >= values.limit:
+            if not values.over_limit:
+                values.over_limit = True
+                self.stats["limit_hits"] += 1
+                self._recent.append({
+                    "tenant_id": tenant_id, "host": host, "metric_type": metric_type,
+                    "limit": values.limit, "at": time.time()
+                })
+                logger.warning(
+                    f"Cardinality limit hit: {tenant_id}/{host} has {values.limit} distinct {metric_type} values"
+                )
+            return False
+
+        values.seen[value] = now
+        return True
+
+    def _prune(self, values: _ValueSet, now: float):
+        # At most once per window/10 per set, so a flood of new values stays O(1) per row
+        if now - values.pruned_at < self.window_sec / 10:
+            return
+        values.pruned_at = now
+        cutoff = now - self.window_sec
+        values.seen = {value: seen_at for value, seen_at in values.seen.items() if seen_at >= cutoff}
+        if len(values.seen) < values.limit:
+            values.over_limit = False
+
+    def limit(self, metric_type: str, rows: List[tuple], now: float) -> List[tuple]:
+        """Rows within the limit; overflow process rows come back aggregated per timestamp"""
+        value_of = VALUE_OF[metric_type]
+        kept = []
+        overflow = []
+        for row in rows:
+            if self.admit(row[1], row[2], metric_type, value_of(row), now):
+                kept.append(row)
+            else:
+                overflow.append(row)
+
+        if overflow:
+            self.stats["limited_rows"][metric_type] += len(overflow)
+            if metric_type == "process":
+                kept.extend(_aggregate_processes(overflow))
+        return kept
+
+    def get_stats(self) -> dict:
+        return {
+            "limits": self.limits,
+            "window_sec": self.window_sec,
+            "tracked_sets": len(self._sets),
+            "over_limit": sum(1 for values in self._sets.values() if values.over_limit),
+            "recent_hits": list(self._recent),
+            **self.stats,
+        }
+
+
+def _aggregate_processes(rows: List[tuple]) -> List[tuple]:
+    """Fold overflow process rows into one _other row per (timestamp, tenant, host)"""
+    totals: Dict[tuple, List[float]] = {}
+    for row in rows:
+        total = totals.setdefault(row[:3], [0.0, 0.0])
+        total[0] += row[5] or 0.0
+        total[1] += row[6] or 0.0
+    return [
+        key + (0, OTHER_PROCESS, round(cpu, 2), round(memory, 2), None, None)
+        for key, (cpu, memory) in totals.items()
+    ]
+
+
+# Global limiter instance
+_limiter = CardinalityLimiter(
+    limits={
+        "process": settings.cardinality_max_processes_per_host,
+        "network": settings.cardinality_max_interfaces_per_host,
+        "disk": settings.cardinality_max_disks_per_host,
+    },
+    window_sec=settings.cardinality_window_sec
+)
+
+
+def limit_batches(batches: Dict[str, List[tuple]]) -> Dict[str, List[tuple]]:
+    """Apply per-host cardinality limits to {metric_type: rows}"""
+    if not settings.cardinality_limit_enabled:
+        return batches
+    now = time.monotonic()
+    return {
+        metric_type: _limiter.limit(metric_type, rows, now) if rows and metric_type in VALUE_OF else rows
+        for metric_type, rows in batches.items()
+    }
+
+
+def get_stats() -> dict:
+    """Cardinality limits, overflow counters and recent limit hits"""
+    return {"enabled": settings.cardinality_limit_enabled, **_limiter.get_stats()}
@@ -0,0 +1,212 @@
+"""
+Streaming request body decompression (Content-Encoding: gzip / zstd)
+Output is produced in bounded chunks and capped at a maximum decompressed size,
+so a small compressed body cannot expand into unbounded memory (decompression bombs).
+A body that ends inside a gzip member or zstd frame is rejected as truncated.
+"""
+import zlib
+from typing import AsyncIterator, List
+import zstandard
+
+SUPPORTED_ENCODINGS = ("identity", "gzip", "zstd")
+
+# Largest decompressed chunk handed to the NDJSON splitter at once
+OUTPUT_CHUNK_SIZE = 256 * 1024
+
+
+class UnsupportedEncodingError(ValueError):
+    """Content-Encoding is not one of SUPPORTED_ENCODINGS"""
+
+
+class DecompressedSizeExceeded(ValueError):
+    """Decompressed body grew past the allowed size"""
+
+
+class InvalidCompressedData(ValueError):
+    """Body is not valid data for its declared Content-Encoding"""
+
+
+def normalize_encoding(header_value: str) -> str:
+    """Normalize a Content-Encoding header value (x-gzip is an alias of gzip)"""
+    encoding = (header_value or "identity").strip().lower()
+    if encoding == "x-gzip":
+        encoding = "gzip"
+    if encoding not in SUPPORTED_ENCODINGS:
+        raise UnsupportedEncodingError(
+            f"Unsupported Content-Encoding '{encoding}'. Supported: {', '.join(SUPPORTED_ENCODINGS)}"
+        )
+    return encoding
+
+
+async def decompress_stream(
+    chunks: AsyncIterator[bytes],
+    encoding: str,
+    max_bytes: int
+) -> AsyncIterator[bytes]:
+    """Decompress a streamed body chunk by chunk, raising once output exceeds max_bytes"""
+    if encoding == "gzip":
+        source = _gunzip(chunks, max_bytes)
+    elif encoding == "zstd":
+        source = _unzstd(chunks, max_bytes)
+    else:
+        source = chunks
+
+    async for chunk in source:
+        yield chunk
+
+
+async def _gunzip(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    produced = 0
+    # Whether the current member has been given any input
+    started = False
+
+    async for chunk in chunks:
+        data = chunk
+        while data:
+            started = True
+            try:
+                out = decompressor.decompress(data, OUTPUT_CHUNK_SIZE)
+            except zlib.error as e:
+                raise InvalidCompressedData(f"Invalid gzip body: {e}")
+
+            if decompressor.eof:
+                # Concatenated gzip members: start a new decompressor on the remainder
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                started = False
+            else:
+                data = decompressor.unconsumed_tail
+
+            if out:
+                produced += len(out)
+                if produced > max_bytes:
+                    raise DecompressedSizeExceeded(f"Decompressed body exceeds {max_bytes} bytes")
+                yield out
+
+    if started and not decompressor.eof:
+        # decompress() already returned everything it could; a member without its
+        # trailer was cut off
+        raise InvalidCompressedData("Invalid gzip body: truncated stream")
+
+
+class _BoundedSink:
+    """Collects zstd output as it is produced, failing fast past the size cap"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.produced = 0
+        self.pending: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.produced += len(data)
+        if self.produced > self.max_bytes:
+            raise DecompressedSizeExceeded(f"Decompressed body exceeds {self.max_bytes} bytes")
+        self.pending.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> List[bytes]:
+        out, self.pending = self.pending, []
+        return out
+
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_ZSTD_FCS_SIZES = (0, 2, 4, 8)
+_ZSTD_DICT_ID_SIZES = (0, 1, 2, 4)
+
+
+class _ZstdFrameTracker:
+    """
+    Walks the frame and block headers of zstd input (without decompressing) so the end
+    of the body can be checked to fall on a frame boundary; the stream writer has no
+    end-of-frame signal of its own
+    """
+
+    def __init__(self):
+        self._state = "frame"  # next header: "frame", "block" or "checksum"
+        self._header = b""
+        self._skip = 0
+        self._checksum = False
+
+    @property
+    def complete(self) -> bool:
+        return self._state == "frame" and not self._header and not self._skip
+
+    def feed(self, data: bytes):
+        pos = 0
+        while pos < len(data):
+            if self._skip:
+                step = min(self._skip, len(data) - pos)
+                self._skip -= step
+                pos += step
+                continue
+            needed = self._header_size()
+            take = min(needed - len(self._header), len(data) - pos)
+            self._header += data[pos:pos + take]
+            pos += take
+            if len(self._header) == self._header_size():
+                self._consume_header()
+
+    def _header_size(self) -> int:
+        header = self._header
+        if self._state == "block":
+            return 3
+        if self._state == "checksum":
+            return 4
+        if len(header) < 4:
+            return 4
+        if header[:4] != _ZSTD_MAGIC:
+            # Skippable frame: magic, 4-byte length, payload
+            return 8
+        if len(header) < 5:
+            return 5
+        descriptor = header[4]
+        single_segment = descriptor & 0x20
+        fcs_size = _ZSTD_FCS_SIZES[descriptor >> 6] or (1 if single_segment else 0)
+        return 5 + (0 if single_segment else 1) + _ZSTD_DICT_ID_SIZES[descriptor & 0x03] + fcs_size
+
+    def _consume_header(self):
+        header, self._header = self._header, b""
+        if self._state == "block":
+            block = int.from_bytes(header, "little")
+            # RLE blocks carry one byte; raw and compressed blocks carry their size
+            self._skip = 1 if (block >> 1) & 3 == 1 else block >> 3
+            if block & 1:
+                self._state = "checksum" if self._checksum else "frame"
+        elif self._state == "checksum":
+            self._state = "frame"
+        elif header[:4] == _ZSTD_MAGIC:
+            self._checksum = bool(header[4] & 0x04)
+            self._state = "block"
+        elif 0x184D2A50 <= int.from_bytes(header[:4], "little") <= 0x184D2A5F:
+            self._skip = int.from_bytes(header[4:8], "little")
+        else:
+            raise InvalidCompressedData("Invalid zstd body: unknown frame magic")
+
+
+async def _unzstd(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    sink = _BoundedSink(max_bytes)
+    frames = _ZstdFrameTracker()
+    writer = zstandard.ZstdDecompressor().stream_writer(
+        sink,
+        write_size=OUTPUT_CHUNK_SIZE,
+        closefd=False
+    )
+
+    async for chunk in chunks:
+        try:
+            writer.write(chunk)
+        except zstandard.ZstdError as e:
+            raise InvalidCompressedData(f"Invalid zstd body: {e}")
+        frames.feed(chunk)
+        for out in sink.drain():
+            yield out
+
+    try:
+        writer.flush()
+    except zstandard.ZstdError as e:
+        raise InvalidCompressedData(f"Invalid zstd body: {e}")
+    if not frames.complete:
+        raise InvalidCompressedData("Invalid zstd body: truncated frame")
+    for out in sink.drain():
+        yield out
@@ -0,0 +1,203 @@
+"""
+Process-pool decoding of large NDJSON batches
+Decoding and validating a multi-megabyte batch holds the event loop (and the GIL) for
+tens of milliseconds. Batches at or above a size threshold are decoded in worker
+processes instead and come back as column arrays per metric type, which pickle far
+smaller than row tuples; smaller batches stay inline, where the round trip costs more
+than it saves. Workers are spawned (not forked) so they never inherit the event loop.
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Set, Tuple
+from ..config import settings
+from . import metrics_codec
+
+logger = logging.getLogger(__name__)
+
+
+class RecordLimitExceeded(Exception):
+    """Raised when a batch holds more records than metrics_batch_max_records"""
+
+    def __init__(self, max_records: int):
+        super().__init__(f"Batch exceeds {max_records} records")
+        self.max_records = max_records
+
+    def __reduce__(self):
+        return (type(self), (self.max_records,))
+
+
+class DecodedBatch:
+    """Decoded rows per metric type, the hosts seen and the partial-accept report"""
+    __slots__ = ("batches", "hosts", "report")
+
+    def __init__(self, batches: Dict[str, List[tuple]], hosts: Set[str], report: Optional[dict]):
+        self.batches = batches
+        self.hosts = hosts
+        self.report = report
+
+
+def _decode_columns(
+    body: bytes,
+    tenant_id: str,
+    partial: bool,
+    max_records: int,
+    max_reported_lines: int
+) -> Tuple[Dict[str, tuple], Set[str], Optional[dict], float, float]:
+    """
+    Worker entry point: decode an NDJSON body into column arrays per metric type
+    Returns (columns, hosts, report, started_at, decode_sec); started_at is wall-clock
+    time so the parent can tell how long the job waited for a worker
+    """
+    started_at = time.time()
+    started = time.perf_counter()
+
+    decoder = metrics_codec.BatchDecoder(tenant_id, partial, max_reported_lines)
+    records = 0
+    for line in body.split(b"\n"):
+        if line.strip():
+            records += 1
+            if records > max_records:
+                raise RecordLimitExceeded(max_records)
+        decoder.add(line)
+
+    columns = {
+        metric_type: tuple(zip(*rows))
+        for metric_type, rows in decoder.batches.items() if rows
+    }
+    report = decoder.report.to_dict() if decoder.report is not None else None
+    return columns, decoder.hosts, report, started_at, time.perf_counter() - started
+
+
+class DecodePool:
+    """Process pool for batch decoding, with queue and decode time counters"""
+
+    def __init__(self, workers: int = 2, min_bytes: int = 1024 * 1024):
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.stats = {
+            "offloaded": 0,
+            "inline": 0,
+            "offloaded_bytes": 0,
+            "failures": 0,
+            "queue_ms_total": 0.0,
+            "queue_ms_max": 0.0,
+            "decode_ms_total": 0.0,
+            "decode_ms_max": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"Decode pool started ({self.workers} workers, threshold {self.min_bytes} bytes)")
+
+    def stop(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def should_offload(self, size: int) -> bool:
+        """Whether a decompressed body of this size is worth a worker round trip"""
+        if self.running and size >= self.min_bytes:
+            return True
+        self.stats["inline"] += 1
+        return False
+
+    async def decode(self, body: bytes, tenant_id: str, partial: bool = False) -> DecodedBatch:
+        """
+        Decode an NDJSON body in a worker process
+        Raises metrics_codec.MetricDecodeError or RecordLimitExceeded like the inline path
+        """
+        loop = asyncio.get_running_loop()
+        args = (
+            body,
+            tenant_id,
+            partial,
+            settings.metrics_batch_max_records,
+            settings.ingest_partial_max_reported_lines
+        )
+        submitted_at = time.time()
+        try:
+            columns, hosts, report, started_at, decode_sec = await loop.run_in_executor(
+                self._executor, _decode_columns, *args
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed): replace the pool and decode this batch inline
+            self.stats["failures"] += 1
+            logger.error("Decode pool worker died; restarting pool")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self.start()
+            submitted_at = time.time()
+            columns, hosts, report, started_at, decode_sec = _decode_columns(*args)
+
+        queue_ms = max(0.0, (started_at - submitted_at) * 1000)
+        decode_ms = decode_sec * 1000
+        self.stats["offloaded"] += 1
+        self.stats["offloaded_bytes"] += len(body)
+        self.stats["queue_ms_total"] += queue_ms
+        self.stats["queue_ms_max"] = max(self.stats["queue_ms_max"], queue_ms)
+        self.stats["decode_ms_total"] += decode_ms
+        self.stats["decode_ms_max"] = max(self.stats["decode_ms_max"], decode_ms)
+
+        batches = {metric_type: [] for metric_type in metrics_codec.SCHEMAS}
+        for metric_type, arrays in columns.items():
+            batches[metric_type] = list(zip(*arrays))
+        return DecodedBatch(batches, hosts, report)
+
+    def get_stats(self) -> dict:
+        offloaded = self.stats["offloaded"]
+        return {
+            "enabled": self.running,
+            "workers": self.workers,
+            "min_bytes": self.min_bytes,
+            **self.stats,
+            "queue_ms_avg": round(self.stats["queue_ms_total"] / offloaded, 3) if offloaded else 0.0,
+            "decode_ms_avg": round(self.stats["decode_ms_total"] / offloaded, 3) if offloaded else 0.0,
+        }
+
+
+# Global pool instance
+_pool: DecodePool = None
+
+
+def get_pool() -> DecodePool:
+    """Get the running decode pool, or None when process-pool decoding is disabled"""
+    if _pool and _pool.running:
+        return _pool
+    return None
+
+
+def get_pool_stats() -> dict:
+    """Stats for the global pool (reports disabled when not running)"""
+    if not _pool:
+        return {"enabled": False}
+    return _pool.get_stats()
+
+
+async def start_decode_pool():
+    """Start the global decode pool"""
+    global _pool
+    if not _pool:
+        _pool = DecodePool(
+            workers=settings.ingest_decode_pool_workers,
+            min_bytes=settings.ingest_decode_pool_min_kb * 1024
+        )
+        _pool.start()
+
+
+async def stop_decode_pool():
+    """Stop the global decode pool, waiting for in-flight batches"""
+    global _pool
+    if _pool:
+        await asyncio.get_running_loop().run_in_executor(None, _pool.stop)
+        _pool = None
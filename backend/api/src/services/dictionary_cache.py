@@ -0,0 +1,120 @@
+"""
+Integer-keyed dictionary tables
+Several hypertables store a compact SERIAL id instead of repeating strings on every row
+(series, hosts, process names). DictionaryCache maps keys to those ids through an
+in-process LRU, creating dictionary rows for unseen keys in one round trip per batch.
+"""
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+from . import timescale
+
+logger = logging.getLogger(__name__)
+
+
+class DictionaryCache:
+    """
+    Bounded LRU of key -> id backed by a table with `id SERIAL` and a UNIQUE constraint
+    over `columns` [(name, postgres type)]. `encode` turns a key into one value per column.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        columns: Sequence[Tuple[str, str]],
+        max_entries: int = 500000,
+        encode: Optional[Callable[[Hashable], tuple]] = None
+    ):
+        self.table = table
+        self.max_entries = max_entries
+        self._encode = encode or tuple
+        self._width = len(columns)
+        self._ids: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._keys: Dict[int, Hashable] = {}
+        self.stats = {"hits": 0, "misses": 0, "created_or_loaded": 0, "evictions": 0}
+
+        names = ", ".join(name for name, _ in columns)
+        arrays = ", ".join(f"${i}::{pg_type}[]" for i, (_, pg_type) in enumerate(columns, start=1))
+        # Insert unseen keys and return ids for the whole input in one round trip.
+        # Rows inserted by a concurrent transaction are invisible to this snapshot and
+        # come back NULL; those are looked up again by resolve().
+        self._query = f"""
+            WITH input AS (
+                SELECT * FROM unnest({arrays})
+                    WITH ORDINALITY AS t({names}, idx)
+            ),
+            inserted AS (
+                INSERT INTO {table} ({names})
+                SELECT {names} FROM input
+                ON CONFLICT ({names}) DO NOTHING
+                RETURNING id, {names}
+            )
+            SELECT i.idx, COALESCE(d.id, n.id) AS id
+            FROM input i
+            LEFT JOIN {table} d USING ({names})
+            LEFT JOIN inserted n USING ({names})
+        """
+
+    async def resolve(self, keys: Iterable[Hashable]) -> Dict[Hashable, int]:
+        """Map keys to ids, creating dictionary entries for new keys"""
+        resolved = {}
+        missing = []
+        for key in set(keys):
+            key_id = self._ids.get(key)
+            if key_id is None:
+                missing.append(key)
+            else:
+                self._ids.move_to_end(key)
+                resolved[key] = key_id
+
+        self.stats["hits"] += len(resolved)
+        self.stats["misses"] += len(missing)
+
+        # Second pass picks up keys created concurrently by another process
+        for _ in range(2):
+            if not missing:
+                break
+            missing = await self._load(missing, resolved)
+
+        if missing:
+            raise RuntimeError(f"Could not resolve {len(missing)} {self.table} ids")
+        return resolved
+
+    async def _load(self, keys: List[Hashable], resolved: Dict[Hashable, int]) -> List[Hashable]:
+        encoded = [self._encode(key) for key in keys]
+        rows = await timescale.fetch_all(
+            self._query,
+            *([values[i] for values in encoded] for i in range(self._width))
+        )
+        unresolved = []
+        ids = {row["idx"]: row["id"] for row in rows}
+        for idx, key in enumerate(keys, start=1):
+            key_id = ids.get(idx)
+            if key_id is None:
+                unresolved.append(key)
+                continue
+            resolved[key] = key_id
+            self._remember(key, key_id)
+        self.stats["created_or_loaded"] += len(keys) - len(unresolved)
+        return unresolved
+
+    def keys_for(self, ids: Iterable[int]) -> Optional[set]:
+        """Keys of cached ids, or None when any of them is no longer cached"""
+        keys = set()
+        for key_id in ids:
+            key = self._keys.get(key_id)
+            if key is None:
+                return None
+            keys.add(key)
+        return keys
+
+    def _remember(self, key: Hashable, key_id: int):
+        self._ids[key] = key_id
+        self._keys[key_id] = key
+        while len(self._ids) > self.max_entries:
+            _, evicted_id = self._ids.popitem(last=False)
+            self._keys.pop(evicted_id, None)
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> dict:
+        return {"entries": len(self._ids), "max_entries": self.max_entries, **self.stats}
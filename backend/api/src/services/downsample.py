@@ -0,0 +1,118 @@
+"""
+Server-side downsampling of chart queries
+Largest-Triangle-Three-Buckets (LTTB) keeps, per bucket, the row forming the largest
+triangle with the previously kept row and the next bucket's average, so spikes and dips
+survive while a series shrinks to the number of points a chart can draw. Bucket averages
+and triangle areas are computed with NumPy; only the walk over buckets is a Python loop.
+Rows are kept whole; the triangle is measured on one value per metric type.
+"""
+from typing import Dict, Hashable, List, Optional, Tuple
+import numpy as np
+
+# metric_type -> columns identifying one series within a host's rows (rows are also split by host)
+SERIES_KEYS: Dict[str, Tuple[str, ...]] = {
+    "network": ("interface",),
+    "disk": ("device", "mountpoint"),
+    "process": ("pid", "name"),
+    "custom": ("labels",),
+}
+
+# metric_type -> candidate value columns (summed), raw columns first, then aggregate tiers
+VALUE_COLUMNS: Dict[str, Tuple[Tuple[str, ...], ...]] = {
+    "cpu": (("cpu_percent",), ("cpu_percent_avg",)),
+    "memory": (("memory_percent",), ("memory_percent_avg",)),
+    "network": (("bytes_sent_rate", "bytes_recv_rate"), ("bytes_sent_rate_avg", "bytes_recv_rate_avg")),
+    "disk": (("percent",),),
+    "process": (("cpu_percent",),),
+    "custom": (("value",),),
+}
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of the n_out points LTTB keeps from ascending x; first and last are always kept
+    NaN values are never chosen over a real value in the same bucket
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets over the points between the first and the last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    valid = ~np.isnan(y)
+    y_filled = np.where(valid, y, 0.0)
+    counts = np.add.reduceat(valid[:n - 1].astype(np.int64), edges[:-1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / np.diff(edges)
+        avg_y = np.add.reduceat(y_filled[:n - 1], edges[:-1]) / counts
+    # Each bucket looks ahead to the next bucket's average; the last one to the final point
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y[i] - y[a])
+        )
+        a = lo + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        selected[i + 1] = a
+    return selected
+
+
+def _value_columns(metric_type: str, row: dict) -> Optional[Tuple[str, ...]]:
+    for columns in VALUE_COLUMNS.get(metric_type, ()):
+        if all(column in row for column in columns):
+            return columns
+    # Projected away: use the first numeric value column that is left
+    if metric_type in VALUE_COLUMNS:
+        keys = SERIES_KEYS.get(metric_type, ())
+        for column, value in row.items():
+            if column not in keys and isinstance(value, (int, float)) and not isinstance(value, bool):
+                return (column,)
+    return None
+
+
+def _series_key(keys: Tuple[str, ...], row: dict) -> Hashable:
+    # Custom metric labels are dicts; everything else is hashable as is
+    return tuple(repr(row.get(key)) if isinstance(row.get(key), dict) else row.get(key) for key in keys)
+
+
+def downsample_rows(metric_type: str, rows: List[dict], max_points: int) -> List[dict]:
+    """
+    LTTB-downsample each series in rows to at most max_points rows
+    Rows may come in either timestamp order; the result keeps that order.
+    Metric types without a value column (host_info) are returned unchanged
+    """
+    if not rows:
+        return rows
+    columns = _value_columns(metric_type, rows[0])
+    if columns is None:
+        return rows
+
+    descending = rows[0]["timestamp"] > rows[-1]["timestamp"]
+    ordered = rows[::-1] if descending else rows
+
+    series: Dict[Hashable, List[dict]] = {}
+    keys = ("host",) + SERIES_KEYS.get(metric_type, ())
+    for row in ordered:
+        series.setdefault(_series_key(keys, row), []).append(row)
+
+    kept = []
+    for series_rows in series.values():
+        if len(series_rows) <= max_points:
+            kept.extend(series_rows)
+            continue
+        timestamps = np.array([row["timestamp"] for row in series_rows], dtype="datetime64[us]")
+        x = (timestamps - timestamps[0]).astype(np.float64)
+        y = np.zeros(len(series_rows))
+        for column in columns:
+            y += np.array([row[column] for row in series_rows], dtype=np.float64)
+        kept.extend(series_rows[i] for i in lttb_indices(x, y, max_points))
+
+    kept.sort(key=lambda row: row["timestamp"], reverse=descending)
+    return kept
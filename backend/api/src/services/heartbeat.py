@@ -0,0 +1,160 @@
+"""
+Agent heartbeat tracker
+Records agent last-seen times in memory as batches arrive and writes them to the
+agents table periodically with one set-based UPDATE, instead of one UPDATE per host per batch.
+Once written, entries older than the flush interval are evicted; agents.last_seen holds them
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from ..config import settings
+from . import timescale
+
+logger = logging.getLogger(__name__)
+
+FLUSH_QUERY = """
+    UPDATE agents AS a
+    SET last_seen = v.seen
+    FROM unnest($1::text[], $2::text[], $3::timestamp[]) AS v(tenant_id, hostname, seen)
+    WHERE a.tenant_id = v.tenant_id
+      AND a.hostname = v.hostname
+      AND (a.last_seen IS NULL OR a.last_seen < v.seen)
+"""
+
+
+class HeartbeatTracker:
+    """In-memory last-seen map with periodic write-back"""
+
+    def __init__(self, flush_interval_sec: float = 15.0):
+        self.flush_interval_sec = flush_interval_sec
+        self.running = False
+
+        # (tenant_id, hostname) -> last seen (naive UTC, like agents.last_seen)
+        self._last_seen: Dict[Tuple[str, str], datetime] = {}
+        # Entries changed since the last flush
+        self._dirty: Dict[Tuple[str, str], datetime] = {}
+        self._task: asyncio.Task = None
+        self.stats = {"flushes": 0, "failed_flushes": 0, "flushed_hosts": 0, "evicted_hosts": 0}
+
+    def record(self, tenant_id: str, hosts: Iterable[str], seen: Optional[datetime] = None):
+        """Mark hosts as seen (defaults to now)"""
+        seen = seen or datetime.utcnow()
+        for host in hosts:
+            key = (tenant_id, host)
+            self._last_seen[key] = seen
+            self._dirty[key] = seen
+
+    def last_seen(self, tenant_id: str, host: str) -> Optional[datetime]:
+        """Last time this process saw the host, or None"""
+        return self._last_seen.get((tenant_id, host))
+
+    def seen_since(self, tenant_id: str, host: str, since: datetime) -> bool:
+        """Whether this process has seen the host at or after `since`"""
+        seen = self._last_seen.get((tenant_id, host))
+        return seen is not None and seen >= since
+
+    async def flush(self) -> int:
+        """Write pending last-seen times in one UPDATE ... FROM unnest(...)"""
+        if not self._dirty:
+            self._evict()
+            return 0
+
+        pending, self._dirty = self._dirty, {}
+        tenants, hosts, seen = [], [], []
+        for (tenant_id, host), ts in pending.items():
+            tenants.append(tenant_id)
+            hosts.append(host)
+            seen.append(ts)
+
+        try:
+            await timescale.execute_query(FLUSH_QUERY, tenants, hosts, seen)
+        except Exception as e:
+            self.stats["failed_flushes"] += 1
+            logger.error(f"Heartbeat flush failed ({len(pending)} hosts): {e}")
+            # Keep the newest time per host for the next attempt
+            for key, ts in pending.items():
+                if key not in self._dirty or self._dirty[key] < ts:
+                    self._dirty[key] = ts
+            return 0
+
+        self.stats["flushes"] += 1
+        self.stats["flushed_hosts"] += len(pending)
+        self._evict()
+        return len(pending)
+
+    def _evict(self):
+        """
+        Drop written entries older than the flush interval, so hosts that stopped
+        reporting don't stay in memory; anything still dirty is kept for the next flush
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.flush_interval_sec)
+        stale = [key for key, seen in self._last_seen.items() if seen < cutoff and key not in self._dirty]
+        for key in stale:
+            del self._last_seen[key]
+        self.stats["evicted_hosts"] += len(stale)
+
+    async def start(self):
+        """Flush periodically until stopped"""
+        self.running = True
+        logger.info("Heartbeat tracker started")
+
+        while self.running:
+            await asyncio.sleep(self.flush_interval_sec)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Heartbeat tracker error: {e}")
+
+    async def stop(self):
+        """Stop the flush loop and write pending heartbeats"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        logger.info("Heartbeat tracker stopped")
+
+    def get_stats(self) -> dict:
+        return {
+            "tracked_hosts": len(self._last_seen),
+            "pending_hosts": len(self._dirty),
+            **self.stats,
+        }
+
+
+# Global tracker instance
+_tracker = HeartbeatTracker(flush_interval_sec=settings.heartbeat_flush_interval_sec)
+
+
+def record(tenant_id: str, hosts: Iterable[str], seen: Optional[datetime] = None):
+    """Mark hosts of a tenant as seen"""
+    _tracker.record(tenant_id, hosts, seen)
+
+
+def last_seen(tenant_id: str, host: str) -> Optional[datetime]:
+    """In-memory last-seen lookup"""
+    return _tracker.last_seen(tenant_id, host)
+
+
+def seen_since(tenant_id: str, host: str, since: datetime) -> bool:
+    """Whether the host reported at or after `since` according to this process"""
+    return _tracker.seen_since(tenant_id, host, since)
+
+
+def get_tracker_stats() -> dict:
+    return _tracker.get_stats()
+
+
+async def start_heartbeat_tracker():
+    """Start the periodic heartbeat flush"""
+    if not _tracker.running:
+        _tracker._task = asyncio.create_task(_tracker.start())
+
+
+async def stop_heartbeat_tracker():
+    """Stop the tracker, flushing pending heartbeats"""
+    await _tracker.stop()
@@ -0,0 +1,107 @@
+"""
+Host dictionary for the hot metric hypertables
+metrics_cpu/disk/network/process rows are stored in *_compact hypertables keyed by an
+integer host_id (and, for processes, a process_name_id) instead of repeating tenant_id,
+host, name and username strings. Views with the original table names join the
+dictionaries back in, so queries are unchanged; ingest converts rows here before COPY.
+"""
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from ..config import settings
+from .dictionary_cache import DictionaryCache
+
+
+# Ingest table (metrics_codec.SCHEMAS) -> compact hypertable it is stored in.
+# Rows keep their columns after (timestamp, tenant_id, host), with host_id in place of
+# tenant_id/host; process rows also swap name/username for a process_name_id.
+COMPACT_TABLES: Dict[str, str] = {
+    "metrics_cpu": "metrics_cpu_compact",
+    "metrics_disk": "metrics_disk_compact",
+    "metrics_network": "metrics_network_compact",
+    "metrics_process": "metrics_process_compact",
+}
+
+PROCESS_COLUMNS = ("timestamp", "host_id", "pid", "process_name_id", "cpu_percent", "memory_percent", "status")
+
+PROCESS_TABLE = "metrics_process"
+
+# Global dictionary caches
+_hosts = DictionaryCache(
+    "hosts",
+    (("tenant_id", "text"), ("hostname", "text")),
+    max_entries=settings.host_dictionary_cache_max_entries
+)
+_process_names = DictionaryCache(
+    "process_names",
+    (("name", "text"), ("username", "text")),
+    max_entries=settings.host_dictionary_cache_max_entries
+)
+
+
+def _process_key(row: tuple) -> Tuple[str, str]:
+    # metrics_process row: (timestamp, tenant_id, host, pid, name, cpu, memory, status, username)
+    return (row[4] or "", row[8] or "")
+
+
+async def compact_batches(
+    batches: Dict[str, Tuple[Sequence[str], List[tuple]]]
+) -> Dict[str, Tuple[Sequence[str], List[tuple]]]:
+    """
+    Rewrite {table: (columns, rows)} COPY batches for string-keyed tables into their
+    compact tables; other tables (and already compacted batches) pass through
+    Rows must be in metrics_codec.SCHEMAS column order, i.e. (timestamp, tenant_id, host, ...)
+    """
+    host_keys = set()
+    process_keys = set()
+    for table, (_, rows) in batches.items():
+        if table in COMPACT_TABLES:
+            host_keys.update((row[1], row[2]) for row in rows)
+            if table == PROCESS_TABLE:
+                process_keys.update(_process_key(row) for row in rows)
+    if not host_keys:
+        return batches
+
+    host_ids = await _hosts.resolve(host_keys)
+    name_ids = await _process_names.resolve(process_keys) if process_keys else {}
+
+    compacted = {}
+    for table, (columns, rows) in batches.items():
+        compact_table = COMPACT_TABLES.get(table)
+        if compact_table is None:
+            compacted[table] = (columns, rows)
+        elif table == PROCESS_TABLE:
+            compacted[compact_table] = (PROCESS_COLUMNS, [
+                (row[0], host_ids[(row[1], row[2])], row[3], name_ids[_process_key(row)], row[5], row[6], row[7])
+                for row in rows
+            ])
+        else:
+            compacted[compact_table] = (("timestamp", "host_id") + tuple(columns[3:]), [
+                (row[0], host_ids[(row[1], row[2])]) + row[3:]
+                for row in rows
+            ])
+    return compacted
+
+
+def batch_hosts(batches: Dict[str, Tuple[Sequence[str], List[tuple]]]) -> Optional[Set[Tuple[str, str]]]:
+    """
+    (tenant_id, host) of the rows in COPY batches, compacted or not; None when a
+    compact row's host_id has been evicted from the dictionary cache
+    Tables keyed by neither host_id nor (tenant_id, host) are skipped
+    """
+    hosts = set()
+    host_ids = set()
+    for columns, rows in batches.values():
+        if tuple(columns[1:2]) == ("host_id",):
+            host_ids.update(row[1] for row in rows)
+        elif tuple(columns[1:3]) == ("tenant_id", "host"):
+            hosts.update((row[1], row[2]) for row in rows)
+    if host_ids:
+        keys = _hosts.keys_for(host_ids)
+        if keys is None:
+            return None
+        hosts.update(keys)
+    return hosts
+
+
+def get_cache_stats() -> dict:
+    """Host and process name dictionary cache sizes and hit/miss counters"""
+    return {"hosts": _hosts.get_stats(), "process_names": _process_names.get_stats()}
@@ -0,0 +1,70 @@
+"""
+Host inventory change detection
+Agents report host_info every collection cycle, but inventory (OS, kernel, CPU, memory,
+boot time) rarely changes. The last written inventory hash is kept per (tenant, host)
+and a host_info row is only written when it differs, so the table holds one row per change.
+"""
+from typing import Dict, List, Tuple
+
+# host_info row: (timestamp, tenant_id, host, os, os_version, kernel_version, architecture,
+#                 cpu_count, cpu_model, memory_total, uptime_seconds, boot_time)
+_UPTIME = 10
+
+
+def _digest(row: tuple) -> int:
+    # Timestamp and uptime move every cycle; everything else is inventory
+    return hash(row[3:_UPTIME] + row[_UPTIME + 1:])
+
+
+class InventoryTracker:
+    """Last written inventory hash per (tenant_id, host)"""
+
+    def __init__(self):
+        self._hashes: Dict[Tuple[str, str], int] = {}
+        self.stats = {"received": 0, "changed": 0, "unchanged": 0}
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def changed(self, rows: List[tuple]) -> List[tuple]:
+        """Rows whose inventory differs from the last written (or an earlier row in the batch)"""
+        pending = {}
+        changed = []
+        for row in rows:
+            key = (row[1], row[2])
+            digest = _digest(row)
+            if pending.get(key, self._hashes.get(key)) == digest:
+                continue
+            pending[key] = digest
+            changed.append(row)
+
+        self.stats["received"] += len(rows)
+        self.stats["changed"] += len(changed)
+        self.stats["unchanged"] += len(rows) - len(changed)
+        return changed
+
+    def remember(self, rows: List[tuple]):
+        """Record rows as written; call only once the write has been accepted"""
+        for row in rows:
+            self._hashes[(row[1], row[2])] = _digest(row)
+
+    def get_stats(self) -> dict:
+        return {"tracked_hosts": len(self._hashes), **self.stats}
+
+
+# Global tracker instance
+_tracker = InventoryTracker()
+
+
+def changed_rows(rows: List[tuple]) -> List[tuple]:
+    """Filter host_info rows down to inventory changes"""
+    return _tracker.changed(rows) if rows else rows
+
+
+def remember(rows: List[tuple]):
+    _tracker.remember(rows)
+
+
+def get_stats() -> dict:
+    """Inventory change detection counters"""
+    return _tracker.get_stats()
@@ -0,0 +1,142 @@
+"""
+Host metric row builders for foreign ingest formats
+Prometheus remote_write and OTLP receivers normalize host metrics into a few fields
+(memory totals, filesystem sizes, network counters, per-mode CPU seconds) and build
+metrics_* rows here, in the column order of metrics_codec.SCHEMAS
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Fields the row builders need; a missing one means an incomplete sample, not zero
+NETWORK_FIELDS = (
+    "bytes_sent", "bytes_recv", "packets_sent", "packets_recv",
+    "errors_in", "errors_out", "drops_in", "drops_out"
+)
+MEMORY_FIELDS = ("total", "free", "available")
+SWAP_FIELDS = ("swap_total", "swap_free")
+DISK_FIELDS = ("size", "free", "avail")
+
+# CPU modes per row column; covers node_exporter (irq, iowait) and OpenTelemetry (interrupt, wait) names
+CPU_USER_MODES = ("user", "nice")
+CPU_SYSTEM_MODES = ("system", "irq", "interrupt", "softirq", "steal")
+CPU_IDLE_MODES = ("idle",)
+CPU_IOWAIT_MODES = ("iowait", "wait")
+
+
+@lru_cache(maxsize=4096)
+def timestamp_from_ms(ms: int) -> datetime:
+    """Epoch milliseconds as naive UTC (metric columns are TIMESTAMP); one scrape shares one timestamp"""
+    return _EPOCH + timedelta(milliseconds=ms)
+
+
+def cpu_row(tenant_id: str, host: str, ts: int, shares: Dict[str, float]) -> tuple:
+    """CPU row from per-mode fractions of CPU time (0..1)"""
+    def percent(modes):
+        return round(100.0 * sum(shares.get(m, 0.0) for m in modes), 2)
+
+    idle = percent(CPU_IDLE_MODES)
+    iowait = percent(CPU_IOWAIT_MODES)
+    return (
+        timestamp_from_ms(ts), tenant_id, host,
+        round(100.0 - idle - iowait, 2),
+        percent(CPU_USER_MODES),
+        percent(CPU_SYSTEM_MODES),
+        idle,
+        iowait,
+    )
+
+
+def memory_row(tenant_id: str, host: str, ts: int, fields: Dict[str, float]) -> tuple:
+    """Memory row from MEMORY_FIELDS bytes; swap is reported as zero unless both SWAP_FIELDS are present"""
+    total = int(fields["total"])
+    free = int(fields["free"])
+    used = total - int(fields["available"])
+    if all(field in fields for field in SWAP_FIELDS):
+        swap_total = int(fields["swap_total"])
+        swap_free = int(fields["swap_free"])
+    else:
+        swap_total = swap_free = 0
+    swap_used = swap_total - swap_free
+    return (
+        timestamp_from_ms(ts), tenant_id, host,
+        total, used, free, round(100.0 * used / total, 2) if total else 0.0,
+        swap_total, swap_used, swap_free, round(100.0 * swap_used / swap_total, 2) if swap_total else 0.0,
+    )
+
+
+def disk_row(
+    tenant_id: str,
+    host: str,
+    device: str,
+    mountpoint: str,
+    ts: int,
+    fields: Dict[str, float]
+) -> tuple:
+    """Disk row from DISK_FIELDS bytes (free includes root-reserved blocks, avail does not)"""
+    size = int(fields["size"])
+    avail = int(fields["avail"])
+    used = size - int(fields["free"])
+    # Same as df: usage relative to what non-root users can use
+    usable = used + avail
+    return (
+        timestamp_from_ms(ts), tenant_id, host, device, mountpoint,
+        size, used, avail, round(100.0 * used / usable, 2) if usable else 0.0,
+    )
+
+
+def network_row(tenant_id: str, host: str, interface: str, ts: int, fields: Dict[str, float]) -> tuple:
+    """Network row from cumulative NETWORK_FIELDS counters (all required)"""
+    return (timestamp_from_ms(ts), tenant_id, host, interface) + tuple(
+        int(fields[field]) for field in NETWORK_FIELDS
+    )
+
+
+class CpuCounterRates:
+    """
+    Turns cumulative per-mode CPU seconds into usage rows
+    Previous totals are kept per (tenant, host); the first sample for a host, or one after
+    a counter reset or a change in the set of modes, produces no row
+    """
+
+    def __init__(self):
+        # (tenant_id, host) -> (timestamp_ms, {mode: seconds summed over CPUs})
+        self._totals: Dict[Tuple[str, str], Tuple[int, Dict[str, float]]] = {}
+        self.resets = 0
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+    def reset(self, tenant_id: str, host: str):
+        """Forget a host's previous totals; its next sample becomes the baseline"""
+        self._totals.pop((tenant_id, host), None)
+
+    def rows(self, tenant_id: str, cpu: Dict[Tuple[str, int], Dict[str, float]]) -> List[tuple]:
+        """Rows from {(host, timestamp_ms): {mode: seconds}}"""
+        rows = []
+        for host, ts in sorted(cpu):
+            totals = cpu[(host, ts)]
+            state_key = (tenant_id, host)
+            previous = self._totals.get(state_key)
+            if previous and previous[0] >= ts:
+                # Late or duplicate sample; keep the newer baseline
+                continue
+            self._totals[state_key] = (ts, dict(totals))
+            if not previous:
+                continue
+            if totals.keys() != previous[1].keys():
+                # A mode missing on either side would turn its whole total into a delta
+                self.resets += 1
+                continue
+
+            delta = {mode: seconds - previous[1][mode] for mode, seconds in totals.items()}
+            elapsed = sum(delta.values())
+            if any(d < 0 for d in delta.values()) or elapsed <= 0:
+                # Counter reset (reboot) or no progress; wait for the next sample
+                self.resets += 1
+                continue
+
+            rows.append(cpu_row(tenant_id, host, ts, {mode: d / elapsed for mode, d in delta.items()}))
+        return rows
@@ -0,0 +1,120 @@
+"""
+Recent idempotency keys for ingest batches
+Agents and the regional gateway resend a whole batch after a timeout; when the batch
+carries an Idempotency-Key, a replay is acknowledged with the original response
+instead of writing the rows again
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from ..config import settings
+
+# Keys are opaque client tokens: printable ASCII, bounded length
+MAX_KEY_LENGTH = 128
+
+
+class InvalidIdempotencyKey(ValueError):
+    """Idempotency key is empty, too long or not printable ASCII"""
+
+
+def validate_key(key: str) -> str:
+    """Validate a client-supplied idempotency key"""
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH or not key.isascii() or not key.isprintable():
+        raise InvalidIdempotencyKey(
+            f"Idempotency key must be 1-{MAX_KEY_LENGTH} printable ASCII characters"
+        )
+    return key
+
+
+class IdempotencyStore:
+    """Bounded LRU of completed batch responses plus batches currently being processed"""
+
+    def __init__(self, max_keys: int = 100000, ttl_sec: float = 900):
+        self.max_keys = max_keys
+        self.ttl_sec = ttl_sec
+        self._completed: "OrderedDict[Tuple[str, str], Tuple[float, dict]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.stats = {"replays": 0, "waited": 0, "evictions": 0}
+
+    async def begin(self, tenant_id: str, key: str) -> Optional[dict]:
+        """
+        Claim a key before processing a batch
+        Returns the stored response if the batch was already processed (or finishes
+        processing while we wait), otherwise None and the caller must complete() or abort()
+        """
+        scoped = (tenant_id, key)
+
+        while True:
+            entry = self._completed.get(scoped)
+            if entry:
+                if entry[0] > time.monotonic():
+                    self._completed.move_to_end(scoped)
+                    self.stats["replays"] += 1
+                    return entry[1]
+                del self._completed[scoped]
+
+            inflight = self._inflight.get(scoped)
+            if not inflight:
+                break
+
+            # Same batch is being processed by another request; wait for its outcome
+            self.stats["waited"] += 1
+            try:
+                await asyncio.shield(inflight)
+            except Exception:
+                pass
+
+        self._inflight[scoped] = asyncio.get_running_loop().create_future()
+        return None
+
+    def complete(self, tenant_id: str, key: str, response: dict):
+        """Store the response for a processed batch"""
+        scoped = (tenant_id, key)
+        self._completed[scoped] = (time.monotonic() + self.ttl_sec, response)
+        self._completed.move_to_end(scoped)
+        while len(self._completed) > self.max_keys:
+            self._completed.popitem(last=False)
+            self.stats["evictions"] += 1
+        self._release(scoped)
+
+    def abort(self, tenant_id: str, key: str):
+        """Release a claimed key after a failure so a retry can process the batch"""
+        self._release((tenant_id, key))
+
+    def _release(self, scoped: Tuple[str, str]):
+        future = self._inflight.pop(scoped, None)
+        if future and not future.done():
+            future.set_result(None)
+
+    def get_stats(self) -> dict:
+        return {
+            "keys": len(self._completed),
+            "inflight": len(self._inflight),
+            "max_keys": self.max_keys,
+            **self.stats,
+        }
+
+
+# Global store instance
+_store = IdempotencyStore(
+    max_keys=settings.ingest_idempotency_max_keys,
+    ttl_sec=settings.ingest_idempotency_ttl_sec
+)
+
+
+async def begin(tenant_id: str, key: str) -> Optional[dict]:
+    return await _store.begin(tenant_id, key)
+
+
+def complete(tenant_id: str, key: str, response: dict):
+    _store.complete(tenant_id, key, response)
+
+
+def abort(tenant_id: str, key: str):
+    _store.abort(tenant_id, key)
+
+
+def get_store_stats() -> dict:
+    return _store.get_stats()
@@ -0,0 +1,250 @@
+"""
+Write-behind ingest buffer
+Coalesces metric rows from many ingest requests and flushes them to TimescaleDB
+in large COPY batches from a background task. Rows the database refuses (bad values,
+constraint violations) are isolated and quarantined; the rest of the flush is written
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Sequence, Tuple
+from ..config import settings
+from . import timescale, ingest_spool, query_cache
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFullError(Exception):
+    """Raised when accepting rows would exceed the buffer's memory bound"""
+
+
+class IngestBuffer:
+    """Per-table row buffer flushed on a size or time threshold"""
+
+    def __init__(
+        self,
+        max_rows: int = 100000,
+        flush_rows: int = 5000,
+        flush_interval_sec: float = 2.0
+    ):
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval_sec = flush_interval_sec
+        self.running = False
+
+        # table -> (columns, rows)
+        self._tables: Dict[str, Tuple[Sequence[str], List[tuple]]] = {}
+        self._depth = 0
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task = None
+
+        self.stats = {
+            "accepted_rows": 0,
+            "flushed_rows": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "dropped_rows": 0,
+            "spooled_rows": 0,
+            "rejected_rows": 0,
+            "bad_rows": 0,
+            "last_flush_at": None,
+            "last_flush_ms": None,
+        }
+
+    @property
+    def depth(self) -> int:
+        """Number of rows waiting to be flushed"""
+        return self._depth
+
+    def table_depths(self) -> Dict[str, int]:
+        """Rows waiting per table"""
+        return {table: len(rows) for table, (_, rows) in self._tables.items() if rows}
+
+    def add(self, batches: Dict[str, Tuple[Sequence[str], List[tuple]]]) -> int:
+        """
+        Accept rows for later flushing
+        All-or-nothing: raises BufferFullError without buffering anything if the bound would be exceeded
+        """
+        incoming = sum(len(rows) for _, rows in batches.values())
+        if self._depth + incoming > self.max_rows:
+            self.stats["rejected_rows"] += incoming
+            raise BufferFullError(
+                f"Ingest buffer full ({self._depth}/{self.max_rows} rows)"
+            )
+
+        for table, (columns, rows) in batches.items():
+            if not rows:
+                continue
+            if table not in self._tables:
+                self._tables[table] = (columns, [])
+            self._tables[table][1].extend(rows)
+
+        self._depth += incoming
+        self.stats["accepted_rows"] += incoming
+
+        if self._depth >= self.flush_rows:
+            self._wakeup.set()
+
+        return incoming
+
+    async def flush(self) -> int:
+        """Flush everything currently buffered in one COPY transaction"""
+        async with self._flush_lock:
+            if not self._depth:
+                return 0
+
+            pending = {
+                table: (columns, rows)
+                for table, (columns, rows) in self._tables.items()
+                if rows
+            }
+            pending_rows = self._depth
+            self._tables = {}
+            self._depth = 0
+
+            started = time.monotonic()
+            try:
+                written, rejected = await timescale.copy_isolating(pending)
+            except timescale.PartialCopyError as e:
+                # Part of the flush landed before the database failed; keep only the rest
+                self.stats["failed_flushes"] += 1
+                self.stats["flushed_rows"] += e.written
+                query_cache.advance_batches(pending)
+                await self._set_aside(e.rejected)
+                remaining_rows = sum(len(rows) for _, rows in e.remaining.values())
+                logger.error(f"Ingest buffer flush failed ({remaining_rows} rows unwritten): {e}")
+                if not await self._spool(e.remaining, remaining_rows):
+                    self._requeue(e.remaining, remaining_rows)
+                return e.written
+            except Exception as e:
+                self.stats["failed_flushes"] += 1
+                logger.error(f"Ingest buffer flush failed ({pending_rows} rows): {e}")
+                if not await self._spool(pending, pending_rows):
+                    self._requeue(pending, pending_rows)
+                return 0
+            # Open query results loaded before these rows landed are now stale
+            query_cache.advance_batches(pending)
+            await self._set_aside(rejected)
+
+            self.stats["flushes"] += 1
+            self.stats["flushed_rows"] += written
+            self.stats["last_flush_at"] = time.time()
+            self.stats["last_flush_ms"] = round((time.monotonic() - started) * 1000, 1)
+            return written
+
+    async def _set_aside(self, rejected: Dict[str, Tuple[Sequence[str], List[tuple]]]):
+        """Quarantine rows the database refused (dropped when the spool cannot take them)"""
+        bad_rows = sum(len(rows) for _, rows in rejected.values())
+        if not bad_rows:
+            return
+        self.stats["bad_rows"] += bad_rows
+        if await ingest_spool.quarantine(rejected):
+            logger.error(f"Ingest buffer quarantined {bad_rows} rows refused by the database")
+        else:
+            logger.error(f"Ingest buffer dropped {bad_rows} rows refused by the database")
+
+    async def _spool(self, pending: Dict[str, Tuple[Sequence[str], List[tuple]]], pending_rows: int) -> bool:
+        """Hand rows from a failed flush to the on-disk spool; False if spooling is off or failed"""
+        spool = ingest_spool.get_spool()
+        if not spool:
+            return False
+        try:
+            await spool.append(pending)
+        except Exception as e:
+            logger.error(f"Could not spool {pending_rows} rows from failed flush: {e}")
+            return False
+        self.stats["spooled_rows"] += pending_rows
+        return True
+
+    def _requeue(self, pending: Dict[str, Tuple[Sequence[str], List[tuple]]], pending_rows: int):
+        """Put rows from a failed flush back in front of newer rows, dropping them if there is no room"""
+        if self._depth + pending_rows > self.max_rows:
+            self.stats["dropped_rows"] += pending_rows
+            logger.error(f"Ingest buffer dropped {pending_rows} rows after failed flush (buffer full)")
+            return
+
+        for table, (columns, rows) in pending.items():
+            newer = self._tables.get(table, (columns, []))[1]
+            self._tables[table] = (columns, rows + newer)
+        self._depth += pending_rows
+
+    async def start(self):
+        """Run the background flusher until stopped"""
+        self.running = True
+        logger.info("Ingest buffer flusher started")
+
+        while self.running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ingest buffer flusher error: {e}")
+
+    async def stop(self):
+        """Stop the flusher and drain remaining rows"""
+        self.running = False
+        self._wakeup.set()
+        if self._task:
+            await self._task
+
+        remaining = self._depth
+        if remaining:
+            logger.info(f"Draining ingest buffer ({remaining} rows)...")
+            await self.flush()
+            if self._depth:
+                logger.error(f"Ingest buffer shutdown with {self._depth} unflushed rows")
+        logger.info("Ingest buffer flusher stopped")
+
+    def get_stats(self) -> dict:
+        """Buffer depth and flush statistics"""
+        return {
+            "enabled": self.running,
+            "depth": self._depth,
+            "max_rows": self.max_rows,
+            "tables": self.table_depths(),
+            **self.stats,
+        }
+
+
+# Global buffer instance
+_buffer: IngestBuffer = None
+
+
+def get_buffer() -> IngestBuffer:
+    """Get the running ingest buffer, or None when write-behind is disabled"""
+    if _buffer and _buffer.running:
+        return _buffer
+    return None
+
+
+def get_buffer_stats() -> dict:
+    """Stats for the global buffer (reports disabled when not running)"""
+    if not _buffer:
+        return {"enabled": False, "depth": 0}
+    return _buffer.get_stats()
+
+
+async def start_ingest_buffer():
+    """Start the global ingest buffer"""
+    global _buffer
+    if not _buffer:
+        _buffer = IngestBuffer(
+            max_rows=settings.ingest_buffer_max_rows,
+            flush_rows=settings.ingest_buffer_flush_rows,
+            flush_interval_sec=settings.ingest_buffer_flush_interval_sec
+        )
+        _buffer._task = asyncio.create_task(_buffer.start())
+
+
+async def stop_ingest_buffer():
+    """Stop the global ingest buffer, flushing buffered rows"""
+    global _buffer
+    if _buffer:
+        await _buffer.stop()
+        _buffer = None
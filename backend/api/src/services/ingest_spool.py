@@ -0,0 +1,399 @@
+"""
+Durable on-disk ingest spool
+When TimescaleDB is unreachable or too slow, accepted batches are appended to
+segment files (a small write-ahead log) instead of failing the agent. A background
+task replays the spool in order, at a controlled rate, once the database recovers.
+
+Segment layout: <dir>/segment-<seq>.spool, a sequence of records
+    header (>IId: payload length, crc32 of payload, spooled-at unix time) + payload
+where payload is a pickled {table: (columns, rows)} batch. Spool files are only ever
+written and read by this service. Replay progress is kept in <dir>/replay.offset so a
+restart resumes after the last replayed record.
+
+Rows the database refuses outright (bad values, constraint violations) are set aside in
+<dir>/quarantine.spool, in the same record format, and never replayed.
+"""
+import asyncio
+import logging
+import os
+import pickle
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from ..config import settings
+from . import timescale, host_dictionary, series_store, query_cache
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">IId")
+_SEGMENT_GLOB = "segment-*.spool"
+_OFFSET_FILE = "replay.offset"
+_QUARANTINE_FILE = "quarantine.spool"
+
+
+class SpoolFullError(Exception):
+    """Raised when appending would exceed the spool size limit"""
+
+
+def _segment_seq(path: Path) -> int:
+    return int(path.stem.split("-", 1)[1])
+
+
+class IngestSpool:
+    """Append-only segment spool with ordered, rate-limited replay"""
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        segment_bytes: int,
+        max_age_sec: float,
+        replay_rows_per_sec: int
+    ):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.max_age_sec = max_age_sec
+        self.replay_rows_per_sec = replay_rows_per_sec
+        self.running = False
+
+        self._lock = asyncio.Lock()
+        self._active: Optional[Path] = None
+        self._active_file = None
+        self._next_seq = 0
+        self._task: asyncio.Task = None
+
+        self.stats = {
+            "spooled_batches": 0,
+            "spooled_rows": 0,
+            "replayed_batches": 0,
+            "replayed_rows": 0,
+            "replay_failures": 0,
+            "rejected_batches": 0,
+            "expired_segments": 0,
+            "corrupt_records": 0,
+            "quarantined_rows": 0,
+            "quarantine_dropped_rows": 0,
+            "last_replay_at": None,
+        }
+
+    def open(self):
+        """Create the spool directory and pick up segments left by a previous run"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segments = self._segments()
+        # Never reuse a sequence number the replay offset may still point at
+        last_seq = max(_segment_seq(segments[-1]) if segments else -1, self._read_offset()[0])
+        self._next_seq = last_seq + 1
+        if segments:
+            logger.warning(f"Ingest spool has {len(segments)} segment(s) pending replay")
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.directory.glob(_SEGMENT_GLOB), key=_segment_seq)
+
+    def size_bytes(self) -> int:
+        total = 0
+        for path in self._segments():
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def has_backlog(self) -> bool:
+        return bool(self._segments())
+
+    def _seal_active(self):
+        """Close the segment being appended to; the next append starts a new one"""
+        if self._active_file:
+            self._active_file.close()
+        self._active_file = None
+        self._active = None
+
+    def _read_offset(self) -> Tuple[int, int]:
+        try:
+            seq, offset = (self.directory / _OFFSET_FILE).read_text().split()
+            return int(seq), int(offset)
+        except (FileNotFoundError, ValueError):
+            return -1, 0
+
+    def _write_offset(self, seq: int, offset: int):
+        tmp = self.directory / (_OFFSET_FILE + ".tmp")
+        tmp.write_text(f"{seq} {offset}")
+        os.replace(tmp, self.directory / _OFFSET_FILE)
+
+    async def append(self, batches: Dict[str, Tuple[Sequence[str], List[tuple]]]) -> int:
+        """Durably append a batch (fsynced before returning); returns the row count"""
+        rows = sum(len(r) for _, r in batches.values())
+        record = _encode_record(batches)
+
+        async with self._lock:
+            if self.size_bytes() + len(record) > self.max_bytes:
+                self.stats["rejected_batches"] += 1
+                raise SpoolFullError(f"Ingest spool full ({self.max_bytes} bytes)")
+            await asyncio.to_thread(self._append_record, record)
+
+        self.stats["spooled_batches"] += 1
+        self.stats["spooled_rows"] += rows
+        return rows
+
+    async def quarantine(self, batches: Dict[str, Tuple[Sequence[str], List[tuple]]]) -> bool:
+        """
+        Set aside rows the database refused, for inspection; they are never replayed
+        The quarantine file is bounded by the segment size; False once it is full
+        """
+        rows = sum(len(r) for _, r in batches.values())
+        record = _encode_record(batches)
+        path = self.directory / _QUARANTINE_FILE
+
+        async with self._lock:
+            size = path.stat().st_size if path.exists() else 0
+            if size + len(record) > self.segment_bytes:
+                self.stats["quarantine_dropped_rows"] += rows
+                return False
+            await asyncio.to_thread(_append_file, path, record)
+
+        self.stats["quarantined_rows"] += rows
+        return True
+
+    def _append_record(self, record: bytes):
+        if self._active_file and self._active_file.tell() + len(record) > self.segment_bytes:
+            self._seal_active()
+        if not self._active_file:
+            self._active = self.directory / f"segment-{self._next_seq:012d}.spool"
+            self._next_seq += 1
+            self._active_file = open(self._active, "ab")
+        self._active_file.write(record)
+        self._active_file.flush()
+        os.fsync(self._active_file.fileno())
+
+    def _iter_records(self, path: Path, start: int) -> Iterator[Tuple[int, float, Optional[dict]]]:
+        """Yield (end offset, spooled_at, batch) from a sealed segment; batch is None if corrupt"""
+        with open(path, "rb") as f:
+            f.seek(start)
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return
+                length, crc, spooled_at = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    # Torn write at the tail (crash mid-append); nothing valid follows
+                    return
+                if zlib.crc32(payload) != crc:
+                    yield f.tell(), spooled_at, None
+                    continue
+                yield f.tell(), spooled_at, pickle.loads(payload)
+
+    async def replay_once(self) -> int:
+        """Replay the oldest segment; returns rows written (0 when idle or the DB is still failing)"""
+        async with self._lock:
+            segments = self._segments()
+            if not segments:
+                return 0
+            path = segments[0]
+            if path == self._active:
+                # Seal the segment being written so replay reads a stable file
+                self._seal_active()
+
+        seq = _segment_seq(path)
+        offset_seq, offset = self._read_offset()
+        start = offset if offset_seq == seq else 0
+
+        replayed = 0
+        for end, spooled_at, batch in self._iter_records(path, start):
+            if time.time() - spooled_at > self.max_age_sec:
+                self._write_offset(seq, end)
+                continue
+            if batch is None:
+                self.stats["corrupt_records"] += 1
+                logger.error(f"Skipping corrupt spool record in {path.name}")
+                self._write_offset(seq, end)
+                continue
+
+            try:
+                # Rows spooled while dictionaries were unreachable (or before the host
+                # dictionary migration) are still string-keyed
+                batch = await host_dictionary.compact_batches(await series_store.resolve_batches(batch))
+                # Rows the database refuses are permanent failures: quarantine them and go on
+                rows, rejected = await timescale.copy_isolating(batch)
+            except timescale.PartialCopyError as e:
+                # Part of the record landed; requeue the rest at the tail rather than rewrite it
+                self.stats["replay_failures"] += 1
+                query_cache.advance_batches(batch)
+                await self._quarantine_rejected(e.rejected, path)
+                try:
+                    await self.append(e.remaining)
+                except SpoolFullError:
+                    logger.error(f"Spool replay paused in {path.name}; no room to requeue the unwritten rows")
+                    return replayed
+                self._write_offset(seq, end)
+                self.stats["replayed_rows"] += e.written
+                logger.warning(f"Spool replay paused, database write failed: {e}")
+                return replayed + e.written
+            except Exception as e:
+                self.stats["replay_failures"] += 1
+                logger.warning(f"Spool replay paused, database write failed: {e}")
+                return replayed
+            query_cache.advance_batches(batch)
+            await self._quarantine_rejected(rejected, path)
+
+            self._write_offset(seq, end)
+            replayed += rows
+            self.stats["replayed_batches"] += 1
+            self.stats["replayed_rows"] += rows
+            self.stats["last_replay_at"] = time.time()
+
+            # Rate limit so a recovering database isn't flattened by the backlog
+            if self.replay_rows_per_sec > 0:
+                await asyncio.sleep(rows / self.replay_rows_per_sec)
+
+        path.unlink(missing_ok=True)
+        logger.info(f"Spool segment {path.name} replayed")
+        return replayed
+
+    async def _quarantine_rejected(self, rejected: Dict[str, Tuple[Sequence[str], List[tuple]]], path: Path):
+        bad_rows = sum(len(rows) for _, rows in rejected.values())
+        if not bad_rows:
+            return
+        if await self.quarantine(rejected):
+            logger.error(f"Quarantined {bad_rows} rows from {path.name} refused by the database")
+        else:
+            logger.error(f"Dropped {bad_rows} rows from {path.name} refused by the database (quarantine full)")
+
+    def _expire_segments(self):
+        """Drop whole sealed segments whose newest record is older than max_age"""
+        for path in self._segments():
+            if path == self._active:
+                break
+            if time.time() - path.stat().st_mtime <= self.max_age_sec:
+                break
+            logger.error(f"Dropping expired spool segment {path.name}")
+            path.unlink(missing_ok=True)
+            self.stats["expired_segments"] += 1
+
+    async def start(self):
+        """Replay the spool until stopped"""
+        self.running = True
+        logger.info(f"Ingest spool started ({self.directory})")
+
+        while self.running:
+            try:
+                self._expire_segments()
+                if not self.has_backlog():
+                    await asyncio.sleep(1)
+                    continue
+                if await self.replay_once() == 0 and self.has_backlog():
+                    # Database still unavailable (or only empty records); back off
+                    await asyncio.sleep(5)
+            except Exception as e:
+                logger.error(f"Ingest spool replay error: {e}")
+                await asyncio.sleep(5)
+
+    async def stop(self):
+        """Stop replaying; spooled data stays on disk for the next start"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        async with self._lock:
+            self._seal_active()
+        logger.info("Ingest spool stopped")
+
+    def oldest_record_age_sec(self) -> Optional[float]:
+        """Age of the oldest unreplayed record (the replay lag)"""
+        segments = self._segments()
+        if not segments:
+            return None
+        seq = _segment_seq(segments[0])
+        offset_seq, offset = self._read_offset()
+        start = offset if offset_seq == seq else 0
+        try:
+            with open(segments[0], "rb") as f:
+                f.seek(start)
+                header = f.read(_HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(header) < _HEADER.size:
+            return None
+        return time.time() - _HEADER.unpack(header)[2]
+
+    def get_stats(self) -> dict:
+        lag = self.oldest_record_age_sec()
+        return {
+            "enabled": self.running,
+            "directory": str(self.directory),
+            "segments": len(self._segments()),
+            "size_bytes": self.size_bytes(),
+            "max_bytes": self.max_bytes,
+            "replay_lag_sec": round(lag, 1) if lag is not None else 0,
+            **self.stats,
+        }
+
+
+def _encode_record(batches: Dict[str, Tuple[Sequence[str], List[tuple]]]) -> bytes:
+    payload = pickle.dumps(
+        {table: (tuple(columns), records) for table, (columns, records) in batches.items() if records},
+        protocol=pickle.HIGHEST_PROTOCOL
+    )
+    return _HEADER.pack(len(payload), zlib.crc32(payload), time.time()) + payload
+
+
+def _append_file(path: Path, record: bytes):
+    with open(path, "ab") as f:
+        f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# Global spool instance
+_spool: IngestSpool = None
+
+
+def get_spool() -> Optional[IngestSpool]:
+    """Get the running spool, or None when spooling is disabled"""
+    if _spool and _spool.running:
+        return _spool
+    return None
+
+
+async def quarantine(batches: Dict[str, Tuple[Sequence[str], List[tuple]]]) -> bool:
+    """Quarantine rows the database refused; False when spooling is off or the file is full"""
+    spool = get_spool()
+    if not spool:
+        return False
+    return await spool.quarantine(batches)
+
+
+def get_spool_stats() -> dict:
+    if not _spool:
+        return {"enabled": False}
+    return _spool.get_stats()
+
+
+async def start_ingest_spool():
+    """Open the spool directory and start replaying"""
+    global _spool
+    if not _spool:
+        _spool = IngestSpool(
+            directory=settings.ingest_spool_dir,
+            max_bytes=settings.ingest_spool_max_mb * 1024 * 1024,
+            segment_bytes=settings.ingest_spool_segment_mb * 1024 * 1024,
+            max_age_sec=settings.ingest_spool_max_age_hours * 3600,
+            replay_rows_per_sec=settings.ingest_spool_replay_rows_per_sec
+        )
+        _spool.open()
+        _spool.running = True
+        _spool._task = asyncio.create_task(_spool.start())
+
+
+async def stop_ingest_spool():
+    """Stop the spool (pending segments are replayed on next start)"""
+    global _spool
+    if _spool:
+        await _spool.stop()
+        _spool = None
@@ -6,7 +6,7 @@ from datetime import datetime, timedelta
 import httpx
 import logging
 from ..config import settings
-from . import timescale
+from . import timescale, tenant_cache
 
 logger = logging.getLogger(__name__)
 
@@ -75,7 +75,8 @@ class LicensingService:
 
                     if result.get("valid"):
                         # Update license info
-                        await timescale.execute_query(
+                        await self._update_tenant(
+                            tenant["id"],
                             """
                             UPDATE tenants
                             SET license_expires_at = $1,
@@ -103,7 +104,8 @@ class LicensingService:
         if not tenant.get("grace_period_until"):
             # Start grace period
             grace_until = datetime.utcnow() + timedelta(days=self.grace_period_days)
-            await timescale.execute_query(
+            await self._update_tenant(
+                tenant["id"],
                 "UPDATE tenants SET grace_period_until = $1 WHERE id = $2",
                 grace_until,
                 tenant["id"]
@@ -119,7 +121,8 @@ class LicensingService:
             )
         elif datetime.utcnow() > tenant["grace_period_until"]:
             # Grace period expired, disable tenant
-            await timescale.execute_query(
+            await self._update_tenant(
+                tenant["id"],
                 "UPDATE tenants SET enabled = FALSE WHERE id = $1",
                 tenant["id"]
             )
@@ -141,7 +144,8 @@ class LicensingService:
             # License expired
             if not tenant.get("grace_period_until"):
                 grace_until = datetime.utcnow() + timedelta(days=self.grace_period_days)
-                await timescale.execute_query(
+                await self._update_tenant(
+                    tenant["id"],
                     "UPDATE tenants SET grace_period_until = $1 WHERE id = $2",
                     grace_until,
                     tenant["id"]
@@ -156,7 +160,8 @@ class LicensingService:
                     f"License for tenant {tenant['name']} expired on {expires_at.strftime('%Y-%m-%d')}. Grace period until {grace_until.strftime('%Y-%m-%d %H:%M UTC')}."
                 )
             elif datetime.utcnow() > tenant["grace_period_until"]:
-                await timescale.execute_query(
+                await self._update_tenant(
+                    tenant["id"],
                     "UPDATE tenants SET enabled = FALSE WHERE id = $1",
                     tenant["id"]
                 )
@@ -170,6 +175,11 @@ class LicensingService:
                     f"Tenant {tenant['name']} disabled. License expired and grace period ended. Metrics ingestion blocked."
                 )
 
+    async def _update_tenant(self, tenant_id: str, query: str, *args):
+        """Update a tenant row and drop its cached state so blocking decisions see the change"""
+        await timescale.execute_query(query, *args)
+        tenant_cache.invalidate(tenant_id)
+
     async def _raise_platform_alarm(
         self,
         tenant_id: str,
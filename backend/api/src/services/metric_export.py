@@ -0,0 +1,227 @@
+"""
+Streaming metric export
+Rows are read through a server-side cursor and written out as NDJSON or CSV while they
+arrive, so an export of any size runs in constant memory. Exports are ordered by a
+keyset, (timestamp, host) plus the series columns for tables with several rows per host
+and timestamp, and can be paged: a page ends with an opaque cursor naming its last
+row, and the next page starts strictly after it (no OFFSET scans, no missed rows).
+"""
+import base64
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import msgspec
+from ..config import settings
+from . import timescale
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# metric_type -> (table or view, keyset columns in export order)
+EXPORT_TABLES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "cpu": ("metrics_cpu", ("timestamp", "host")),
+    "memory": ("metrics_memory", ("timestamp", "host")),
+    "disk": ("metrics_disk", ("timestamp", "host", "device", "mountpoint")),
+    "network": ("metrics_network", ("timestamp", "host", "interface")),
+    "process": ("metrics_process", ("timestamp", "host", "pid")),
+    "host_info": ("host_info", ("timestamp", "host")),
+}
+
+# Encoded rows per chunk handed to the response
+_CHUNK_ROWS = 500
+
+_encoder = msgspec.json.Encoder()
+
+
+class InvalidCursor(ValueError):
+    """Raised when an export cursor cannot be decoded or does not fit the metric type"""
+
+
+class ExportBusy(Exception):
+    """Raised when the maximum number of concurrent exports is already running"""
+
+
+def encode_cursor(key: tuple) -> str:
+    """Opaque page cursor for the keyset values of a row"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in key]
+    return base64.urlsafe_b64encode(_encoder.encode(values)).decode().rstrip("=")
+
+
+def decode_cursor(metric_type: str, cursor: str) -> tuple:
+    """Keyset values from a cursor produced by encode_cursor"""
+    _, keys = EXPORT_TABLES[metric_type]
+    try:
+        values = msgspec.json.decode(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("wrong number of keys")
+        return (datetime.fromisoformat(values[0]),) + tuple(values[1:])
+    except (ValueError, TypeError, msgspec.DecodeError) as e:
+        raise InvalidCursor(f"Invalid export cursor: {e}")
+
+
+def build_query(
+    metric_type: str,
+    tenant_id: str,
+    host: Optional[str],
+    start: datetime,
+    end: datetime,
+    after: Optional[tuple] = None,
+    limit: Optional[int] = None
+) -> Tuple[str, list]:
+    """Keyset-ordered export query; `after` is the key of the last row already returned"""
+    table, keys = EXPORT_TABLES[metric_type]
+    args = [tenant_id, start, end]
+    conditions = ["tenant_id = $1", "timestamp >= $2", "timestamp <= $3"]
+    if host is not None:
+        args.append(host)
+        conditions.append(f"host = ${len(args)}")
+    if after is not None:
+        placeholders = []
+        for value in after:
+            args.append(value)
+            placeholders.append(f"${len(args)}")
+        conditions.append(f"({', '.join(keys)}) > ({', '.join(placeholders)})")
+
+    query = f"""
+        SELECT *
+        FROM {table}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {', '.join(keys)}
+    """
+    if limit is not None:
+        # One extra row tells whether another page follows
+        query += f" LIMIT {int(limit) + 1}"
+    return query, args
+
+
+class ExportSlot:
+    """
+    A running export counted against MetricExporter.max_concurrent
+    release() is idempotent: the stream's finally, the response's background task and
+    the router's error path may all call it, and whichever runs first frees the slot
+    """
+
+    def __init__(self, exporter: "MetricExporter"):
+        self._exporter = exporter
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._exporter._active -= 1
+
+    def __del__(self):
+        # Last resort for a response that was built but never sent or iterated
+        self.release()
+
+
+class MetricExporter:
+    """Bounded number of concurrent exports, with row and byte counters"""
+
+    def __init__(self, max_concurrent: int = 2, prefetch: int = 1000):
+        self.max_concurrent = max_concurrent
+        self.prefetch = prefetch
+        self._active = 0
+        self.stats = {"exports": 0, "rejected": 0, "rows": 0, "bytes": 0}
+
+    def reserve(self) -> ExportSlot:
+        """Claim an export slot up front, so a busy server answers before streaming starts"""
+        if self._active >= self.max_concurrent:
+            self.stats["rejected"] += 1
+            raise ExportBusy(f"{self.max_concurrent} exports already running")
+        self._active += 1
+        self.stats["exports"] += 1
+        return ExportSlot(self)
+
+    async def stream(
+        self,
+        slot: ExportSlot,
+        metric_type: str,
+        fmt: str,
+        query: str,
+        args: list,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Encoded export body; releases `slot` when done
+        With a limit, a page that has more rows after it ends with the cursor for the next
+        page: a {"next_cursor": ...} line (NDJSON) or a "#next_cursor,<cursor>" line (CSV)
+        """
+        _, keys = EXPORT_TABLES[metric_type]
+        encode = _ndjson_chunk if fmt == "ndjson" else _CsvChunks().encode
+        source = timescale.stream_rows(query, *args, prefetch=self.prefetch)
+        try:
+            rows = []
+            sent = 0
+            more = False
+            async for row in source:
+                if limit is not None and sent == limit:
+                    more = True
+                    break
+                rows.append(row)
+                sent += 1
+                if len(rows) >= _CHUNK_ROWS:
+                    yield self._emit(encode(rows), len(rows))
+                    last, rows = rows[-1], []
+            if rows:
+                yield self._emit(encode(rows), len(rows))
+                last = rows[-1]
+            if more:
+                yield self._emit(_next_cursor(fmt, encode_cursor(tuple(last[key] for key in keys))), 0)
+        finally:
+            # Close the cursor (and return its connection) even when the client went away
+            await source.aclose()
+            slot.release()
+
+    def _emit(self, chunk: bytes, rows: int) -> bytes:
+        self.stats["rows"] += rows
+        self.stats["bytes"] += len(chunk)
+        return chunk
+
+    def get_stats(self) -> dict:
+        return {"max_concurrent": self.max_concurrent, "active": self._active, **self.stats}
+
+
+def _ndjson_chunk(rows: List) -> bytes:
+    return b"".join(_encoder.encode(dict(row)) + b"\n" for row in rows)
+
+
+class _CsvChunks:
+    """CSV encoder writing the header before the first chunk"""
+
+    def __init__(self):
+        self._header = False
+
+    def encode(self, rows: List) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not self._header:
+            writer.writerow(rows[0].keys())
+            self._header = True
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row.values()]
+            for row in rows
+        )
+        return buffer.getvalue().encode()
+
+
+def _next_cursor(fmt: str, cursor: str) -> bytes:
+    if fmt == "ndjson":
+        return _encoder.encode({"next_cursor": cursor}) + b"\n"
+    return f"#next_cursor,{cursor}\r\n".encode()
+
+
+# Global exporter instance
+_exporter = MetricExporter(
+    max_concurrent=settings.query_export_max_concurrent,
+    prefetch=settings.query_export_prefetch_rows
+)
+
+
+def get_exporter() -> MetricExporter:
+    return _exporter
+
+
+def get_stats() -> dict:
+    """Export concurrency and volume counters"""
+    return _exporter.get_stats()
@@ -0,0 +1,373 @@
+"""
+Typed decoding of agent metric records
+Each metric type has a precompiled schema: a msgspec Struct that NDJSON lines decode
+straight into (no intermediate dicts) and a generated extractor that turns the struct
+into a ready-to-COPY row tuple
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+from operator import attrgetter
+from typing import Annotated, Callable, Dict, NamedTuple, Optional, Tuple, Type, Union
+import msgspec
+from .series_store import series_key, MAX_NAME_LENGTH, MAX_LABELS, MAX_LABEL_KEY_LENGTH, MAX_LABEL_VALUE_LENGTH
+
+
+class MetricDecodeError(ValueError):
+    """Raised when a line is not valid JSON or does not match its metric schema"""
+
+    def __init__(self, message: str, reason: str = "invalid_record"):
+        super().__init__(message)
+        # Short machine-readable code for per-line error reports
+        self.reason = reason
+
+    def __reduce__(self):
+        # Keep the reason when raised in a decode worker process
+        return (type(self), (str(self), self.reason))
+
+
+class ErrorReport:
+    """Per-line failures of a partially accepted batch: counts per reason plus the first lines"""
+
+    def __init__(self, max_lines: int = 100):
+        self.max_lines = max_lines
+        self.rejected = 0
+        self.reasons: Dict[str, int] = {}
+        self.lines = []
+
+    def add(self, index: int, reason: str, detail: str):
+        self.rejected += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if len(self.lines) < self.max_lines:
+            self.lines.append({"index": index, "reason": reason, "detail": detail[:200]})
+
+    def to_dict(self) -> dict:
+        return {
+            "rejected": self.rejected,
+            "reasons": self.reasons,
+            "lines": self.lines,
+            "truncated": self.rejected > len(self.lines),
+        }
+
+
+# Value types bounded like their columns: a value outside them would fail the whole COPY,
+# so such records are rejected here as invalid_record
+Varchar = Annotated[str, msgspec.Meta(max_length=255)]
+Int32 = Annotated[int, msgspec.Meta(ge=-2**31, le=2**31 - 1)]
+Int64 = Annotated[int, msgspec.Meta(ge=-2**63, le=2**63 - 1)]
+
+
+# Record structs (tag_field routes each line by its metric_type)
+
+class CpuRecord(msgspec.Struct, tag_field="metric_type", tag="cpu"):
+    tenant_id: str
+    host: Varchar
+    timestamp: Optional[str] = None
+    cpu_percent: Optional[float] = None
+    cpu_user: Optional[float] = None
+    cpu_system: Optional[float] = None
+    cpu_idle: Optional[float] = None
+    cpu_iowait: Optional[float] = 0.0
+
+
+class MemoryRecord(msgspec.Struct, tag_field="metric_type", tag="memory"):
+    tenant_id: str
+    host: Varchar
+    timestamp: Optional[str] = None
+    memory_total: Optional[Int64] = None
+    memory_used: Optional[Int64] = None
+    memory_free: Optional[Int64] = None
+    memory_percent: Optional[float] = None
+    swap_total: Optional[Int64] = None
+    swap_used: Optional[Int64] = None
+    swap_free: Optional[Int64] = None
+    swap_percent: Optional[float] = None
+
+
+class DiskRecord(msgspec.Struct, tag_field="metric_type", tag="disk"):
+    tenant_id: str
+    host: Varchar
+    device: Varchar
+    mountpoint: Varchar
+    timestamp: Optional[str] = None
+    total: Optional[Int64] = None
+    used: Optional[Int64] = None
+    free: Optional[Int64] = None
+    percent: Optional[float] = None
+
+
+class NetworkRecord(msgspec.Struct, tag_field="metric_type", tag="network"):
+    tenant_id: str
+    host: Varchar
+    interface: Varchar
+    timestamp: Optional[str] = None
+    bytes_sent: Optional[Int64] = None
+    bytes_recv: Optional[Int64] = None
+    packets_sent: Optional[Int64] = None
+    packets_recv: Optional[Int64] = None
+    errors_in: Optional[Int32] = 0
+    errors_out: Optional[Int32] = 0
+    drops_in: Optional[Int32] = 0
+    drops_out: Optional[Int32] = 0
+
+
+class ProcessRecord(msgspec.Struct, tag_field="metric_type", tag="process"):
+    tenant_id: str
+    host: Varchar
+    pid: Int32
+    timestamp: Optional[str] = None
+    name: Optional[Varchar] = None
+    cpu_percent: Optional[float] = None
+    memory_percent: Optional[float] = None
+    status: Optional[Annotated[str, msgspec.Meta(max_length=50)]] = None
+    username: Optional[Varchar] = None
+
+
+class CustomRecord(msgspec.Struct, tag_field="metric_type", tag="custom"):
+    """Free-form labelled metric, stored in metrics_custom via the series dictionary"""
+    tenant_id: str
+    host: Varchar
+    name: Annotated[str, msgspec.Meta(min_length=1, max_length=MAX_NAME_LENGTH)]
+    value: float
+    timestamp: Optional[str] = None
+    labels: Annotated[
+        Dict[
+            Annotated[str, msgspec.Meta(max_length=MAX_LABEL_KEY_LENGTH)],
+            Annotated[str, msgspec.Meta(max_length=MAX_LABEL_VALUE_LENGTH)]
+        ],
+        msgspec.Meta(max_length=MAX_LABELS)
+    ] = {}
+
+    @property
+    def series_key(self):
+        return series_key(self.tenant_id, self.name, self.host, self.labels)
+
+
+class HostInfoRecord(msgspec.Struct, tag_field="metric_type", tag="host_info"):
+    """
+    Host inventory; accepts host_info column names and the agent's gopsutil names
+    (platform/platform_version, kernel_arch, uptime, boot_time as unix seconds)
+    """
+    tenant_id: str
+    host: Varchar
+    timestamp: Optional[str] = None
+    os: Optional[str] = None
+    os_version: Optional[str] = None
+    platform: Optional[str] = None
+    platform_version: Optional[str] = None
+    kernel_version: Optional[str] = None
+    architecture: Optional[str] = None
+    kernel_arch: Optional[str] = None
+    cpu_count: Optional[int] = None
+    cpu_model: Optional[str] = None
+    memory_total: Optional[int] = None
+    uptime_seconds: Optional[int] = None
+    uptime: Optional[int] = None
+    boot_time: Union[int, str, None] = None
+
+    @property
+    def os_release(self) -> Optional[str]:
+        if self.os_version:
+            return self.os_version
+        release = " ".join(part for part in (self.platform, self.platform_version) if part)
+        return release or None
+
+    @property
+    def arch(self) -> Optional[str]:
+        return self.architecture or self.kernel_arch
+
+    @property
+    def uptime_secs(self) -> Optional[int]:
+        return self.uptime_seconds if self.uptime_seconds is not None else self.uptime
+
+    @property
+    def boot_timestamp(self) -> Optional[datetime]:
+        if self.boot_time is None:
+            return None
+        if isinstance(self.boot_time, int):
+            return datetime.utcfromtimestamp(self.boot_time)
+        return parse_timestamp(self.boot_time)
+
+
+class AgentHostInfoRecord(HostInfoRecord, tag="hostinfo"):
+    """metric_type spelling sent by flexmon-agent"""
+
+
+class _Envelope(msgspec.Struct):
+    """Minimal view of a line, used only when a line fails typed decoding"""
+    metric_type: Optional[str] = None
+    tenant_id: Optional[str] = None
+    host: Optional[str] = None
+
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp_str(value: str) -> datetime:
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def parse_timestamp(value: Optional[str]) -> datetime:
+    """
+    Parse an RFC 3339 timestamp into naive UTC (metric columns are TIMESTAMP)
+    Agents stamp every record of a collection cycle with the same time, so parses are memoized
+    """
+    if value is None:
+        return datetime.utcnow()
+    try:
+        return _parse_timestamp_str(value)
+    except ValueError:
+        raise MetricDecodeError(f"Invalid timestamp: {value!r}", "invalid_timestamp")
+
+
+class MetricSchema(NamedTuple):
+    """Precompiled decoding schema for one metric type"""
+    metric_type: str
+    table: str
+    columns: Tuple[str, ...]
+    struct: Type[msgspec.Struct]
+    to_row: Callable[[msgspec.Struct], tuple]
+
+
+def _compile_extractor(fields: Tuple[str, ...]) -> Callable[[msgspec.Struct], tuple]:
+    """Build a row extractor that reads struct attributes in COPY column order"""
+    get_fields = attrgetter(*fields)
+
+    def to_row(record: msgspec.Struct) -> tuple:
+        return (parse_timestamp(record.timestamp),) + get_fields(record)
+
+    return to_row
+
+
+def _schema(
+    struct: Type[msgspec.Struct],
+    table: str,
+    columns: Tuple[str, ...],
+    fields: Tuple[str, ...] = None
+) -> MetricSchema:
+    """Compile a schema; fields name the struct attributes behind each column when they differ"""
+    return MetricSchema(
+        metric_type=struct.__struct_config__.tag,
+        table=table,
+        columns=("timestamp",) + columns,
+        struct=struct,
+        to_row=_compile_extractor(fields or columns)
+    )
+
+
+SCHEMAS: Dict[str, MetricSchema] = {
+    schema.metric_type: schema
+    for schema in (
+        _schema(
+            CpuRecord, "metrics_cpu",
+            ("tenant_id", "host", "cpu_percent", "cpu_user", "cpu_system", "cpu_idle", "cpu_iowait")
+        ),
+        _schema(
+            MemoryRecord, "metrics_memory",
+            ("tenant_id", "host", "memory_total", "memory_used", "memory_free", "memory_percent",
+             "swap_total", "swap_used", "swap_free", "swap_percent")
+        ),
+        _schema(
+            DiskRecord, "metrics_disk",
+            ("tenant_id", "host", "device", "mountpoint", "total_bytes", "used_bytes", "free_bytes", "percent"),
+            ("tenant_id", "host", "device", "mountpoint", "total", "used", "free", "percent")
+        ),
+        _schema(
+            NetworkRecord, "metrics_network",
+            ("tenant_id", "host", "interface", "bytes_sent", "bytes_recv", "packets_sent", "packets_recv",
+             "errors_in", "errors_out", "drops_in", "drops_out")
+        ),
+        _schema(
+            ProcessRecord, "metrics_process",
+            ("tenant_id", "host", "pid", "name", "cpu_percent", "memory_percent", "status", "username")
+        ),
+        _schema(
+            HostInfoRecord, "host_info",
+            ("tenant_id", "host", "os", "os_version", "kernel_version", "architecture", "cpu_count",
+             "cpu_model", "memory_total", "uptime_seconds", "boot_time"),
+            ("tenant_id", "host", "os", "os_release", "kernel_version", "arch", "cpu_count",
+             "cpu_model", "memory_total", "uptime_secs", "boot_timestamp")
+        ),
+        # Rows carry the series key until series_store.resolve_rows swaps in the series_id
+        _schema(
+            CustomRecord, "metrics_custom",
+            ("series_id", "value"),
+            ("series_key", "value")
+        ),
+    )
+}
+
+_SCHEMA_BY_STRUCT: Dict[type, MetricSchema] = {schema.struct: schema for schema in SCHEMAS.values()}
+_SCHEMA_BY_STRUCT[AgentHostInfoRecord] = SCHEMAS["host_info"]
+
+# metric_type values with a schema, including aliases
+_KNOWN_TAGS = frozenset(struct.__struct_config__.tag for struct in _SCHEMA_BY_STRUCT)
+
+_record_decoder = msgspec.json.Decoder(
+    Union[CpuRecord, MemoryRecord, DiskRecord, NetworkRecord, ProcessRecord, CustomRecord,
+          HostInfoRecord, AgentHostInfoRecord]
+)
+_envelope_decoder = msgspec.json.Decoder(_Envelope)
+
+
+def decode_record(line: bytes, tenant_id: Optional[str] = None) -> Tuple[Optional[MetricSchema], msgspec.Struct]:
+    """
+    Decode one NDJSON line into its typed record
+    Returns (schema, record); schema is None for metric types this API does not store,
+    in which case record only carries metric_type/tenant_id/host. With tenant_id, an
+    invalid record that names another tenant raises tenant_mismatch, not invalid_record
+    (the caller still compares the tenant of valid records)
+    """
+    try:
+        record = _record_decoder.decode(line)
+        return _SCHEMA_BY_STRUCT[type(record)], record
+    except msgspec.ValidationError as e:
+        # Unknown metric types fail the tagged union; tell those apart from bad records
+        try:
+            envelope = _envelope_decoder.decode(line)
+        except msgspec.DecodeError:
+            raise MetricDecodeError(f"Invalid record: {e}")
+        if tenant_id is not None and envelope.tenant_id is not None and envelope.tenant_id != tenant_id:
+            raise MetricDecodeError("Tenant ID mismatch", "tenant_mismatch")
+        if envelope.metric_type in _KNOWN_TAGS:
+            raise MetricDecodeError(f"Invalid {envelope.metric_type} record: {e}")
+        return None, envelope
+    except msgspec.DecodeError as e:
+        raise MetricDecodeError(f"Invalid JSON: {e}", "invalid_json")
+
+
+class BatchDecoder:
+    """
+    Decodes the NDJSON lines of one batch into {metric_type: rows}
+    A tenant mismatch or invalid line raises MetricDecodeError, unless the batch is
+    partially accepted, in which case the line is added to the error report and skipped
+    """
+
+    def __init__(self, tenant_id: str, partial: bool = False, max_reported_lines: int = 100):
+        self.tenant_id = tenant_id
+        self.batches: Dict[str, list] = {metric_type: [] for metric_type in SCHEMAS}
+        self.hosts = set()
+        self.report = ErrorReport(max_reported_lines) if partial else None
+        self._index = -1
+
+    def add(self, line: bytes):
+        """Decode one line of the body; blank lines are skipped but still advance the line index"""
+        self._index += 1
+        if not line.strip():
+            return
+        try:
+            schema, record = decode_record(line, self.tenant_id)
+            if record.tenant_id != self.tenant_id:
+                raise MetricDecodeError("Tenant ID mismatch", "tenant_mismatch")
+            # Metric types without a table are skipped
+            if schema is None:
+                return
+            row = schema.to_row(record)
+        except MetricDecodeError as e:
+            if self.report is None:
+                raise
+            self.report.add(self._index, e.reason, str(e))
+            return
+
+        self.batches[schema.metric_type].append(row)
+        self.hosts.add(record.host)
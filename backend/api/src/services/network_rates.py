@@ -0,0 +1,95 @@
+"""
+Network counter rates
+metrics_network rows carry cumulative interface counters. The previous sample is kept
+per (tenant, host, interface) and each row gains per-second rates for its counters, so
+aggregates and alert rules read rates instead of differencing counters at query time.
+The first sample of an interface has NULL rates; a counter that went backwards (reboot,
+driver reload, 32-bit wrap) has a NULL rate for that sample. State is per API process,
+so with several replicas an interface's first sample on each replica has no rates.
+"""
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+from .host_rows import NETWORK_FIELDS
+
+RATE_COLUMNS = tuple(f"{field}_rate" for field in NETWORK_FIELDS)
+
+# metrics_network row: (timestamp, tenant_id, host, interface, <NETWORK_FIELDS counters>)
+_COUNTERS = slice(4, 4 + len(NETWORK_FIELDS))
+_NO_RATES = (None,) * len(NETWORK_FIELDS)
+
+
+class NetworkCounterRates:
+    """Previous counter sample per (tenant_id, host, interface), bounded LRU"""
+
+    def __init__(self, max_entries: int = 200000):
+        self.max_entries = max_entries
+        self._previous: "OrderedDict[Tuple[str, str, str], tuple]" = OrderedDict()
+        self.stats = {"rows": 0, "first_samples": 0, "resets": 0, "out_of_order": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._previous)
+
+    def add_rates(self, rows: List[tuple]) -> List[tuple]:
+        """Rows with RATE_COLUMNS appended, in timestamp order"""
+        result = []
+        for row in sorted(rows, key=itemgetter(0)):
+            result.append(row + self._rates(row))
+        self.stats["rows"] += len(rows)
+        return result
+
+    def _rates(self, row: tuple) -> Tuple[Optional[float], ...]:
+        key = (row[1], row[2], row[3])
+        counters = row[_COUNTERS]
+        previous = self._previous.get(key)
+
+        if previous is None:
+            self.stats["first_samples"] += 1
+            self._remember(key, row[0], counters)
+            return _NO_RATES
+
+        elapsed = (row[0] - previous[0]).total_seconds()
+        if elapsed <= 0:
+            # Duplicate or late sample; keep the newer state
+            self.stats["out_of_order"] += 1
+            return _NO_RATES
+
+        rates = []
+        reset = False
+        for current, last in zip(counters, previous[1]):
+            if current is None or last is None:
+                rates.append(None)
+            elif current < last:
+                reset = True
+                rates.append(None)
+            else:
+                rates.append(round((current - last) / elapsed, 3))
+        if reset:
+            self.stats["resets"] += 1
+
+        self._remember(key, row[0], counters)
+        return tuple(rates)
+
+    def _remember(self, key: Tuple[str, str, str], timestamp, counters: tuple):
+        self._previous[key] = (timestamp, counters)
+        self._previous.move_to_end(key)
+        while len(self._previous) > self.max_entries:
+            self._previous.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> dict:
+        return {"tracked_interfaces": len(self._previous), **self.stats}
+
+
+# Global tracker instance (holds the previous sample between batches)
+_rates = NetworkCounterRates()
+
+
+def add_rates(rows: List[tuple]) -> List[tuple]:
+    """Append per-second rates (RATE_COLUMNS) to metrics_network rows"""
+    return _rates.add_rates(rows)
+
+
+def get_stats() -> Dict[str, int]:
+    """Counter rate tracking counters"""
+    return _rates.get_stats()
@@ -0,0 +1,526 @@
+"""
+OTLP/HTTP metrics decoding
+Decodes ExportMetricsServiceRequest payloads (binary protobuf or OTLP/JSON) and maps
+OpenTelemetry host metrics (hostmetrics receiver: system.cpu/memory/paging/filesystem/network)
+onto metrics_* rows; any other gauge or sum becomes a custom metric (metrics_custom,
+labelled by its data point attributes). Resource attributes are decoded once per
+ResourceMetrics (that is where host.name lives); data points only carry their own small
+attribute sets, and histograms/summaries are skipped by length without decoding them.
+"""
+import struct
+from collections import defaultdict
+from typing import Container, Dict, List, Optional, Tuple, Union
+import msgspec
+from . import host_rows
+from .series_store import series_key, within_limits
+from .protowire import (
+    read_varint, read_int64, read_double, read_sfixed64, read_fixed64, read_bytes,
+    skip_field, WireFormatError
+)
+
+# (attributes, time_unix_nano, value)
+DataPoint = Tuple[Dict[str, str], int, float]
+# (resource attributes, [(metric name, [data points])])
+ResourceBatch = Tuple[Dict[str, str], List[Tuple[str, List[DataPoint]]]]
+
+
+class OtlpDecodeError(ValueError):
+    """Body is not a valid OTLP ExportMetricsServiceRequest"""
+
+
+CPU_TIME = "system.cpu.time"
+CPU_UTILIZATION = "system.cpu.utilization"
+MEMORY_USAGE = "system.memory.usage"
+PAGING_USAGE = "system.paging.usage"
+FILESYSTEM_USAGE = "system.filesystem.usage"
+
+# (metric, direction) -> network row field
+NETWORK_METRICS = {
+    ("system.network.io", "transmit"): "bytes_sent",
+    ("system.network.io", "receive"): "bytes_recv",
+    ("system.network.packets", "transmit"): "packets_sent",
+    ("system.network.packets", "receive"): "packets_recv",
+    ("system.network.errors", "receive"): "errors_in",
+    ("system.network.errors", "transmit"): "errors_out",
+    ("system.network.dropped", "receive"): "drops_in",
+    ("system.network.dropped", "transmit"): "drops_out",
+}
+
+KNOWN_METRICS = frozenset(
+    (CPU_TIME, CPU_UTILIZATION, MEMORY_USAGE, PAGING_USAGE, FILESYSTEM_USAGE)
+    + tuple(metric for metric, _ in NETWORK_METRICS)
+)
+
+# Resource attributes copied onto custom metric labels (host.name is the series host)
+CUSTOM_RESOURCE_LABELS = ("service.name", "service.namespace")
+
+
+# Binary protobuf
+
+def _read_any_value(buf: bytes, pos: int, end: int) -> Optional[str]:
+    """AnyValue as a string (scalar types only; arrays/kvlists are ignored)"""
+    value = None
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        if key == 0x0A:  # 1: string_value
+            raw, pos = read_bytes(buf, pos)
+            value = raw.decode()
+        elif key == 0x10:  # 2: bool_value
+            flag, pos = read_varint(buf, pos)
+            value = "true" if flag else "false"
+        elif key == 0x18:  # 3: int_value
+            number, pos = read_int64(buf, pos)
+            value = str(number)
+        elif key == 0x21:  # 4: double_value
+            value = str(read_double(buf, pos))
+            pos += 8
+        else:
+            pos = skip_field(buf, pos, key & 7)
+    return value
+
+
+def _read_key_value(buf: bytes, pos: int, end: int) -> Tuple[str, Optional[str]]:
+    name, value = "", None
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        if key == 0x0A:  # 1: key
+            raw, pos = read_bytes(buf, pos)
+            name = raw.decode()
+        elif key == 0x12:  # 2: value
+            length, pos = read_varint(buf, pos)
+            value = _read_any_value(buf, pos, pos + length)
+            pos += length
+        else:
+            pos = skip_field(buf, pos, key & 7)
+    return name, value
+
+
+def _read_attributes(buf: bytes, pos: int, end: int, field_key: int) -> Dict[str, str]:
+    """Collect repeated KeyValue fields tagged `field_key` within buf[pos:end]"""
+    attributes = {}
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        if key == field_key:
+            length, pos = read_varint(buf, pos)
+            name, value = _read_key_value(buf, pos, pos + length)
+            if value is not None:
+                attributes[name] = value
+            pos += length
+        else:
+            pos = skip_field(buf, pos, key & 7)
+    return attributes
+
+
+def _read_number_point(buf: bytes, pos: int, end: int) -> Optional[DataPoint]:
+    attributes = {}
+    time_nano = 0
+    value = None
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        if key == 0x3A:  # 7: attributes
+            length, pos = read_varint(buf, pos)
+            name, attr = _read_key_value(buf, pos, pos + length)
+            if attr is not None:
+                attributes[name] = attr
+            pos += length
+        elif key == 0x19:  # 3: time_unix_nano (fixed64)
+            time_nano = read_fixed64(buf, pos)
+            pos += 8
+        elif key == 0x21:  # 4: as_double
+            value = read_double(buf, pos)
+            pos += 8
+        elif key == 0x31:  # 6: as_int (sfixed64)
+            value = float(read_sfixed64(buf, pos))
+            pos += 8
+        else:
+            pos = skip_field(buf, pos, key & 7)
+    if value is None:
+        return None
+    return attributes, time_nano, value
+
+
+def _read_number_points(buf: bytes, pos: int, end: int, points: List[DataPoint]):
+    """Gauge / Sum: repeated NumberDataPoint data_points = 1"""
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        if key == 0x0A:
+            length, pos = read_varint(buf, pos)
+            point = _read_number_point(buf, pos, pos + length)
+            if point:
+                points.append(point)
+            pos += length
+        else:
+            pos = skip_field(buf, pos, key & 7)
+
+
+def _read_metric(
+    buf: bytes,
+    pos: int,
+    end: int,
+    wanted: Optional[Container[bytes]]
+) -> Optional[Tuple[str, List[DataPoint]]]:
+    """
+    Decode a gauge/sum Metric, if its name is wanted (None: any name)
+    The name is field 1, so unwanted metrics stop early; other metric kinds are skipped
+    """
+    name = None
+    numeric = False
+    points: List[DataPoint] = []
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        if key == 0x0A:  # 1: name
+            raw, pos = read_bytes(buf, pos)
+            if wanted is not None and raw not in wanted:
+                return None
+            name = raw.decode()
+        elif key in (0x2A, 0x3A):  # 5: gauge, 7: sum
+            numeric = True
+            length, pos = read_varint(buf, pos)
+            _read_number_points(buf, pos, pos + length, points)
+            pos += length
+        else:
+            # description, unit, histograms, summaries, metadata
+            pos = skip_field(buf, pos, key & 7)
+    if name is None or not numeric:
+        return None
+    return name, points
+
+
+def decode_protobuf(data: bytes, wanted: Optional[Container[bytes]] = None) -> Tuple[List[ResourceBatch], int]:
+    """
+    Decode a binary ExportMetricsServiceRequest, keeping gauges/sums named in `wanted` (None: all)
+    Returns (resource batches, dropped metric count)
+    """
+    batches = []
+    dropped = 0
+    pos = 0
+    size = len(data)
+
+    try:
+        while pos < size:
+            key, pos = read_varint(data, pos)
+            if key != 0x0A:  # 1: resource_metrics
+                pos = skip_field(data, pos, key & 7)
+                continue
+            length, pos = read_varint(data, pos)
+            end = pos + length
+            if end > size:
+                raise OtlpDecodeError("Truncated resource_metrics")
+
+            resource = {}
+            metrics = []
+            while pos < end:
+                key, pos = read_varint(data, pos)
+                if key == 0x0A:  # 1: resource -> attributes (1)
+                    length, pos = read_varint(data, pos)
+                    resource = _read_attributes(data, pos, pos + length, 0x0A)
+                    pos += length
+                elif key == 0x12:  # 2: scope_metrics -> metrics (2); scope itself is not needed
+                    length, pos = read_varint(data, pos)
+                    scope_pos, scope_end = pos, pos + length
+                    while scope_pos < scope_end:
+                        key, scope_pos = read_varint(data, scope_pos)
+                        if key == 0x12:
+                            metric_len, scope_pos = read_varint(data, scope_pos)
+                            metric = _read_metric(data, scope_pos, scope_pos + metric_len, wanted)
+                            if metric:
+                                metrics.append(metric)
+                            else:
+                                dropped += 1
+                            scope_pos += metric_len
+                        else:
+                            scope_pos = skip_field(data, scope_pos, key & 7)
+                    pos = scope_end
+                else:
+                    pos = skip_field(data, pos, key & 7)
+            batches.append((resource, metrics))
+    except (IndexError, struct.error, UnicodeDecodeError, WireFormatError) as e:
+        raise OtlpDecodeError(f"Malformed OTLP protobuf: {e}")
+
+    return batches, dropped
+
+
+# OTLP/JSON (proto3 JSON mapping: camelCase keys, 64-bit integers as strings)
+
+class _AnyValue(msgspec.Struct, rename="camel", frozen=True):
+    string_value: Optional[str] = None
+    bool_value: Optional[bool] = None
+    int_value: Union[int, str, None] = None
+    double_value: Optional[float] = None
+
+    def as_str(self) -> Optional[str]:
+        if self.string_value is not None:
+            return self.string_value
+        if self.bool_value is not None:
+            return "true" if self.bool_value else "false"
+        if self.int_value is not None:
+            return str(self.int_value)
+        if self.double_value is not None:
+            return str(self.double_value)
+        return None
+
+
+class _KeyValue(msgspec.Struct):
+    key: str
+    value: _AnyValue = _AnyValue()
+
+
+class _NumberDataPoint(msgspec.Struct, rename="camel"):
+    attributes: List[_KeyValue] = []
+    time_unix_nano: Union[int, str] = 0
+    as_double: Optional[float] = None
+    as_int: Union[int, str, None] = None
+
+
+class _NumberData(msgspec.Struct, rename="camel"):
+    data_points: List[_NumberDataPoint] = []
+
+
+class _Metric(msgspec.Struct):
+    name: str
+    gauge: Optional[_NumberData] = None
+    sum: Optional[_NumberData] = None
+
+
+class _ScopeMetrics(msgspec.Struct):
+    metrics: List[_Metric] = []
+
+
+class _Resource(msgspec.Struct, frozen=True):
+    attributes: List[_KeyValue] = []
+
+
+class _ResourceMetrics(msgspec.Struct, rename="camel"):
+    resource: _Resource = _Resource()
+    scope_metrics: List[_ScopeMetrics] = []
+
+
+class _ExportRequest(msgspec.Struct, rename="camel"):
+    resource_metrics: List[_ResourceMetrics] = []
+
+
+_json_decoder = msgspec.json.Decoder(_ExportRequest)
+
+
+def _json_attributes(attributes: List[_KeyValue]) -> Dict[str, str]:
+    result = {}
+    for kv in attributes:
+        value = kv.value.as_str()
+        if value is not None:
+            result[kv.key] = value
+    return result
+
+
+def decode_json(data: bytes, wanted: Optional[Container[str]] = None) -> Tuple[List[ResourceBatch], int]:
+    """
+    Decode an OTLP/JSON ExportMetricsServiceRequest, keeping gauges/sums named in `wanted` (None: all)
+    Returns (resource batches, dropped metric count)
+    """
+    try:
+        request = _json_decoder.decode(data)
+    except (msgspec.DecodeError, msgspec.ValidationError) as e:
+        raise OtlpDecodeError(f"Invalid OTLP JSON: {e}")
+
+    batches = []
+    dropped = 0
+    try:
+        for resource_metrics in request.resource_metrics:
+            metrics = []
+            for scope in resource_metrics.scope_metrics:
+                for metric in scope.metrics:
+                    data_points = metric.gauge or metric.sum
+                    if (wanted is not None and metric.name not in wanted) or data_points is None:
+                        dropped += 1
+                        continue
+                    points = []
+                    for point in data_points.data_points:
+                        if point.as_double is not None:
+                            value = point.as_double
+                        elif point.as_int is not None:
+                            value = float(int(point.as_int))
+                        else:
+                            continue
+                        points.append((_json_attributes(point.attributes), int(point.time_unix_nano), value))
+                    metrics.append((metric.name, points))
+            batches.append((_json_attributes(resource_metrics.resource.attributes), metrics))
+    except ValueError as e:
+        raise OtlpDecodeError(f"Invalid OTLP JSON: {e}")
+
+    return batches, dropped
+
+
+def _attr(attributes: Dict[str, str], *names: str) -> Optional[str]:
+    """First present attribute; semantic conventions renamed several (state -> cpu.mode, ...)"""
+    for name in names:
+        value = attributes.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+class HostMetricsMapper:
+    """
+    Maps OpenTelemetry host metrics onto metric rows, and everything else onto custom metric rows
+    system.cpu.utilization is used when present; otherwise usage is derived from
+    system.cpu.time deltas between exports (state kept per host)
+    """
+
+    def __init__(self):
+        self._cpu = host_rows.CpuCounterRates()
+        self.stats = {
+            "requests": 0,
+            "metrics_mapped": 0,
+            "metrics_dropped": 0,
+            "resources_without_host": 0,
+            "data_points": 0,
+            "custom_points": 0,
+            "custom_points_rejected": 0,
+            "points_without_device": 0,
+            "incomplete_dropped": 0,
+        }
+
+    def to_rows(self, tenant_id: str, batches: List[ResourceBatch]) -> Tuple[Dict[str, List[tuple]], set]:
+        """Build {metric_type: rows} from decoded resource batches; also returns the hosts seen"""
+        cpu_seconds = defaultdict(lambda: defaultdict(float))
+        cpu_util = defaultdict(lambda: defaultdict(float))
+        cpu_count = defaultdict(set)
+        memory = defaultdict(lambda: defaultdict(float))
+        paging = defaultdict(lambda: defaultdict(float))
+        disks = defaultdict(lambda: defaultdict(float))
+        networks = defaultdict(dict)
+        custom = []
+        hosts = set()
+
+        for resource, metrics in batches:
+            host = resource.get("host.name")
+            if not host:
+                self.stats["resources_without_host"] += 1
+                self.stats["metrics_dropped"] += len(metrics)
+                continue
+            hosts.add(host)
+            resource_labels = {k: resource[k] for k in CUSTOM_RESOURCE_LABELS if k in resource}
+
+            for name, points in metrics:
+                self.stats["metrics_mapped"] += 1
+                self.stats["data_points"] += len(points)
+
+                if name not in KNOWN_METRICS:
+                    for attrs, time_nano, value in points:
+                        labels = {**resource_labels, **attrs}
+                        # Over-long names or label sets would fail the series dictionary insert
+                        if not within_limits(name, host, labels):
+                            self.stats["custom_points_rejected"] += 1
+                            continue
+                        key = series_key(tenant_id, name, host, labels)
+                        custom.append((host_rows.timestamp_from_ms(time_nano // 1_000_000), key, value))
+                        self.stats["custom_points"] += 1
+                    continue
+
+                for attrs, time_nano, value in points:
+                    ts = time_nano // 1_000_000
+                    state = _attr(attrs, "state", "cpu.mode", "system.memory.state",
+                                  "system.paging.state", "system.filesystem.state")
+
+                    if name == CPU_TIME:
+                        cpu_seconds[(host, ts)][state] += value
+                    elif name == CPU_UTILIZATION:
+                        cpu_util[(host, ts)][state] += value
+                        cpu_count[(host, ts)].add(_attr(attrs, "cpu", "cpu.logical_number"))
+                    elif name == MEMORY_USAGE:
+                        memory[(host, ts)][state] += value
+                    elif name == PAGING_USAGE:
+                        paging[(host, ts)][state] += value
+                    elif name == FILESYSTEM_USAGE:
+                        device = _attr(attrs, "device", "system.device")
+                        mountpoint = _attr(attrs, "mountpoint", "system.filesystem.mountpoint")
+                        # device/mountpoint and interface are NOT NULL keys of the disk and network tables
+                        if not device or not mountpoint:
+                            self.stats["points_without_device"] += 1
+                            continue
+                        disks[(host, device, mountpoint, ts)][state] += value
+                    else:
+                        direction = _attr(attrs, "direction", "network.io.direction")
+                        field = NETWORK_METRICS.get((name, direction))
+                        if field:
+                            interface = _attr(attrs, "device", "system.device", "network.interface.name")
+                            if not interface:
+                                self.stats["points_without_device"] += 1
+                                continue
+                            networks[(host, interface, ts)][field] = value
+
+        rows = {
+            "cpu": [
+                host_rows.cpu_row(
+                    tenant_id, host, ts,
+                    {state: total / max(len(cpu_count[(host, ts)]), 1) for state, total in shares.items()}
+                )
+                for (host, ts), shares in cpu_util.items()
+            ],
+            "memory": [],
+            "disk": [],
+            "network": [],
+            "custom": custom,
+        }
+
+        # Cumulative counters are never zero-filled: network_rates would read a missing
+        # counter as a reset, so an interface needs all of them in the same export
+        for key, fields in networks.items():
+            if all(field in fields for field in host_rows.NETWORK_FIELDS):
+                rows["network"].append(host_rows.network_row(tenant_id, *key, fields))
+            else:
+                self.stats["incomplete_dropped"] += 1
+
+        # Counter-derived CPU only for hosts that don't report utilization directly
+        util_hosts = {host for host, _ in cpu_util}
+        rows["cpu"] += self._cpu.rows(
+            tenant_id,
+            {key: totals for key, totals in cpu_seconds.items() if key[0] not in util_hosts}
+        )
+
+        for (host, ts), states in memory.items():
+            cached = states.get("buffered", 0.0) + states.get("cached", 0.0)
+            fields = {
+                # slab_* states overlap "used" and are not part of the total
+                "total": states.get("used", 0.0) + states.get("free", 0.0) + cached,
+                "free": states.get("free", 0.0),
+                "available": states.get("free", 0.0) + cached,
+            }
+            swap = paging.get((host, ts))
+            if swap:
+                fields["swap_total"] = swap.get("used", 0.0) + swap.get("free", 0.0)
+                fields["swap_free"] = swap.get("free", 0.0)
+            rows["memory"].append(host_rows.memory_row(tenant_id, host, ts, fields))
+
+        for key, states in disks.items():
+            free = states.get("free", 0.0)
+            fields = {
+                "size": states.get("used", 0.0) + free + states.get("reserved", 0.0),
+                "free": free + states.get("reserved", 0.0),
+                "avail": free,
+            }
+            rows["disk"].append(host_rows.disk_row(tenant_id, *key, fields))
+
+        return rows, hosts
+
+    def get_stats(self) -> dict:
+        return {"tracked_cpu_hosts": len(self._cpu), "cpu_resets": self._cpu.resets, **self.stats}
+
+
+# Global mapper instance (holds CPU counter state between exports)
+_mapper = HostMetricsMapper()
+
+
+def decode(body: bytes, content_type: str, tenant_id: str) -> Tuple[Dict[str, List[tuple]], set]:
+    """Decode and map an OTLP metrics export (protobuf or JSON) into {metric_type: rows} and hosts"""
+    if content_type == "application/json":
+        batches, dropped = decode_json(body)
+    else:
+        batches, dropped = decode_protobuf(body)
+    _mapper.stats["requests"] += 1
+    _mapper.stats["metrics_dropped"] += dropped
+    return _mapper.to_rows(tenant_id, batches)
+
+
+def get_stats() -> dict:
+    """OTLP decode/mapping counters"""
+    return _mapper.get_stats()
@@ -0,0 +1,365 @@
+"""
+Prometheus remote_write decoding
+Decodes snappy-compressed WriteRequest protobufs and maps node_exporter series
+(CPU, memory, filesystem, network) onto the metrics_* table rows used by the NDJSON path.
+Prometheus may split one scrape's series across several requests (shards,
+max_samples_per_send), so samples are merged per host and timestamp across requests and a
+row is only built once every series it needs has arrived.
+The protobuf reader is hand-rolled: it only walks the fields we need, and a series
+whose __name__ is not mapped is skipped by length without decoding its other labels
+or samples.
+"""
+import math
+import struct
+import time
+from collections import defaultdict
+from typing import Container, Dict, List, Optional, Tuple
+import snappy
+from . import host_rows
+from .protowire import read_varint, read_int64, read_double, skip_field, WireFormatError
+
+_NAME_LABEL = b"__name__"
+
+
+class RemoteWriteDecodeError(ValueError):
+    """Body is not a valid snappy-compressed remote_write WriteRequest"""
+
+
+class RemoteWriteSizeExceeded(ValueError):
+    """Decompressed WriteRequest would exceed the allowed size"""
+
+
+# node_exporter series -> field of the row they feed
+CPU_SERIES = b"node_cpu_seconds_total"
+
+MEMORY_SERIES = {
+    b"node_memory_MemTotal_bytes": "total",
+    b"node_memory_MemFree_bytes": "free",
+    b"node_memory_MemAvailable_bytes": "available",
+    b"node_memory_SwapTotal_bytes": "swap_total",
+    b"node_memory_SwapFree_bytes": "swap_free",
+}
+
+FILESYSTEM_SERIES = {
+    b"node_filesystem_size_bytes": "size",
+    b"node_filesystem_free_bytes": "free",
+    b"node_filesystem_avail_bytes": "avail",
+}
+
+NETWORK_SERIES = {
+    b"node_network_transmit_bytes_total": "bytes_sent",
+    b"node_network_receive_bytes_total": "bytes_recv",
+    b"node_network_transmit_packets_total": "packets_sent",
+    b"node_network_receive_packets_total": "packets_recv",
+    b"node_network_receive_errs_total": "errors_in",
+    b"node_network_transmit_errs_total": "errors_out",
+    b"node_network_receive_drop_total": "drops_in",
+    b"node_network_transmit_drop_total": "drops_out",
+}
+
+KNOWN_SERIES = frozenset((CPU_SERIES, *MEMORY_SERIES, *FILESYSTEM_SERIES, *NETWORK_SERIES))
+
+# Fields a memory/disk/network sample needs before its row is built
+_REQUIRED_FIELDS = {
+    "memory": host_rows.MEMORY_FIELDS + host_rows.SWAP_FIELDS,
+    "disk": host_rows.DISK_FIELDS,
+    "network": host_rows.NETWORK_FIELDS,
+}
+
+_ROW_BUILDERS = {
+    "memory": host_rows.memory_row,
+    "disk": host_rows.disk_row,
+    "network": host_rows.network_row,
+}
+
+# How long a partial sample waits for the rest of its series before it is given up
+PENDING_MAX_AGE_SEC = 30.0
+
+
+def decompress(body: bytes, max_bytes: int) -> bytes:
+    """Snappy-decompress a remote_write body, checking the declared size before inflating"""
+    try:
+        declared, _ = read_varint(body, 0)
+    except IndexError:
+        raise RemoteWriteDecodeError("Empty or truncated snappy body")
+    if declared > max_bytes:
+        raise RemoteWriteSizeExceeded(f"Decompressed body exceeds {max_bytes} bytes")
+    try:
+        return snappy.uncompress(body)
+    except snappy.UncompressError as e:
+        raise RemoteWriteDecodeError(f"Invalid snappy body: {e}")
+
+
+def _read_label(buf: bytes, pos: int, end: int) -> Tuple[bytes, bytes]:
+    name = value = b""
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        if key == 0x0A:  # 1: name
+            length, pos = read_varint(buf, pos)
+            name = buf[pos:pos + length]
+            pos += length
+        elif key == 0x12:  # 2: value
+            length, pos = read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        else:
+            pos = skip_field(buf, pos, key & 7)
+    return name, value
+
+
+def _read_sample(buf: bytes, pos: int, end: int) -> Tuple[float, int]:
+    value, timestamp = 0.0, 0
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        if key == 0x09:  # 1: value (double)
+            value = read_double(buf, pos)
+            pos += 8
+        elif key == 0x10:  # 2: timestamp (int64 ms)
+            timestamp, pos = read_int64(buf, pos)
+        else:
+            pos = skip_field(buf, pos, key & 7)
+    return value, timestamp
+
+
+def decode_write_request(
+    data: bytes,
+    wanted: Container[bytes] = KNOWN_SERIES
+) -> Tuple[List[Tuple[bytes, Dict[str, str], List[Tuple[float, int]]]], int]:
+    """
+    Decode a WriteRequest, keeping only series whose __name__ is in `wanted`
+    Returns ([(name, labels, [(value, timestamp_ms)])], dropped series count)
+    """
+    series = []
+    dropped = 0
+    pos = 0
+    size = len(data)
+
+    try:
+        while pos < size:
+            key, pos = read_varint(data, pos)
+            if key != 0x0A:  # only 1: timeseries; metadata etc. are skipped
+                pos = skip_field(data, pos, key & 7)
+                continue
+
+            length, pos = read_varint(data, pos)
+            end = pos + length
+            if end > size:
+                raise RemoteWriteDecodeError("Truncated timeseries")
+
+            name = None
+            labels = {}
+            samples = []
+            while pos < end:
+                key, pos = read_varint(data, pos)
+                if key == 0x0A:  # 1: label
+                    label_len, pos = read_varint(data, pos)
+                    label_name, label_value = _read_label(data, pos, pos + label_len)
+                    pos += label_len
+                    if label_name == _NAME_LABEL:
+                        if label_value not in wanted:
+                            break
+                        name = label_value
+                    else:
+                        labels[label_name] = label_value
+                elif key == 0x12:  # 2: sample
+                    sample_len, pos = read_varint(data, pos)
+                    samples.append(_read_sample(data, pos, pos + sample_len))
+                    pos += sample_len
+                else:
+                    pos = skip_field(data, pos, key & 7)
+
+            if name is None:
+                # Unmapped (or unnamed) series: jump straight past it
+                dropped += 1
+            else:
+                series.append((
+                    name,
+                    {k.decode(): v.decode() for k, v in labels.items()},
+                    samples
+                ))
+            pos = end
+    except (IndexError, struct.error, UnicodeDecodeError, WireFormatError):
+        raise RemoteWriteDecodeError("Malformed WriteRequest protobuf")
+
+    return series, dropped
+
+
+def _host(labels: Dict[str, str]) -> Optional[str]:
+    """Host from an explicit host label, else the scrape instance without its port"""
+    host = labels.get("host")
+    if host:
+        return host
+    instance = labels.get("instance", "")
+    address, sep, port = instance.rpartition(":")
+    if sep and port.isdigit():
+        instance = address.strip("[]")
+    return instance or None
+
+
+class NodeExporterMapper:
+    """
+    Maps decoded node_exporter series onto metric rows
+    Samples are merged per (tenant, host[, device, mountpoint], timestamp) until complete.
+    CPU usage is derived from node_cpu_seconds_total deltas, so previous totals are kept
+    between writes; a CPU sample is complete once it has the same (cpu, mode) series as the
+    host's last one. A host's first CPU sample, or one with more CPUs (hotplug), becomes the
+    baseline as soon as every CPU in it reports the same modes.
+    """
+
+    def __init__(self):
+        self._cpu = host_rows.CpuCounterRates()
+        # (metric_type, tenant_id, host, [device, [mountpoint,]] timestamp_ms) -> (first seen, {field: value})
+        self._pending: Dict[tuple, Tuple[float, dict]] = {}
+        # (tenant_id, host) -> (cpu, mode) series of its CPU baseline
+        self._cpu_series: Dict[Tuple[str, str], frozenset] = {}
+        self._last_sweep = 0.0
+        self.stats = {
+            "requests": 0,
+            "series_mapped": 0,
+            "series_dropped": 0,
+            "samples": 0,
+            "series_without_device": 0,
+            "incomplete_dropped": 0,
+        }
+
+    def to_rows(
+        self,
+        tenant_id: str,
+        series: List[Tuple[bytes, Dict[str, str], List[Tuple[float, int]]]]
+    ) -> Tuple[Dict[str, List[tuple]], set]:
+        """Build {metric_type: rows} from decoded series; also returns the hosts seen"""
+        now = time.monotonic()
+        touched = set()
+        hosts = set()
+
+        for name, labels, samples in series:
+            host = _host(labels)
+            if not host:
+                self.stats["series_dropped"] += 1
+                continue
+
+            if name == CPU_SERIES:
+                series_key = ("cpu", tenant_id, host)
+                field = (labels.get("cpu", ""), labels.get("mode", ""))
+            elif name in MEMORY_SERIES:
+                series_key = ("memory", tenant_id, host)
+                field = MEMORY_SERIES[name]
+            else:
+                # device/mountpoint and interface are NOT NULL keys of the disk and network tables
+                device = labels.get("device")
+                mountpoint = labels.get("mountpoint")
+                if not device or (name in FILESYSTEM_SERIES and not mountpoint):
+                    self.stats["series_without_device"] += 1
+                    continue
+                if name in FILESYSTEM_SERIES:
+                    series_key = ("disk", tenant_id, host, device, mountpoint)
+                    field = FILESYSTEM_SERIES[name]
+                else:
+                    series_key = ("network", tenant_id, host, device)
+                    field = NETWORK_SERIES[name]
+            hosts.add(host)
+            self.stats["series_mapped"] += 1
+
+            for value, ts in samples:
+                # NaN carries Prometheus staleness markers; nothing to store
+                if math.isnan(value):
+                    continue
+                self.stats["samples"] += 1
+
+                key = series_key + (ts,)
+                group = self._pending.get(key)
+                if group is None:
+                    group = self._pending[key] = (now, {})
+                group[1][field] = value
+                touched.add(key)
+
+        if now - self._last_sweep >= 1.0:
+            self._last_sweep = now
+            self._sweep(now)
+        return self._settle(tenant_id, touched), hosts
+
+    def _settle(self, tenant_id: str, keys) -> Dict[str, List[tuple]]:
+        """Rows for the complete samples among keys; incomplete ones stay pending"""
+        rows = {"cpu": [], "memory": [], "disk": [], "network": []}
+        cpu = {}
+        for key in sorted(keys, key=lambda k: k[-1]):
+            group = self._pending.get(key)
+            if group is None or key[1] != tenant_id:
+                continue
+            metric_type, fields = key[0], group[1]
+            if metric_type == "cpu":
+                host, ts = key[2], key[3]
+                series = frozenset(fields)
+                expected = self._cpu_series.get((tenant_id, host))
+                if series != expected:
+                    if not _same_modes_per_cpu(fields) or (expected is not None and not series > expected):
+                        continue
+                    # New baseline: rate the samples before it against the old one first
+                    rows["cpu"] += self._cpu.rows(tenant_id, cpu)
+                    cpu = {}
+                    self._cpu_series[(tenant_id, host)] = series
+                    self._cpu.reset(tenant_id, host)
+                cpu[(host, ts)] = _mode_totals(fields)
+            else:
+                if not all(field in fields for field in _REQUIRED_FIELDS[metric_type]):
+                    continue
+                rows[metric_type].append(_ROW_BUILDERS[metric_type](tenant_id, *key[2:], fields))
+            del self._pending[key]
+
+        rows["cpu"] += self._cpu.rows(tenant_id, cpu)
+        return rows
+
+    def _sweep(self, now: float):
+        """
+        Drop samples pending longer than PENDING_MAX_AGE_SEC
+        A CPU sample that aged while every CPU in it reported the same modes has fewer
+        series than its host's baseline (CPUs went offline); the baseline is dropped too,
+        so the host's next such sample becomes the new one.
+        """
+        aged = [key for key, (seen, _) in self._pending.items() if now - seen > PENDING_MAX_AGE_SEC]
+        for key in aged:
+            fields = self._pending.pop(key)[1]
+            self.stats["incomplete_dropped"] += 1
+            if key[0] == "cpu" and _same_modes_per_cpu(fields):
+                self._cpu_series.pop((key[1], key[2]), None)
+
+    def get_stats(self) -> dict:
+        return {
+            "tracked_cpu_hosts": len(self._cpu),
+            "cpu_resets": self._cpu.resets,
+            "pending_samples": len(self._pending),
+            **self.stats,
+        }
+
+
+def _same_modes_per_cpu(fields: Dict[Tuple[str, str], float]) -> bool:
+    """Whether every CPU in a sample has the same set of modes"""
+    modes = defaultdict(set)
+    for cpu, mode in fields:
+        modes[cpu].add(mode)
+    return len({frozenset(cpu_modes) for cpu_modes in modes.values()}) == 1
+
+
+def _mode_totals(fields: Dict[Tuple[str, str], float]) -> Dict[str, float]:
+    """Per-mode CPU seconds summed over CPUs"""
+    totals = defaultdict(float)
+    for (_, mode), seconds in fields.items():
+        totals[mode] += seconds
+    return dict(totals)
+
+
+# Global mapper instance (holds CPU counter state between writes)
+_mapper = NodeExporterMapper()
+
+
+def decode(body: bytes, tenant_id: str, max_bytes: int) -> Tuple[Dict[str, List[tuple]], set]:
+    """Decompress, decode and map a remote_write body into {metric_type: rows} and hosts"""
+    series, dropped = decode_write_request(decompress(body, max_bytes))
+    _mapper.stats["requests"] += 1
+    _mapper.stats["series_dropped"] += dropped
+    return _mapper.to_rows(tenant_id, series)
+
+
+def get_stats() -> dict:
+    """Remote write decode/mapping counters"""
+    return _mapper.get_stats()
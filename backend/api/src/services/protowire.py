@@ -0,0 +1,77 @@
+"""
+Minimal protobuf wire-format reader
+Shared by the remote_write and OTLP receivers, which walk only the message fields
+they need instead of materializing full generated message objects
+"""
+import struct
+from typing import Tuple
+
+VARINT, FIXED64, LENGTH, FIXED32 = 0, 1, 2, 5
+
+_DOUBLE = struct.Struct("<d")
+_INT64 = struct.Struct("<q")
+_UINT64 = struct.Struct("<Q")
+
+
+class WireFormatError(ValueError):
+    """Bytes are not valid protobuf wire format"""
+
+
+def read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    """Read an unsigned varint; returns (value, next position)"""
+    byte = buf[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result = byte & 0x7F
+    shift = 7
+    pos += 1
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def read_int64(buf: bytes, pos: int) -> Tuple[int, int]:
+    """Read a varint-encoded int64 (two's complement for negatives)"""
+    value, pos = read_varint(buf, pos)
+    if value >= 1 << 63:
+        value -= 1 << 64
+    return value, pos
+
+
+def read_double(buf: bytes, pos: int) -> float:
+    return _DOUBLE.unpack_from(buf, pos)[0]
+
+
+def read_sfixed64(buf: bytes, pos: int) -> int:
+    return _INT64.unpack_from(buf, pos)[0]
+
+
+def read_fixed64(buf: bytes, pos: int) -> int:
+    return _UINT64.unpack_from(buf, pos)[0]
+
+
+def read_bytes(buf: bytes, pos: int) -> Tuple[bytes, int]:
+    """Read a length-delimited field's payload; returns (payload, next position)"""
+    length, pos = read_varint(buf, pos)
+    end = pos + length
+    if end > len(buf):
+        raise WireFormatError("Truncated length-delimited field")
+    return buf[pos:end], end
+
+
+def skip_field(buf: bytes, pos: int, wire_type: int) -> int:
+    """Skip a field's payload; returns the position after it"""
+    if wire_type == VARINT:
+        return read_varint(buf, pos)[1]
+    if wire_type == FIXED64:
+        return pos + 8
+    if wire_type == LENGTH:
+        length, pos = read_varint(buf, pos)
+        return pos + length
+    if wire_type == FIXED32:
+        return pos + 4
+    raise WireFormatError(f"Unsupported protobuf wire type {wire_type}")
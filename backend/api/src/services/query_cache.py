@@ -0,0 +1,266 @@
+"""
+In-process metric query result cache
+Auto-refreshing dashboards and many users watching the same hosts repeat identical
+queries. Rows fetched for (tenant, metric, hosts, range bucket, resolution, fields) are
+kept in a byte-bounded LRU. Query ranges are aligned to QUERY_CACHE_BUCKET_SEC so
+sliding "last hour" windows share entries.
+
+A range that ended more than QUERY_CACHE_SETTLE_SEC ago is closed: its entry is not
+invalidated by ingest and lives for QUERY_CACHE_CLOSED_TTL_SEC, which bounds how long
+late writes (spool replay) into old ranges stay invisible. An open range (one that
+includes now) is checked against a per-(tenant, host) ingest watermark that ingest
+requests, buffer flushes and spool replay advance; a write for any of its hosts after
+the entry was loaded makes it stale. Open entries also expire after
+QUERY_CACHE_OPEN_TTL_SEC, which bounds staleness from writes this process does not see.
+Rows loaded while a host's last batch may still sit in the write-behind buffer are not
+cached at all.
+"""
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from ..config import settings
+from . import host_dictionary
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class _Entry(NamedTuple):
+    rows: List[dict]
+    size: int
+    hosts: Tuple[Tuple[str, str], ...]
+    # Watermark clock when the load started; None for closed (immutable) entries
+    clock: Optional[int]
+    expires: float
+
+
+class QueryCache:
+    """Byte-bounded LRU of query rows with ingest-watermark invalidation of open ranges"""
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        bucket_sec: int = 10,
+        settle_sec: float = 300,
+        open_ttl_sec: float = 60,
+        closed_ttl_sec: float = 900,
+        write_lag_sec: float = 0
+    ):
+        self.max_bytes = max_bytes
+        self.bucket_sec = bucket_sec
+        self.settle_sec = settle_sec
+        self.open_ttl_sec = open_ttl_sec
+        self.closed_ttl_sec = closed_ttl_sec
+        self.write_lag_sec = write_lag_sec
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # (tenant_id, host) -> (clock, monotonic time) of the last ingest
+        self._watermarks: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self._clock = 0
+        # Clock of the last write whose hosts were unknown; stales every open entry before it
+        self._all_clock = 0
+        self._last_prune = time.monotonic()
+        self.stats = {
+            "hits": 0, "misses": 0, "stale": 0, "expired": 0,
+            "evictions": 0, "not_cached": 0, "too_large": 0,
+        }
+
+    def align(self, start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+        """Widen a (naive UTC) range to whole cache buckets"""
+        bucket = self.bucket_sec
+        start_sec = int((start - EPOCH).total_seconds()) // bucket * bucket
+        end_sec = -(-int((end - EPOCH).total_seconds()) // bucket) * bucket
+        return EPOCH + timedelta(seconds=start_sec), EPOCH + timedelta(seconds=end_sec)
+
+    def advance(self, tenant_id: str, hosts: Iterable[str]):
+        """Record an ingest for hosts; open entries covering them become stale"""
+        self.advance_scoped((tenant_id, host) for host in hosts)
+
+    def advance_scoped(self, scoped: Iterable[Tuple[str, str]]):
+        """Record an ingest for (tenant_id, host) pairs"""
+        self._clock += 1
+        now = time.monotonic()
+        for key in scoped:
+            self._watermarks[key] = (self._clock, now)
+        if now - self._last_prune >= self.open_ttl_sec:
+            self._prune(now)
+
+    def advance_all(self):
+        """Record a write whose hosts are unknown; every open entry becomes stale"""
+        self._clock += 1
+        self._all_clock = self._clock
+
+    def _prune(self, now: float):
+        """
+        Forget watermarks too old to matter: an open entry loaded before a watermark
+        expires within open_ttl_sec of it. settle_sec is kept on top as a margin
+        """
+        self._last_prune = now
+        horizon = now - (self.open_ttl_sec + self.settle_sec)
+        self._watermarks = {key: mark for key, mark in self._watermarks.items() if mark[1] >= horizon}
+
+    async def fetch(
+        self,
+        key: Hashable,
+        tenant_id: str,
+        hosts: Iterable[str],
+        end: datetime,
+        load: Callable[[], Awaitable[List[dict]]]
+    ) -> List[dict]:
+        """Cached rows for key, calling load() on a miss; `end` is the aligned range end"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if self._valid(entry):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.rows
+            self._remove(key)
+
+        self.stats["misses"] += 1
+
+        # Collapse concurrent misses for the same query into one database round trip
+        inflight = self._inflight.get(key)
+        if inflight:
+            return await asyncio.shield(inflight)
+
+        scoped = tuple((tenant_id, host) for host in hosts)
+        clock = self._clock
+        closed = end <= datetime.utcnow() - timedelta(seconds=self.settle_sec)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            rows = await load()
+            if self._inflight.get(key) is future:
+                self._store(key, rows, scoped, None if closed else clock)
+            future.set_result(rows)
+            return rows
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited future doesn't log
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _valid(self, entry: _Entry) -> bool:
+        if entry.expires <= time.monotonic():
+            self.stats["expired"] += 1
+            return False
+        if entry.clock is None:
+            return True
+        if self._all_clock > entry.clock:
+            self.stats["stale"] += 1
+            return False
+        for scoped in entry.hosts:
+            watermark = self._watermarks.get(scoped)
+            if watermark is not None and watermark[0] > entry.clock:
+                self.stats["stale"] += 1
+                return False
+        return True
+
+    def _store(self, key: Hashable, rows: List[dict], hosts: Tuple[Tuple[str, str], ...], clock: Optional[int]):
+        if clock is not None:
+            # A recent batch may still be in the write-behind buffer, not yet in the rows
+            now = time.monotonic()
+            for scoped in hosts:
+                watermark = self._watermarks.get(scoped)
+                if watermark is not None and now - watermark[1] < self.write_lag_sec:
+                    self.stats["not_cached"] += 1
+                    return
+
+        size = _estimate_size(rows)
+        # One huge result must not flush the whole cache
+        if size > self.max_bytes // 8:
+            self.stats["too_large"] += 1
+            return
+
+        self._remove(key)
+        ttl = self.closed_ttl_sec if clock is None else self.open_ttl_sec
+        self._entries[key] = _Entry(rows, size, hosts, clock, time.monotonic() + ttl)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            "watermarks": len(self._watermarks),
+            **self.stats,
+        }
+
+
+def _estimate_size(rows: List[dict]) -> int:
+    """Approximate memory held by a result (rows of the same shape, sized from the first)"""
+    if not rows:
+        return sys.getsizeof(rows)
+    sample = rows[0]
+    per_row = sys.getsizeof(sample) + sum(sys.getsizeof(value) for value in sample.values())
+    return sys.getsizeof(rows) + per_row * len(rows)
+
+
+# Global cache instance
+_cache = QueryCache(
+    max_bytes=settings.query_cache_max_mb * 1024 * 1024,
+    bucket_sec=settings.query_cache_bucket_sec,
+    settle_sec=settings.query_cache_settle_sec,
+    open_ttl_sec=settings.query_cache_open_ttl_sec,
+    closed_ttl_sec=settings.query_cache_closed_ttl_sec,
+    write_lag_sec=settings.ingest_buffer_flush_interval_sec if settings.ingest_buffer_enabled else 0
+)
+
+
+def align(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    """Query range widened to cache buckets (unchanged when the cache is disabled)"""
+    if not settings.query_cache_enabled:
+        return start, end
+    return _cache.align(start, end)
+
+
+async def fetch(
+    key: Hashable,
+    tenant_id: str,
+    hosts: Iterable[str],
+    end: datetime,
+    load: Callable[[], Awaitable[List[dict]]]
+) -> List[dict]:
+    """Rows for a query, from the cache or load()"""
+    if not settings.query_cache_enabled:
+        return await load()
+    return await _cache.fetch(key, tenant_id, hosts, end, load)
+
+
+def advance(tenant_id: str, hosts: Iterable[str]):
+    """Advance the ingest watermark of hosts that just received metrics"""
+    if settings.query_cache_enabled:
+        _cache.advance(tenant_id, hosts)
+
+
+def advance_batches(batches: Dict[str, Tuple[Sequence[str], List[tuple]]]):
+    """Advance watermarks for COPY batches that just reached the database (buffer flush, spool replay)"""
+    if not settings.query_cache_enabled:
+        return
+    scoped = host_dictionary.batch_hosts(batches)
+    if scoped is None:
+        _cache.advance_all()
+    elif scoped:
+        _cache.advance_scoped(scoped)
+
+
+def get_cache_stats() -> dict:
+    """Cache size, hit/miss and invalidation counters"""
+    return {"enabled": settings.query_cache_enabled, **_cache.get_stats()}
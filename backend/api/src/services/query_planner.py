@@ -0,0 +1,426 @@
+"""
+Resolution planner for metric queries
+CPU, memory and network have continuous aggregates (5-minute, and 1-hour for CPU) next to
+the raw hypertables. A query is served from the finest tier whose point count over the
+requested range fits max_points; raw data only when it is retained for the whole range.
+
+An aggregate tier is stitched with:
+- the next coarser tier for the part of the range older than its retention, and
+- buckets computed from raw rows for the most recent buckets, which its refresh policy
+  has not materialized yet.
+Every part returns the chosen tier's columns (NULL where a coarser tier lacks one),
+so the stitched series has one shape. Buckets from before the host dictionary migration
+live in the renamed *_legacy aggregates until their retention empties them, and are
+appended to the aggregate parts up to the cutoff the migration recorded.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from ..config import settings
+from . import timescale
+from .downsample import SERIES_KEYS
+from .metrics_codec import SCHEMAS
+from .network_rates import RATE_COLUMNS
+
+EPOCH = datetime(1970, 1, 1)
+
+RESOLUTIONS = ("auto", "raw", "5min", "1h")
+
+# Buckets behind "now" that a refresh policy (end_offset = one bucket, scheduled every
+# bucket) may not have materialized yet, plus one for job start jitter
+_REFRESH_LAG_BUCKETS = 3
+
+
+class ResolutionUnavailable(ValueError):
+    """Raised when a fixed resolution is requested that the metric type has no tier for"""
+
+
+class UnknownField(ValueError):
+    """Raised when a projected field is not a value column of the planned tier"""
+
+
+class Tier(NamedTuple):
+    """One resolution of a metric type"""
+    name: str
+    view: str
+    bucket_sec: int
+    retention_days: int
+    # (output column, aggregate over the raw view) pairs available in this tier
+    aggregates: Tuple[Tuple[str, str], ...] = ()
+
+
+class Segment(NamedTuple):
+    """Part of the requested range served by one tier; `end` is exclusive unless `last`"""
+    tier: Tier
+    from_raw: bool
+    start: datetime
+    end: datetime
+    last: bool
+
+
+class QueryPlan(NamedTuple):
+    metric_type: str
+    # Chosen tier; its name is the resolution reported to the client
+    tier: Tier
+    # Aggregate columns of the chosen tier (empty for raw plans, which return raw rows)
+    columns: Tuple[str, ...]
+    # Extra grouping column of aggregate tiers (network: interface)
+    group_by: Optional[str]
+    # Aggregates keyed by (tenant_id, host) instead of host_id
+    string_keyed: bool
+    segments: List[Segment]
+
+    def series_columns(self) -> Tuple[str, ...]:
+        """Columns that tell a host's series apart (always returned, never projected away)"""
+        if self.tier.bucket_sec:
+            return (self.group_by,) if self.group_by else ()
+        return SERIES_KEYS.get(self.metric_type, ())
+
+    def fields(self) -> Tuple[str, ...]:
+        """Value columns that may be projected with `fields=`"""
+        if self.tier.bucket_sec:
+            return self.columns
+        columns = SCHEMAS[self.metric_type].columns
+        if self.metric_type == "network":
+            columns += RATE_COLUMNS
+        skip = ("timestamp", "tenant_id", "host") + self.series_columns()
+        return tuple(column for column in columns if column not in skip)
+
+    def project(self, fields: Optional[Sequence[str]]) -> Optional[Tuple[str, ...]]:
+        """Validated projection (None selects every column)"""
+        if not fields:
+            return None
+        available = self.fields()
+        unknown = [field for field in fields if field not in available]
+        if unknown:
+            raise UnknownField(
+                f"Unknown field(s) {', '.join(unknown)} at {self.tier.name} resolution. "
+                f"Available: {', '.join(available)}"
+            )
+        return tuple(dict.fromkeys(fields))
+
+    def describe(self) -> List[dict]:
+        """Tiers that served each part of the range, oldest first, for the response"""
+        return [
+            {
+                "tier": self.tier.name if segment.from_raw else segment.tier.name,
+                "source": segment.tier.view,
+                "start": segment.start,
+                "end": segment.end,
+            }
+            for segment in reversed(self.segments)
+        ]
+
+
+_CPU_5MIN = (
+    ("cpu_percent_avg", "AVG(cpu_percent)"),
+    ("cpu_percent_max", "MAX(cpu_percent)"),
+    ("cpu_user_avg", "AVG(cpu_user)"),
+    ("cpu_system_avg", "AVG(cpu_system)"),
+    ("cpu_idle_avg", "AVG(cpu_idle)"),
+    ("cpu_iowait_avg", "AVG(cpu_iowait)"),
+)
+_CPU_1H = (
+    ("cpu_percent_avg", "AVG(cpu_percent)"),
+    ("cpu_percent_max", "MAX(cpu_percent)"),
+    ("cpu_percent_min", "MIN(cpu_percent)"),
+)
+_MEMORY_5MIN = (
+    ("memory_percent_avg", "AVG(memory_percent)"),
+    ("memory_percent_max", "MAX(memory_percent)"),
+    ("swap_percent_avg", "AVG(swap_percent)"),
+)
+_NETWORK_5MIN = (
+    ("bytes_sent_rate_avg", "AVG(bytes_sent_rate)"),
+    ("bytes_sent_rate_max", "MAX(bytes_sent_rate)"),
+    ("bytes_recv_rate_avg", "AVG(bytes_recv_rate)"),
+    ("bytes_recv_rate_max", "MAX(bytes_recv_rate)"),
+    ("packets_sent_rate_avg", "AVG(packets_sent_rate)"),
+    ("packets_recv_rate_avg", "AVG(packets_recv_rate)"),
+    ("errors_in_rate_avg", "AVG(errors_in_rate)"),
+    ("errors_out_rate_avg", "AVG(errors_out_rate)"),
+    ("drops_in_rate_avg", "AVG(drops_in_rate)"),
+    ("drops_out_rate_avg", "AVG(drops_out_rate)"),
+)
+
+
+def _tiers() -> Dict[str, List[Tier]]:
+    """Tiers per metric type, finest first (retention as configured for the policies)"""
+    raw_days = settings.metrics_raw_retention_days
+    days_5min = settings.metrics_5min_retention_days
+    days_1h = settings.metrics_1h_retention_days
+    return {
+        "cpu": [
+            Tier("raw", "metrics_cpu", 0, raw_days),
+            Tier("5min", "metrics_cpu_5min", 300, days_5min, _CPU_5MIN),
+            Tier("1h", "metrics_cpu_1h", 3600, days_1h, _CPU_1H),
+        ],
+        "memory": [
+            Tier("raw", "metrics_memory", 0, raw_days),
+            Tier("5min", "metrics_memory_5min", 300, days_5min, _MEMORY_5MIN),
+        ],
+        "network": [
+            Tier("raw", "metrics_network", 0, raw_days),
+            Tier("5min", "metrics_network_5min", 300, days_5min, _NETWORK_5MIN),
+        ],
+    }
+
+
+TIERS = _tiers()
+
+# metric_type -> extra group-by column of its aggregates
+_GROUP_BY = {"network": "interface"}
+# Aggregates over string-keyed hypertables (not moved to host_id)
+_STRING_KEYED = {"memory"}
+
+
+# Aggregates renamed to <view>_legacy by migration 004, keyed by (tenant_id, host):
+# view -> {column: expression over the legacy aggregate}. The legacy network aggregate
+# only has per-bucket byte counter deltas
+_LEGACY_COLUMNS: Dict[str, Dict[str, str]] = {
+    "metrics_cpu_5min": {column: column for column, _ in _CPU_5MIN},
+    "metrics_cpu_1h": {column: column for column, _ in _CPU_1H},
+    "metrics_network_5min": {
+        "bytes_sent_rate_avg": "bytes_sent_delta / 300.0",
+        "bytes_recv_rate_avg": "bytes_recv_delta / 300.0",
+    },
+}
+
+# View -> cutoff, for views whose legacy aggregate exists in this database: buckets
+# before the cutoff are read from the legacy aggregate (see load_legacy_views)
+_legacy_views: Dict[str, datetime] = {}
+
+
+async def load_legacy_views():
+    """Find the legacy aggregates still present and their cutoffs, so queries include their history"""
+    rows = await timescale.fetch_all(
+        """
+        SELECT view, cutoff FROM legacy_cutoffs
+        WHERE view = ANY($1::text[]) AND to_regclass(view || '_legacy') IS NOT NULL
+        """,
+        list(_LEGACY_COLUMNS)
+    )
+    _legacy_views.clear()
+    _legacy_views.update((row["view"], row["cutoff"]) for row in rows)
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """Metric tables use naive UTC timestamps"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _floor(value: datetime, seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=int((value - EPOCH).total_seconds()) // seconds * seconds)
+
+
+def _ceil(value: datetime, seconds: int) -> datetime:
+    floored = _floor(value, seconds)
+    return floored if floored == value else floored + timedelta(seconds=seconds)
+
+
+def plan_query(
+    metric_type: str,
+    table: str,
+    start: datetime,
+    end: datetime,
+    max_points: int,
+    resolution: str = "auto",
+    now: Optional[datetime] = None
+) -> QueryPlan:
+    """
+    Choose the tier(s) serving a query for one host's series
+    Metric types without aggregates (and raw plans) are served from `table` as before
+    """
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    now = to_utc_naive(now) if now else datetime.utcnow()
+    tiers = TIERS.get(metric_type)
+
+    if not tiers:
+        if resolution not in ("auto", "raw"):
+            raise ResolutionUnavailable(f"Metric type '{metric_type}' only has raw resolution")
+        return _raw_plan(metric_type, Tier("raw", table, 0, settings.metrics_raw_retention_days), start, end)
+
+    if resolution == "auto":
+        chosen = _choose(tiers, start, end, max_points, now)
+    else:
+        chosen = next((tier for tier in tiers if tier.name == resolution), None)
+        if chosen is None:
+            available = ", ".join(tier.name for tier in tiers)
+            raise ResolutionUnavailable(f"Metric type '{metric_type}' has resolutions: {available}")
+
+    if chosen.bucket_sec == 0:
+        return _raw_plan(metric_type, chosen, start, end)
+
+    raw = tiers[0]
+    coarser = tiers[tiers.index(chosen):]
+    segments = []
+    upper = end
+    last = True
+
+    # Newest buckets are computed from raw rows until the aggregate is refreshed
+    edge = _floor(now, chosen.bucket_sec) - timedelta(seconds=_REFRESH_LAG_BUCKETS * chosen.bucket_sec)
+    if end >= edge:
+        lower = max(start, edge)
+        segments.append(Segment(raw._replace(bucket_sec=chosen.bucket_sec), True, lower, upper, last))
+        upper, last = lower, False
+
+    # Then each tier back to its retention horizon, handing older buckets to the next one
+    for index, tier in enumerate(coarser):
+        if upper <= start:
+            break
+        if index + 1 < len(coarser):
+            horizon = now - timedelta(days=tier.retention_days)
+            lower = max(start, _ceil(horizon, coarser[index + 1].bucket_sec))
+        else:
+            lower = start
+        if lower < upper:
+            segments.append(Segment(tier, False, lower, upper, last))
+            upper, last = lower, False
+
+    return QueryPlan(
+        metric_type=metric_type,
+        tier=chosen,
+        columns=tuple(column for column, _ in chosen.aggregates),
+        group_by=_GROUP_BY.get(metric_type),
+        string_keyed=metric_type in _STRING_KEYED,
+        segments=segments,
+    )
+
+
+def _raw_plan(metric_type: str, tier: Tier, start: datetime, end: datetime) -> QueryPlan:
+    return QueryPlan(
+        metric_type=metric_type,
+        tier=tier,
+        columns=(),
+        group_by=None,
+        string_keyed=True,
+        segments=[Segment(tier, True, start, end, True)],
+    )
+
+
+def _choose(tiers: List[Tier], start: datetime, end: datetime, max_points: int, now: datetime) -> Tier:
+    """Finest tier within max_points; raw only while it is retained for the whole range"""
+    range_sec = max((end - start).total_seconds(), 0)
+    raw = tiers[0]
+    raw_horizon = now - timedelta(days=raw.retention_days)
+    if range_sec / settings.agent_default_interval_sec <= max_points and start >= raw_horizon:
+        return raw
+    for tier in tiers[1:]:
+        if range_sec / tier.bucket_sec <= max_points:
+            return tier
+    return tiers[-1]
+
+
+def build_query(
+    plan: QueryPlan,
+    tenant_id: str,
+    hosts: Sequence[str],
+    limit: int,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[str, list]:
+    """
+    SQL (newest rows first) and arguments for a plan, over one or more hosts
+    `fields` projects the value columns (see project()); series columns are always included
+    """
+    args = [tenant_id, list(hosts)]
+    keys = plan.series_columns()
+
+    if not plan.tier.bucket_sec:
+        segment = plan.segments[0]
+        args += [segment.start, segment.end]
+        select = "*" if fields is None else ", ".join(("timestamp", "host") + keys + tuple(fields))
+        return f"""
+            SELECT {select}
+            FROM {segment.tier.view}
+            WHERE tenant_id = $1
+            AND host = ANY($2::text[])
+            AND timestamp BETWEEN $3 AND $4
+            ORDER BY timestamp DESC
+            LIMIT {int(limit)}
+        """, args
+
+    columns = plan.columns if fields is None else tuple(fields)
+    group_by = "".join(f", {key}" for key in keys)
+    parts = []
+    for segment in plan.segments:
+        args += [segment.start, segment.end]
+        lower, upper = f"${len(args) - 1}", f"${len(args)}"
+        end_op = "<=" if segment.last else "<"
+        if segment.from_raw:
+            aggregates = dict(plan.tier.aggregates)
+            select = ", ".join(f"{aggregates[column]} AS {column}" for column in columns)
+            parts.append(f"""
+                SELECT time_bucket('{segment.tier.bucket_sec} seconds', timestamp) AS timestamp,
+                       host{group_by}, {select}
+                FROM {segment.tier.view}
+                WHERE tenant_id = $1 AND host = ANY($2::text[])
+                AND timestamp >= {lower} AND timestamp {end_op} {upper}
+                GROUP BY 1, 2{group_by}
+            """)
+        else:
+            available = {column for column, _ in segment.tier.aggregates}
+            select = ", ".join(
+                column if column in available else f"NULL::double precision AS {column}"
+                for column in columns
+            )
+            if plan.string_keyed:
+                parts.append(f"""
+                    SELECT bucket AS timestamp, host{group_by}, {select}
+                    FROM {segment.tier.view}
+                    WHERE tenant_id = $1 AND host = ANY($2::text[])
+                    AND bucket >= {lower} AND bucket {end_op} {upper}
+                """)
+            else:
+                parts.append(f"""
+                    SELECT a.bucket AS timestamp, h.hostname AS host{group_by}, {select}
+                    FROM {segment.tier.view} a
+                    JOIN hosts h ON h.id = a.host_id
+                    WHERE h.tenant_id = $1 AND h.hostname = ANY($2::text[])
+                    AND a.bucket >= {lower} AND a.bucket {end_op} {upper}
+                """)
+            cutoff = _legacy_views.get(segment.tier.view)
+            if cutoff is not None:
+                # A bucket straddling the cutoff comes from the current aggregate
+                args.append(_floor(cutoff, segment.tier.bucket_sec))
+                parts.append(_legacy_part(
+                    segment.tier.view, columns, group_by, lower, upper, end_op, f"${len(args)}"
+                ))
+
+    query = " UNION ALL ".join(parts) + f" ORDER BY timestamp DESC LIMIT {int(limit)}"
+    return query, args
+
+
+def _legacy_part(
+    view: str, columns: Sequence[str], group_by: str, lower: str, upper: str, end_op: str, cutoff: str
+) -> str:
+    """Pre-migration buckets of an aggregate, before its recorded cutoff"""
+    legacy = _LEGACY_COLUMNS[view]
+    select = ", ".join(
+        f"({legacy[column]})::double precision AS {column}" if column in legacy
+        else f"NULL::double precision AS {column}"
+        for column in columns
+    )
+    return f"""
+        SELECT bucket AS timestamp, host{group_by}, {select}
+        FROM {view}_legacy
+        WHERE tenant_id = $1 AND host = ANY($2::text[])
+        AND bucket >= {lower} AND bucket {end_op} {upper}
+        AND bucket < {cutoff}
+    """
+
+
+def to_columnar(rows: List[dict]) -> Dict[str, Dict[str, list]]:
+    """
+    {host: {column: [values...]}} in ascending timestamp order, for charts and fleet views
+    Every column but tenant_id and host becomes an array, so series columns
+    (e.g. interface) stay aligned with their values
+    """
+    series: Dict[str, Dict[str, list]] = {}
+    for row in reversed(rows):
+        arrays = series.get(row["host"])
+        if arrays is None:
+            arrays = series[row["host"]] = {column: [] for column in row if column not in ("tenant_id", "host")}
+        for column, values in arrays.items():
+            values.append(row[column])
+    return series
@@ -0,0 +1,78 @@
+"""
+Series dictionary for custom metrics
+metrics_custom rows are keyed by a compact integer series_id; the series table maps
+(tenant_id, metric_name, host, labels) to that id. Known series are resolved from an
+in-process LRU cache, so ingest only touches the dictionary for series it has not seen.
+"""
+import json
+from typing import Dict, List, Sequence, Tuple
+from ..config import settings
+from .dictionary_cache import DictionaryCache
+
+# (tenant_id, metric_name, host, sorted label items)
+SeriesKey = Tuple[str, str, str, Tuple[Tuple[str, str], ...]]
+
+TABLE = "metrics_custom"
+COLUMNS = ("timestamp", "series_id", "value")
+
+# metric_name and host are VARCHAR(255); label sets are bounded so a single data point
+# cannot create an oversized labels document
+MAX_NAME_LENGTH = 255
+MAX_LABELS = 32
+MAX_LABEL_KEY_LENGTH = 255
+MAX_LABEL_VALUE_LENGTH = 1024
+
+
+def series_key(tenant_id: str, metric_name: str, host: str, labels: Dict[str, str]) -> SeriesKey:
+    """Hashable, order-independent series identity"""
+    return (tenant_id, metric_name, host or "", tuple(sorted(labels.items())) if labels else ())
+
+
+def within_limits(metric_name: str, host: str, labels: Dict[str, str]) -> bool:
+    """Whether a series fits the dictionary's column and label limits"""
+    return (
+        0 < len(metric_name) <= MAX_NAME_LENGTH
+        and len(host) <= MAX_NAME_LENGTH
+        and len(labels) <= MAX_LABELS
+        and all(
+            len(key) <= MAX_LABEL_KEY_LENGTH and len(value) <= MAX_LABEL_VALUE_LENGTH
+            for key, value in labels.items()
+        )
+    )
+
+
+def _encode(key: SeriesKey) -> tuple:
+    return (key[0], key[1], key[2], json.dumps(dict(key[3])))
+
+
+# Global cache instance
+_cache = DictionaryCache(
+    "series",
+    (("tenant_id", "text"), ("metric_name", "text"), ("host", "text"), ("labels", "jsonb")),
+    max_entries=settings.series_cache_max_entries,
+    encode=_encode
+)
+
+
+async def resolve_rows(rows: List[tuple]) -> List[tuple]:
+    """Turn (timestamp, series key, value) rows into metrics_custom rows (timestamp, series_id, value)"""
+    ids = await _cache.resolve(row[1] for row in rows)
+    return [(ts, ids[key], value) for ts, key, value in rows]
+
+
+async def resolve_batches(
+    batches: Dict[str, Tuple[Sequence[str], List[tuple]]]
+) -> Dict[str, Tuple[Sequence[str], List[tuple]]]:
+    """
+    Resolve the custom metric rows of {table: (columns, rows)} COPY batches to series ids
+    Batches whose rows already carry series ids (or have no custom rows) pass through
+    """
+    custom = batches.get(TABLE)
+    if not custom or not custom[1] or not isinstance(custom[1][0][1], tuple):
+        return batches
+    return {**batches, TABLE: (custom[0], await resolve_rows(custom[1]))}
+
+
+def get_cache_stats() -> dict:
+    """Series cache size and hit/miss counters"""
+    return _cache.get_stats()
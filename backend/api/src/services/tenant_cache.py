@@ -0,0 +1,94 @@
+"""
+In-process tenant state cache
+Serves tenant license/enabled state to hot paths (ingest, login, license binding)
+without a tenants query per request. Entries expire after a TTL and are invalidated
+explicitly whenever this process updates a tenant.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+from ..config import settings
+from . import timescale
+
+logger = logging.getLogger(__name__)
+
+TENANT_STATE_QUERY = """
+    SELECT id, enabled, license_expires_at, grace_period_until,
+           license_agent_limit, licensed_agents
+    FROM tenants WHERE id = $1
+"""
+
+
+class TenantCache:
+    """TTL cache of tenant rows keyed by tenant id"""
+
+    def __init__(self, ttl_sec: float = 300):
+        self.ttl_sec = ttl_sec
+        self._entries: Dict[str, Tuple[float, dict]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    async def get(self, tenant_id: str) -> Optional[dict]:
+        """Get tenant state, loading it from the database on a miss (unknown tenants are not cached)"""
+        entry = self._entries.get(tenant_id)
+        if entry and entry[0] > time.monotonic():
+            self.stats["hits"] += 1
+            return entry[1]
+
+        self.stats["misses"] += 1
+
+        # Collapse concurrent misses for the same tenant into one query
+        inflight = self._inflight.get(tenant_id)
+        if inflight:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[tenant_id] = future
+        try:
+            tenant = await timescale.fetch_one(TENANT_STATE_QUERY, tenant_id)
+            if tenant and self._inflight.get(tenant_id) is future:
+                self._entries[tenant_id] = (time.monotonic() + self.ttl_sec, tenant)
+            future.set_result(tenant)
+            return tenant
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited future doesn't log
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(tenant_id) is future:
+                del self._inflight[tenant_id]
+
+    def invalidate(self, tenant_id: Optional[str] = None):
+        """Drop one tenant (or every tenant when tenant_id is None) from the cache"""
+        self.stats["invalidations"] += 1
+        if tenant_id is None:
+            self._entries.clear()
+            self._inflight.clear()
+            return
+        self._entries.pop(tenant_id, None)
+        # A load that started before the update must not repopulate the cache
+        self._inflight.pop(tenant_id, None)
+
+    def get_stats(self) -> dict:
+        return {"entries": len(self._entries), "ttl_sec": self.ttl_sec, **self.stats}
+
+
+# Global cache instance
+_cache = TenantCache(ttl_sec=settings.tenant_cache_ttl_sec)
+
+
+async def get_tenant_state(tenant_id: str) -> Optional[dict]:
+    """Get cached tenant state"""
+    return await _cache.get(tenant_id)
+
+
+def invalidate(tenant_id: Optional[str] = None):
+    """Invalidate cached tenant state after a tenant update"""
+    _cache.invalidate(tenant_id)
+
+
+def get_cache_stats() -> dict:
+    """Cache size and hit/miss counters"""
+    return _cache.get_stats()
@@ -1,8 +1,12 @@
 """
 TimescaleDB connection pool and utilities
 """
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
 import asyncpg
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Sequence, Tuple
 from ..config import settings
 import logging
 
@@ -11,21 +15,59 @@ logger = logging.getLogger(__name__)
 # Global connection pool
 _pool: Optional[asyncpg.Pool] = None
 
+# Connections bulk ingest writes may hold at once; the rest of the pool stays
+# reserved for interactive endpoints (login, dashboards, health)
+_ingest_slots: Optional[asyncio.Semaphore] = None
+_ingest_waiters = 0
+
+# Errors caused by the rows themselves (bad values, NOT NULL or other constraints);
+# retrying the same rows cannot succeed, unlike connection or server errors
+ROW_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+class PartialCopyError(Exception):
+    """
+    Raised when copy_isolating hits a non-row error after part of the batch was written
+    `remaining` holds the unwritten rows, `rejected` the rows already found to be bad
+    """
+
+    def __init__(self, cause: Exception, written: int, remaining: dict, rejected: dict):
+        super().__init__(str(cause))
+        self.written = written
+        self.remaining = remaining
+        self.rejected = rejected
+
+
+# Smoothed pool acquire wait (milliseconds), a load signal for ingest admission control.
+# It decays with time since the last acquire, so it recovers once shed load stops acquiring
+_acquire_wait_ms = 0.0
+_acquire_wait_at = 0.0
+_ACQUIRE_WAIT_ALPHA = 0.2
+_ACQUIRE_WAIT_HALF_LIFE_SEC = 1.0
+
+# Start times of acquires (and ingest slot waits) still waiting, by ticket
+_waiting: Dict[int, float] = {}
+_tickets = itertools.count()
+
 
 async def init_db():
     """Initialize database connection pool"""
-    global _pool
+    global _pool, _ingest_slots
 
     # Parse database URL to extract password from secret if needed
     db_url = settings.database_url
 
     _pool = await asyncpg.create_pool(
         db_url,
-        min_size=5,
-        max_size=20,
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_max_size,
         command_timeout=60
     )
 
+    _ingest_slots = asyncio.Semaphore(
+        max(1, settings.db_pool_max_size - settings.db_pool_interactive_reserved)
+    )
+
     logger.info("TimescaleDB connection pool initialized")
 
 
@@ -49,28 +91,172 @@ async def release_connection(conn):
     await _pool.release(conn)
 
 
+@asynccontextmanager
+async def _acquire():
+    """Acquire a pooled connection, tracking how long the acquire waited"""
+    global _acquire_wait_ms, _acquire_wait_at
+    ticket = next(_tickets)
+    started = _waiting[ticket] = time.monotonic()
+    try:
+        conn = await _pool.acquire()
+    finally:
+        del _waiting[ticket]
+    try:
+        now = time.monotonic()
+        _acquire_wait_ms = _decayed_wait_ms(now)
+        _acquire_wait_ms += _ACQUIRE_WAIT_ALPHA * ((now - started) * 1000 - _acquire_wait_ms)
+        _acquire_wait_at = now
+        yield conn
+    finally:
+        await _pool.release(conn)
+
+
+@asynccontextmanager
+async def _ingest_connection():
+    """Acquire a connection for bulk ingest, bounded to the ingest share of the pool"""
+    global _ingest_waiters
+    _ingest_waiters += 1
+    ticket = next(_tickets)
+    _waiting[ticket] = time.monotonic()
+    try:
+        await _ingest_slots.acquire()
+    finally:
+        _ingest_waiters -= 1
+        del _waiting[ticket]
+    try:
+        async with _acquire() as conn:
+            yield conn
+    finally:
+        _ingest_slots.release()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Pool utilisation and acquire latency"""
+    if not _pool:
+        return {"initialized": False}
+    return {
+        "initialized": True,
+        "size": _pool.get_size(),
+        "idle": _pool.get_idle_size(),
+        "max_size": _pool.get_max_size(),
+        "acquire_wait_ms": round(get_acquire_wait_ms(), 2),
+        "ingest_waiters": _ingest_waiters,
+    }
+
+
+def _decayed_wait_ms(now: float) -> float:
+    return _acquire_wait_ms * 0.5 ** ((now - _acquire_wait_at) / _ACQUIRE_WAIT_HALF_LIFE_SEC)
+
+
+def get_acquire_wait_ms() -> float:
+    """
+    Pool acquire wait in milliseconds: the smoothed wait of past acquires, decayed by
+    the time since the last one, or the age of the oldest acquire still waiting if longer
+    """
+    now = time.monotonic()
+    wait_ms = _decayed_wait_ms(now)
+    if _waiting:
+        wait_ms = max(wait_ms, (now - min(_waiting.values())) * 1000)
+    return wait_ms
+
+
 async def execute_query(query: str, *args) -> str:
     """Execute a query without returning results"""
-    async with _pool.acquire() as conn:
+    async with _acquire() as conn:
         result = await conn.execute(query, *args)
         return result
 
 
 async def fetch_one(query: str, *args) -> Optional[Dict[str, Any]]:
     """Fetch a single row"""
-    async with _pool.acquire() as conn:
+    async with _acquire() as conn:
         row = await conn.fetchrow(query, *args)
         return dict(row) if row else None
 
 
 async def fetch_all(query: str, *args) -> List[Dict[str, Any]]:
     """Fetch all rows"""
-    async with _pool.acquire() as conn:
+    async with _acquire() as conn:
         rows = await conn.fetch(query, *args)
         return [dict(row) for row in rows]
 
 
+async def stream_rows(query: str, *args, prefetch: int = 1000) -> AsyncIterator[asyncpg.Record]:
+    """
+    Iterate over rows through a server-side cursor, `prefetch` rows per round trip
+    Memory stays constant however many rows match; the connection is held until the
+    iteration finishes (or the consumer stops iterating)
+    """
+    async with _acquire() as conn:
+        async with conn.transaction(readonly=True):
+            async for row in conn.cursor(query, *args, prefetch=prefetch):
+                yield row
+
+
 async def fetch_val(query: str, *args) -> Any:
     """Fetch a single value"""
-    async with _pool.acquire() as conn:
+    async with _acquire() as conn:
         return await conn.fetchval(query, *args)
+
+
+async def copy_records(table: str, columns: Sequence[str], records: List[tuple]) -> int:
+    """Bulk-load rows into a table using binary COPY"""
+    async with _ingest_connection() as conn:
+        await conn.copy_records_to_table(table, records=records, columns=list(columns))
+    return len(records)
+
+
+async def copy_many(batches: Dict[str, Tuple[Sequence[str], List[tuple]]]) -> int:
+    """
+    Bulk-load rows into several tables using binary COPY
+    All tables are written in a single transaction, so a batch lands entirely or not at all
+    """
+    total = 0
+    async with _ingest_connection() as conn:
+        async with conn.transaction():
+            for table, (columns, records) in batches.items():
+                if not records:
+                    continue
+                await conn.copy_records_to_table(table, records=records, columns=list(columns))
+                total += len(records)
+    return total
+
+
+async def copy_isolating(
+    batches: Dict[str, Tuple[Sequence[str], List[tuple]]]
+) -> Tuple[int, Dict[str, Tuple[Sequence[str], List[tuple]]]]:
+    """
+    copy_many that isolates rows the database rejects
+    When the batch fails with a row error, each table is copied on its own and failing
+    parts are bisected down to the offending rows, so one bad row does not fail the rest.
+    Returns (rows written, rejected {table: (columns, rows)}). Other errors propagate
+    unchanged when nothing was written yet, otherwise as PartialCopyError
+    """
+    try:
+        return await copy_many(batches), {}
+    except ROW_ERRORS as e:
+        logger.warning(f"Bulk copy rejected ({e}); isolating bad rows")
+
+    pending = [(table, columns, records) for table, (columns, records) in batches.items() if records]
+    written = 0
+    rejected: Dict[str, Tuple[Sequence[str], List[tuple]]] = {}
+    while pending:
+        table, columns, records = pending.pop()
+        try:
+            written += await copy_records(table, columns, records)
+        except ROW_ERRORS:
+            if len(records) == 1:
+                rejected.setdefault(table, (columns, []))[1].extend(records)
+                continue
+            middle = len(records) // 2
+            pending.append((table, columns, records[middle:]))
+            pending.append((table, columns, records[:middle]))
+        except Exception as e:
+            if not written and not rejected:
+                raise
+            pending.append((table, columns, records))
+            remaining: Dict[str, Tuple[Sequence[str], List[tuple]]] = {}
+            for table, columns, records in pending:
+                remaining.setdefault(table, (columns, []))[1].extend(records)
+            raise PartialCopyError(e, written, remaining, rejected) from e
+    return written, rejected